@@ -0,0 +1,6 @@
+-- Parsed form of each meal plan ({"text", "parsed_days", "structured"?}), written by save_meal_plan
+-- so readers never re-parse plan_details.
+-- Run once: mysql -u your_username -p your_database < add_meal_plan_data_column.sql
+-- Then fill existing rows: python -c "from data_manager import data_manager; print(data_manager.backfill_meal_plan_data())"
+
+ALTER TABLE meal_plans ADD COLUMN plan_data JSON NULL AFTER plan_details;
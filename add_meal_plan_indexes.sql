@@ -0,0 +1,21 @@
+-- Indexes backing DataManager.list_meal_plans (keyset pagination, filters and count)
+-- Run once: mysql -u your_username -p your_database < add_meal_plan_indexes.sql
+
+-- Keyset pagination: ORDER BY generated_at DESC, plan_id DESC
+CREATE INDEX idx_meal_plans_generated_at_plan_id ON meal_plans (generated_at, plan_id);
+
+-- Per-child plan history (get_meal_plans_by_patient)
+CREATE INDEX idx_meal_plans_patient_generated_at ON meal_plans (patient_id, generated_at);
+
+-- Has-notes filter and per-plan notes aggregation
+CREATE INDEX idx_assessments_plan_id ON assessments (plan_id);
+
+-- Barangay filter and parent lookups
+CREATE INDEX idx_patients_barangay_id ON patients (barangay_id);
+CREATE INDEX idx_patients_parent_id ON patients (parent_id);
+
+-- Name prefix search on children and parents
+CREATE INDEX idx_patients_first_name ON patients (first_name);
+CREATE INDEX idx_patients_last_name ON patients (last_name);
+CREATE INDEX idx_users_first_name ON users (first_name);
+CREATE INDEX idx_users_last_name ON users (last_name);
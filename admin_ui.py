@@ -3,6 +3,7 @@ import pandas as pd
 from datetime import datetime, timedelta
 import data_manager
 import mysql.connector
+import math
 
 st.set_page_config(
     page_title="🛠️ Admin Dashboard",
@@ -20,10 +21,7 @@ st.markdown("""
 
 def load_logs():
     admin_id = st.session_state.get('admin_id', '1')
-    conn = data_manager.data_manager.conn
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT log_id, log_timestamp, action, description FROM audit_logs WHERE user_id = %s ORDER BY log_timestamp DESC", (admin_id,))
-    rows = cursor.fetchall()
+    rows = data_manager.data_manager.get_audit_logs(admin_id)
 
     import json
     for row in rows:
@@ -37,10 +35,7 @@ def load_logs():
 def load_admin_options():
     """Load admin options from database"""
     try:
-        conn = data_manager.data_manager.conn
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT user_id, CONCAT(first_name, ' ', last_name) as full_name FROM users WHERE role_id = (SELECT role_id FROM roles WHERE role_name = 'admin') ORDER BY user_id")
-        admin_rows = cursor.fetchall()
+        admin_rows = data_manager.data_manager.get_admin_users()
         return {str(row['user_id']): row['full_name'] for row in admin_rows}
     except Exception as e:
         st.error(f"Failed to load admin data: {e}")
@@ -50,16 +45,7 @@ def load_admin_options():
 def load_all_user_options():
     """Load all user options (nutritionists and admins) from database"""
     try:
-        conn = data_manager.data_manager.conn
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT u.user_id, CONCAT(u.first_name, ' ', u.last_name) as full_name, r.role_name 
-            FROM users u 
-            JOIN roles r ON u.role_id = r.role_id 
-            WHERE r.role_name IN ('nutritionist', 'admin')
-            ORDER BY u.user_id
-        """)
-        user_rows = cursor.fetchall()
+        user_rows = data_manager.data_manager.get_staff_users()
         return {str(row['user_id']): {
             'full_name': row['full_name'], 
             'role': row['role_name']
@@ -77,6 +63,39 @@ def get_user_display_name(user_id, all_users_dict):
         return name
     return f"User {user_id}"
 
+MEAL_PLANS_PAGE_SIZE = 25
+
+def load_meal_plan_page(key_prefix, search_val, barangay_ids, has_notes, sort_recent):
+    """Fetch the current page of meal plans, restarting from page 1 whenever the filters change."""
+    filters = (search_val, tuple(barangay_ids or ()), has_notes, sort_recent)
+    cursors_key = f"{key_prefix}_page_cursors"
+    filters_key = f"{key_prefix}_page_filters"
+    if st.session_state.get(filters_key) != filters or cursors_key not in st.session_state:
+        st.session_state[filters_key] = filters
+        st.session_state[cursors_key] = [None]
+    cursors = st.session_state[cursors_key]
+    page = data_manager.data_manager.list_meal_plans(
+        search=search_val,
+        barangay_ids=barangay_ids,
+        has_notes=has_notes,
+        sort_recent=sort_recent,
+        page_size=MEAL_PLANS_PAGE_SIZE,
+        after=cursors[-1]
+    )
+    page["page_number"] = len(cursors)
+    return page
+
+def render_meal_plan_page_controls(key_prefix, page):
+    """Previous/Next buttons over the keyset cursors kept in session state."""
+    cursors = st.session_state[f"{key_prefix}_page_cursors"]
+    total_pages = max(1, math.ceil(page["total"] / MEAL_PLANS_PAGE_SIZE))
+    pag_row = st.columns([0.18,0.82])
+    with pag_row[0]:
+        btn_cols = st.columns([1,1])
+        btn_cols[0].button('Previous', key=f'{key_prefix}_prev_page', on_click=lambda: cursors.pop(), disabled=(len(cursors)==1))
+        btn_cols[1].button('Next', key=f'{key_prefix}_next_page', on_click=lambda: cursors.append(page["next_cursor"]), disabled=(page["next_cursor"] is None))
+    st.caption(f"Page {page['page_number']} of {total_pages} | {page['total']} meal plans | {MEAL_PLANS_PAGE_SIZE} records per page")
+
 with st.sidebar:
     st.header("🛠️ Admin Login")
     
@@ -150,13 +169,8 @@ def log_action(action, details):
         filtered_details = details
     # Save to audit_logs table with user_id
     import json
-    conn = data_manager.data_manager.conn
-    cursor = conn.cursor()
-    sql = "INSERT INTO audit_logs (log_timestamp, action, description, user_id) VALUES (%s, %s, %s, %s)"
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     admin_id = st.session_state.get('admin_id', '1')  # Default to admin 1 if not set
-    cursor.execute(sql, (now, action, json.dumps(filtered_details), admin_id))
-    conn.commit()
+    data_manager.data_manager.save_audit_log(action, json.dumps(filtered_details), admin_id)
 
 import json
 
@@ -187,29 +201,16 @@ with main_tab:
         )
         if search_val != prev_search:
             st.session_state['food_db_search'] = search_val
+            st.session_state['food_db_page'] = 1
             st.rerun()
-        def filter_foods(data, query):
-            if not query:
-                return data
-            query = query.lower()
-            filtered = []
-            for item in data:
-                for col in ["food_id", "food_name_and_description", "alternate_common_names", "energy_kcal", "nutrition_tags"]:
-                    val = item.get(col, '')
-                    if isinstance(val, list):
-                        val = ', '.join(val)
-                    if query in str(val).lower():
-                        filtered.append(item)
-                        break
-            return filtered
-
-        filtered_food_data = filter_foods(food_data, search_val)
 
         # Pagination setup
         records_per_page = 10
-        total_records = len(filtered_food_data)
-        total_pages = (total_records - 1) // records_per_page + 1
-        page = st.session_state.get('food_db_page', 1)
+        results = data_manager.data_manager.search_foods_page(search_val, st.session_state.get('food_db_page', 1), records_per_page)
+        filtered_food_data = results['foods']
+        total_records = results['total']
+        total_pages = results['pages']
+        page = results['page']
         def set_page(new_page):
             st.session_state['food_db_page'] = new_page
         # Pagination controls
@@ -220,7 +221,7 @@ with main_tab:
             btn_cols[1].button('Next', key='next_page', on_click=lambda: set_page(page+1), disabled=(page==total_pages))
 
         start_idx = (page-1)*records_per_page
-        end_idx = min(start_idx+records_per_page, total_records)
+        end_idx = start_idx+len(filtered_food_data)
 
         st.caption(f"Showing {start_idx+1} to {end_idx} of {total_records} rows | {records_per_page} records per page")
 
@@ -248,7 +249,7 @@ with main_tab:
             header_cols[i].markdown(f"**{label}**")
 
         table_rows = []
-        for idx, item in enumerate(filtered_food_data[start_idx:end_idx], start=start_idx+1):
+        for idx, item in enumerate(filtered_food_data, start=start_idx+1):
             row = {
                 "No.": idx,
                 "food_id": item.get("food_id", ""),
@@ -269,7 +270,7 @@ with main_tab:
             btn_cols = cols[len(columns)-1].columns([1])
             edit_btn = btn_cols[0].button("Edit", key=f"edit_{row['No.']}" )
             if edit_btn:
-                st.session_state['edit_food_id'] = filtered_food_data[start_idx + row_idx]['food_id']
+                st.session_state['edit_food_id'] = filtered_food_data[row_idx]['food_id']
                 st.session_state['show_edit_form'] = True
                 st.rerun()
 
@@ -333,16 +334,24 @@ with kb_tab:
                     "kb_id": kb.get('kb_id', ''),
                     "ai_summary": kb.get('ai_summary', ''),
                     "pdf_name": kb.get('pdf_name', ''),
-                    "pdf_text": kb.get('pdf_text', ''),
+                    "pdf_text_length": kb.get('pdf_text_length') or 0,
                     "added_at": kb.get('added_at', '')
                 })
-        columns = ["kb_id", "ai_summary", "pdf_name", "pdf_text", "added_at"]
+        columns = ["kb_id", "ai_summary", "pdf_name", "pdf_text_length", "added_at"]
         if table_rows:
             df = pd.DataFrame(table_rows, columns=columns)
             st.dataframe(df, use_container_width=True, hide_index=True)
         else:
             empty_df = pd.DataFrame([], columns=columns)
             st.dataframe(empty_df, use_container_width=True, hide_index=True)
+
+        # Full PDF text is only loaded for the entry being viewed
+        if table_rows:
+            kb_labels = {f"{row['kb_id']} - {row['pdf_name']}": row['kb_id'] for row in table_rows}
+            selected_kb = st.selectbox("View extracted PDF text", ["None"] + list(kb_labels.keys()), key="kb_view_pdf_text")
+            if selected_kb != "None":
+                kb_text = data_manager.data_manager.get_knowledge_base_text(kb_labels[selected_kb])
+                st.text_area("pdf_text", value=(kb_text or {}).get('pdf_text') or '', height=300, disabled=True)
     with col2:
         st.subheader("Upload Knowledge Base PDF")
         uploaded_file = st.file_uploader("Choose PDF file", type="pdf", key="admin_pdf_upload")
@@ -352,14 +361,14 @@ with kb_tab:
                 try:
                     import pdfplumber
                     from io import BytesIO
-                    import nutrition_ai
+                    from llm_registry import llm_registry
                     
                     # Extract PDF text
                     with pdfplumber.open(BytesIO(uploaded_file.read())) as pdf:
                         all_text = "\n".join(page.extract_text() or "" for page in pdf.pages)
                     
                     # Process with AI for nutrition insights
-                    nutrition_ai_instance = nutrition_ai.ChildNutritionAI()
+                    nutrition_ai_instance = llm_registry.nutrition_ai()
                     with st.spinner("Generating AI insights for nutrition knowledge..."):
                         ai_summary = nutrition_ai_instance.summarize_pdf_for_nutrition_knowledge(all_text, uploaded_file.name)
                     
@@ -380,7 +389,6 @@ with kb_tab:
 
 with meal_plans_tab:
     st.header("📝 Meal Plans Overview")
-    parents_data = data_manager.data_manager.get_parents_data()
     
     # Load all users for proper name display
     all_users = load_all_user_options()
@@ -392,6 +400,7 @@ with meal_plans_tab:
     
     # Get barangays from database
     barangay_list = ["All"]
+    barangays = {}
     try:
         barangays = data_manager.data_manager.get_all_barangays()
         barangay_list.extend(sorted(barangays.values()))
@@ -406,41 +415,46 @@ with meal_plans_tab:
         sort_recent = st.checkbox("Sort by Most Recent", value=True, key="meal_plans_sort_recent")
 
     # --- MEAL PLANS ---
-    all_plans = data_manager.data_manager.get_meal_plans()
+    # One page of plans, joined with child, parent, barangay and aggregated notes
+    barangay_ids = [bid for bid, name in barangays.items() if name == barangay_selected] if barangay_selected and barangay_selected != "All" else None
+    has_notes = {"Has Notes": True, "No Notes": False}.get(notes_filter)
+    page = load_meal_plan_page("meal_plans", search_val, barangay_ids, has_notes, sort_recent)
+    overview_rows = page["rows"]
+
+    def format_created_at(val):
+        if isinstance(val, str):
+            return val
+        if isinstance(val, datetime):
+            return val.strftime('%b %d, %Y %I:%M %p')
+        return str(val)
+
+    def clean_note(note_val):
+        if isinstance(note_val, str):
+            try:
+                parsed = json.loads(note_val)
+                if isinstance(parsed, dict) and 'text' in parsed:
+                    return parsed['text']
+            except Exception:
+                pass
+            note_val = note_val.replace('\r\n', '  \n').replace('\n', '  \n').replace('/n', '  \n')
+        return note_val
+
     table_rows = []
-    for plan in all_plans.values():
-        child_data = data_manager.data_manager.get_patient_by_id(plan['patient_id'])
+    for plan in overview_rows:
+        child_data = plan if plan.get('child_id') is not None else None
         child_name = data_manager.data_manager.format_full_name(
-            child_data.get('first_name', ''),
-            child_data.get('middle_name', ''),
-            child_data.get('last_name', '')
+            plan.get('child_first_name', ''),
+            plan.get('child_middle_name', ''),
+            plan.get('child_last_name', '')
         ) if child_data else "Unknown"
-        age_months = child_data['age_months'] if child_data and 'age_months' in child_data else None
+        age_months = child_data.get('age_months') if child_data else None
         child_age = f"{age_months//12}y {age_months%12}m" if age_months is not None else "-"
         parent_id = child_data.get('parent_id') if child_data else None
-        notes = data_manager.data_manager.get_notes_for_meal_plan(plan.get('plan_id', ''))
-        
-        def format_created_at(val):
-            if isinstance(val, str):
-                return val
-            if isinstance(val, datetime):
-                return val.strftime('%b %d, %Y %I:%M %p')
-            return str(val)
-            
-        def clean_note(note_val):
-            if isinstance(note_val, str):
-                try:
-                    parsed = json.loads(note_val)
-                    if isinstance(parsed, dict) and 'text' in parsed:
-                        return parsed['text']
-                except Exception:
-                    pass
-                note_val = note_val.replace('\r\n', '  \n').replace('\n', '  \n').replace('/n', '  \n')
-            return note_val
-        
+        notes = plan.get('notes') or []
+
         if notes:
             notes_str = "\n".join([
-                f"Noted by {get_user_display_name(note.get('nutritionist_id'), all_users)}: {note.get('note', '')}" 
+                f"Noted by {get_user_display_name(note.get('nutritionist_id'), all_users)}: {note.get('notes', '')}" 
                 for note in notes
             ])
         else:
@@ -448,15 +462,14 @@ with meal_plans_tab:
             
         parent_full_name = "Unknown"
         barangay_val = "-"
-        if parent_id is not None:
-            parent_info = parents_data.get(str(parent_id))
-            if parent_info:
-                parent_full_name = f"{parent_info.get('first_name', '')} {parent_info.get('last_name', '')}".strip()
-                barangay_id = child_data.get('barangay_id') if child_data else None
-                if barangay_id:
-                    barangay_val = data_manager.data_manager.get_barangay_name(barangay_id)
+        if parent_id is not None and plan.get('parent_first_name') is not None:
+            parent_full_name = f"{plan.get('parent_first_name', '')} {plan.get('parent_last_name', '') or ''}".strip()
+            barangay_id = child_data.get('barangay_id')
+            if barangay_id:
+                barangay_val = plan.get('barangay_name') or f"Barangay {barangay_id}"
                     
-        plan_details_clean = clean_note(plan.get('plan_details', ''))
+        # plan_data is parsed once at save time; clean_note is only needed for rows without it
+        plan_details_clean = plan['plan_data']['text'] if plan.get('plan_data') else clean_note(plan.get('plan_details', ''))
         generated_at_val = format_created_at(plan.get('generated_at', ''))
 
         medical_conditions = child_data.get('other_medical_problems', '-') if child_data else '-'
@@ -481,32 +494,9 @@ with meal_plans_tab:
             "_raw_plan_id": str(plan.get('plan_id', '')),
         })
 
-    # --- APPLY FILTERS ---
+    # Search, barangay, notes filters and sorting are applied in SQL by list_meal_plans
     filtered_rows = table_rows
-    # Search filter
-    if search_val:
-        search_val_lower = search_val.lower()
-        filtered_rows = [row for row in filtered_rows if search_val_lower in row['_raw_child_name'].lower() or search_val_lower in row['_raw_parent_name'].lower() or search_val_lower in row['_raw_plan_id'].lower()]
-    # Barangay filter
-    if barangay_selected and barangay_selected != "All":
-        filtered_rows = [row for row in filtered_rows if row["Barangay"] == barangay_selected]
-    # Notes filter
-    if notes_filter == "Has Notes":
-        filtered_rows = [row for row in filtered_rows if row["_has_notes"]]
-    elif notes_filter == "No Notes":
-        filtered_rows = [row for row in filtered_rows if not row["_has_notes"]]
-    # Sort by most recent
-    if sort_recent:
-        def get_dt(row):
-            val = row.get('Generated at', '')
-            try:
-                return datetime.strptime(val, '%b %d, %Y %I:%M %p')
-            except Exception:
-                return datetime.min
-        filtered_rows.sort(key=get_dt, reverse=True)
-    else:
-        # Sort by plan ID ascending (as int)
-        filtered_rows.sort(key=lambda x: int(x.get('Plan ID', 0)))
+    render_meal_plan_page_controls("meal_plans", page)
 
     columns = ["Plan ID", "Child Name", "Child Age", "Parent", "Barangay", "Diet Restrictions", "Plan Details", "Generated at", "Notes"]
     if filtered_rows:
@@ -557,7 +547,6 @@ with meal_plans_tab:
 # Add Notes Tab
 with add_notes_tab:
     st.header("📝 Add Notes to Meal Plans")
-    parents_data = data_manager.data_manager.get_parents_data()
     
     # Load all users for proper name display
     all_users = load_all_user_options()
@@ -569,12 +558,10 @@ with add_notes_tab:
     
     # Get barangays from database
     barangay_list = ["All"]
+    barangays = {}
     try:
-        conn = data_manager.data_manager.conn
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT DISTINCT barangay_name FROM barangays ORDER BY barangay_name")
-        barangay_rows = cursor.fetchall()
-        barangay_list.extend([row['barangay_name'] for row in barangay_rows])
+        barangays = data_manager.data_manager.get_all_barangays()
+        barangay_list.extend(sorted(set(barangays.values())))
     except Exception:
         barangay_list = ["All"]
     
@@ -586,43 +573,37 @@ with add_notes_tab:
         sort_recent = st.checkbox("Sort by Most Recent", value=True, key="add_notes_sort_recent")
 
     # --- GET AND PREPARE MEAL PLANS ---
-    all_plans = data_manager.data_manager.get_meal_plans()
+    # One page of plans, joined with child, parent, barangay and aggregated notes
+    barangay_ids = [bid for bid, name in barangays.items() if name == barangay_selected] if barangay_selected and barangay_selected != "All" else None
+    has_notes = {"Has Notes": True, "No Notes": False}.get(notes_filter)
+    page = load_meal_plan_page("add_notes", search_val, barangay_ids, has_notes, sort_recent)
+    overview_rows = page["rows"]
+
+    def clean_note(note_val):
+        if isinstance(note_val, str):
+            try:
+                parsed = json.loads(note_val)
+                if isinstance(parsed, dict) and 'text' in parsed:
+                    note_val = parsed['text']
+            except Exception:
+                pass
+        if isinstance(note_val, str):
+            note_val = note_val.replace('\r\n', '  \n').replace('\n', '  \n').replace('/n', '  \n')
+        return note_val
+
     table_rows = []
-    for plan in all_plans.values():
-        child_data = data_manager.data_manager.get_patient_by_id(plan['patient_id'])
+    for plan in overview_rows:
+        child_data = plan if plan.get('child_id') is not None else None
         child_name = data_manager.data_manager.format_full_name(
-            child_data.get('first_name', ''),
-            child_data.get('middle_name', ''),
-            child_data.get('last_name', '')
+            plan.get('child_first_name', ''),
+            plan.get('child_middle_name', ''),
+            plan.get('child_last_name', '')
         ) if child_data else "Unknown"
-        age_months = child_data['age_months'] if child_data and 'age_months' in child_data else None
+        age_months = child_data.get('age_months') if child_data else None
         child_age = f"{age_months//12}y {age_months%12}m" if age_months is not None else "-"
         parent_id = child_data.get('parent_id') if child_data else None
-        notes = data_manager.data_manager.get_notes_for_meal_plan(plan.get('plan_id', ''))
-        
-        def format_created_at(val):
-            if isinstance(val, str):
-                try:
-                    dt = datetime.strptime(val, '%Y-%m-%d %H:%M:%S')
-                    return dt.strftime('%b %d')
-                except Exception:
-                    return val
-            if isinstance(val, datetime):
-                return val.strftime('%b %d')
-            return str(val)
-            
-        def clean_note(note_val):
-            if isinstance(note_val, str):
-                try:
-                    parsed = json.loads(note_val)
-                    if isinstance(parsed, dict) and 'text' in parsed:
-                        note_val = parsed['text']
-                except Exception:
-                    pass
-            if isinstance(note_val, str):
-                note_val = note_val.replace('\r\n', '  \n').replace('\n', '  \n').replace('/n', '  \n')
-            return note_val
-        
+        notes = plan.get('notes') or []
+
         if notes:
             notes_str = "<br>".join([
                 f"Noted by {get_user_display_name(note.get('nutritionist_id'), all_users)}: {clean_note(note.get('notes', ''))}"
@@ -634,23 +615,20 @@ with add_notes_tab:
         parent_full_name = "Unknown"
         barangay_val = "-"
         if parent_id is not None:
-            parent_info = parents_data.get(str(parent_id))
-            if parent_info:
+            if plan.get('parent_first_name') is not None:
                 parent_full_name = data_manager.data_manager.format_full_name(
-                    parent_info.get('first_name', ''),
-                    parent_info.get('middle_name', ''),
-                    parent_info.get('last_name', '')
+                    plan.get('parent_first_name', ''),
+                    plan.get('parent_middle_name', ''),
+                    plan.get('parent_last_name', '')
                 )
-                # Get barangay name
-                barangay_id = child_data.get('barangay_id') if child_data else None
+                barangay_id = child_data.get('barangay_id')
                 if barangay_id:
-                    barangay_val = data_manager.data_manager.get_barangay_name(barangay_id)
-                else:
-                    barangay_val = "-"
+                    barangay_val = plan.get('barangay_name') or f"Barangay {barangay_id}"
             else:
                 parent_full_name = f"Parent {parent_id}"
                 
-        plan_details_clean = clean_note(plan.get('plan_details', ''))
+        # plan_data is parsed once at save time; clean_note is only needed for rows without it
+        plan_details_clean = plan['plan_data']['text'] if plan.get('plan_data') else clean_note(plan.get('plan_details', ''))
         generated_at_val = plan.get('generated_at', '')
         
         # Diet Restrictions
@@ -674,39 +652,12 @@ with add_notes_tab:
             "_raw_child_name": child_name,
             "_raw_parent_name": parent_full_name,
             "_raw_plan_id": str(plan.get('plan_id', '')),
+            "_patient_id": plan.get('patient_id'),
         })
 
-    # --- APPLY FILTERS ---
+    # Search, barangay, notes filters and sorting are applied in SQL by list_meal_plans
     filtered_rows = table_rows
-    # Search filter
-    if search_val:
-        search_val_lower = search_val.lower()
-        filtered_rows = [row for row in filtered_rows if search_val_lower in row['_raw_child_name'].lower() or search_val_lower in row['_raw_parent_name'].lower() or search_val_lower in row['_raw_plan_id'].lower()]
-    # Barangay filter
-    if barangay_selected and barangay_selected != "All":
-        filtered_rows = [row for row in filtered_rows if row["Barangay"] == barangay_selected]
-    # Notes filter
-    if notes_filter == "Has Notes":
-        filtered_rows = [row for row in filtered_rows if row["_has_notes"]]
-    elif notes_filter == "No Notes":
-        filtered_rows = [row for row in filtered_rows if not row["_has_notes"]]
-    # Sort by most recent
-    if sort_recent:
-        def get_dt(row):
-            val = row.get("Generated at", "")
-            # Try to parse datetime, fallback to plan ID (as int) if missing/invalid
-            try:
-                return datetime.strptime(val, "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                try:
-                    # Fallback: use plan ID as int (higher = newer)
-                    return datetime.min.replace(year=1900) + timedelta(days=int(row.get('Plan ID', 0)))
-                except Exception:
-                    return datetime.min
-        filtered_rows.sort(key=get_dt, reverse=True)
-    else:
-        # Sort by plan ID ascending (as int)
-        filtered_rows.sort(key=lambda x: int(x.get('Plan ID', 0)))
+    render_meal_plan_page_controls("add_notes", page)
 
     columns = ["Plan ID", "Child Name", "Child Age", "Parent", "Barangay", "Diet Restrictions", "Plan Details", "Generated at", "Notes", "Add note"]
     
@@ -775,9 +726,7 @@ with add_notes_tab:
                 new_note = val_cols[-1].text_area("Enter note:", key=f"admin_note_input_{plan_id}")
                 save_col, cancel_col = val_cols[-1].columns([1,1])
                 if save_col.button("Save Note", key=f"admin_save_note_{plan_id}"):
-                    # Find patient_id for this plan
-                    plan = next((p for p in all_plans.values() if str(p.get('plan_id')) == str(plan_id)), None)
-                    patient_id = plan['patient_id'] if plan and 'patient_id' in plan else None
+                    patient_id = row.get("_patient_id")
                     if not patient_id:
                         st.error('Could not determine patient_id for this meal plan.')
                     else:
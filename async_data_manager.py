@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import aiomysql
+from dotenv import load_dotenv
+
+from llm_cache import generation_cache
+from food_matcher import food_matcher
+from exclusion_index import exclusion_index
+from food_catalog import food_catalog
+from food_search import food_search, DEFAULT_PER_PAGE
+from meal_plan_schema import normalize_plan_details
+
+from data_manager import (
+    DataManager,
+    USER_COLUMNS,
+    PATIENT_COLUMNS,
+    FOOD_COLUMNS,
+    MEAL_PLAN_COLUMNS,
+    ASSESSMENT_COLUMNS,
+    KNOWLEDGE_BASE_SQL,
+    KNOWLEDGE_BASE_FULL_SQL,
+    KNOWLEDGE_BASE_TEXT_SQL,
+)
+
+load_dotenv()
+
+
+class AsyncDataManager:
+    """
+    Async counterpart to DataManager for the FastAPI app, backed by an aiomysql pool.
+    Method names and return shapes match DataManager so endpoints can swap one for the other.
+    """
+    format_full_name = staticmethod(DataManager.format_full_name)
+    meal_plan_columns = staticmethod(DataManager.meal_plan_columns)
+    _decode_plan_data = staticmethod(DataManager._decode_plan_data)
+
+    def __init__(self, pool_size: Optional[int] = None):
+        self.pool_size = pool_size or int(os.getenv('DB_POOL_SIZE', '10'))
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self):
+        """Create the aiomysql pool on first use, inside the running event loop."""
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await aiomysql.create_pool(
+                        host=os.getenv('DB_HOST', 'localhost'),
+                        port=int(os.getenv('DB_PORT', '3306')),
+                        user=os.getenv('DB_USER'),
+                        password=os.getenv('DB_PASSWORD'),
+                        db=os.getenv('DB_NAME'),
+                        minsize=1,
+                        maxsize=self.pool_size,
+                        autocommit=True,
+                        cursorclass=aiomysql.DictCursor,
+                    )
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    def pool_stats(self) -> Dict:
+        """Async pool metrics, in the same spirit as DataManager.pool_stats."""
+        if self._pool is None:
+            return {"size": self.pool_size, "open": 0, "in_use": 0, "idle": 0}
+        return {
+            "size": self._pool.maxsize,
+            "open": self._pool.size,
+            "in_use": self._pool.size - self._pool.freesize,
+            "idle": self._pool.freesize,
+        }
+
+    async def _fetchall(self, sql: str, params=None) -> List[Dict]:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                return list(await cursor.fetchall())
+
+    async def _fetchone(self, sql: str, params=None) -> Optional[Dict]:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                return await cursor.fetchone()
+
+    async def _execute(self, sql: str, params=None) -> str:
+        """Run a write statement and return the last inserted id."""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                return str(cursor.lastrowid)
+
+    # Foods
+    async def update_food(self, food_id, food_data):
+        sql = """
+            UPDATE foods SET
+                food_name_and_description = %s,
+                alternate_common_names = %s,
+                energy_kcal = %s,
+                nutrition_tags = %s
+            WHERE food_id = %s
+        """
+        await self._execute(sql, (
+            food_data.get('food_name_and_description', ''),
+            food_data.get('alternate_common_names', ''),
+            food_data.get('energy_kcal', 0),
+            food_data.get('nutrition_tags', ''),
+            food_id
+        ))
+        generation_cache.invalidate_foods()
+        await asyncio.to_thread(food_catalog.update_food, food_id, food_data)
+        food_matcher.update_food(food_id, food_data)
+        exclusion_index.update_food(food_id, food_data)
+
+    async def get_foods_data(self) -> List[Dict]:
+        # Shared food catalog snapshot; a due staleness check (one MySQL query) runs off the event loop
+        if food_catalog.is_fresh():
+            return food_catalog.rows()
+        return await asyncio.to_thread(food_catalog.rows)
+
+    async def search_foods_page(self, search_term: str = "", page: int = 1, per_page: int = DEFAULT_PER_PAGE) -> Dict:
+        if food_catalog.is_fresh():
+            return food_search.search(search_term, page, per_page)
+        return await asyncio.to_thread(food_search.search, search_term, page, per_page)
+
+    async def get_food_by_id(self, food_id) -> Optional[Dict]:
+        return await self._fetchone(f"SELECT {FOOD_COLUMNS} FROM foods WHERE food_id = %s", (food_id,))
+
+    # Users, barangays
+    async def get_nutritionists(self) -> List[Dict]:
+        return await self._fetchall(f"SELECT {USER_COLUMNS} FROM users WHERE role_id = (SELECT role_id FROM roles WHERE role_name = 'nutritionist')")
+
+    async def get_barangay_name(self, barangay_id: int) -> str:
+        try:
+            row = await self._fetchone("SELECT barangay_name FROM barangays WHERE barangay_id = %s", (barangay_id,))
+            return row['barangay_name'] if row else f"Barangay {barangay_id}"
+        except Exception:
+            return f"Barangay {barangay_id}"
+
+    async def get_all_barangays(self) -> Dict:
+        try:
+            rows = await self._fetchall("SELECT barangay_id, barangay_name FROM barangays ORDER BY barangay_name")
+            return {row['barangay_id']: row['barangay_name'] for row in rows}
+        except Exception:
+            return {}
+
+    async def get_parents_data(self) -> Dict:
+        rows = await self._fetchall(f"SELECT {USER_COLUMNS} FROM users WHERE role_id = (SELECT role_id FROM roles WHERE role_name = 'parent')")
+        return {str(row['user_id']): row for row in rows}
+
+    async def get_parent_by_id(self, parent_id: str) -> Optional[Dict]:
+        return await self._fetchone(f"SELECT {USER_COLUMNS} FROM users WHERE user_id = %s AND role_id = (SELECT role_id FROM roles WHERE role_name = 'parent')", (parent_id,))
+
+    async def get_religion_by_parent(self, parent_id: str) -> Optional[str]:
+        # Religion is not stored in users table (see DataManager.get_religion_by_parent)
+        return None
+
+    # Children
+    async def get_children_data(self) -> Dict:
+        rows = await self._fetchall(f"SELECT {PATIENT_COLUMNS} FROM patients")
+        return {str(row['patient_id']): row for row in rows}
+
+    async def get_children_by_parent(self, parent_id: str) -> List[Dict]:
+        return await self._fetchall(f"SELECT {PATIENT_COLUMNS} FROM patients WHERE parent_id = %s", (parent_id,))
+
+    async def get_children_ids_by_parent(self, parent_id: str) -> List[str]:
+        rows = await self._fetchall("SELECT patient_id FROM patients WHERE parent_id = %s", (parent_id,))
+        return [str(row['patient_id']) for row in rows]
+
+    async def get_patient_by_id(self, patient_id: str) -> Optional[Dict]:
+        return await self._fetchone(f"SELECT {PATIENT_COLUMNS} FROM patients WHERE patient_id = %s", (patient_id,))
+
+    # Meal plans
+    async def get_meal_plans(self) -> Dict:
+        rows = self._decode_plan_data(await self._fetchall(f"SELECT {MEAL_PLAN_COLUMNS} FROM meal_plans"))
+        return {str(row['plan_id']): row for row in rows}
+
+    async def get_meal_plan_by_id(self, plan_id: int, columns: Optional[List[str]] = None) -> Optional[Dict]:
+        row = await self._fetchone(f"SELECT {self.meal_plan_columns(columns)} FROM meal_plans WHERE plan_id = %s", (plan_id,))
+        return self._decode_plan_data([row])[0] if row else None
+
+    async def save_meal_plan(self, patient_id: str, meal_plan: str, duration_days: int, parent_id: str, plan_data: Optional[Dict] = None) -> str:
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return await self._execute(
+            "INSERT INTO meal_plans (patient_id, plan_details, plan_data, generated_at) VALUES (%s, %s, %s, %s)",
+            (patient_id, meal_plan, json.dumps(plan_data or normalize_plan_details(meal_plan)), now)
+        )
+
+    async def get_meal_plans_by_patient(self, patient_id: str, months_back: int = 6, columns: Optional[List[str]] = None) -> List[Dict]:
+        cutoff_date = (datetime.now() - timedelta(days=months_back * 30)).strftime('%Y-%m-%d %H:%M:%S')
+        return self._decode_plan_data(await self._fetchall(
+            f"SELECT {self.meal_plan_columns(columns)} FROM meal_plans WHERE patient_id = %s AND generated_at >= %s ORDER BY generated_at DESC",
+            (patient_id, cutoff_date)
+        ))
+
+    async def get_meal_plans_by_parent(self, parent_id: str) -> List[Dict]:
+        return self._decode_plan_data(await self._fetchall(f"SELECT {MEAL_PLAN_COLUMNS} FROM meal_plans WHERE patient_id IN (SELECT patient_id FROM patients WHERE parent_id = %s) ORDER BY generated_at DESC", (parent_id,)))
+
+    # Nutritionist notes
+    async def get_nutritionist_notes_by_patient(self, patient_id: int) -> List[Dict]:
+        return await self._fetchall(f"SELECT {ASSESSMENT_COLUMNS} FROM assessments WHERE patient_id = %s", (patient_id,))
+
+    async def get_notes_for_meal_plan(self, plan_id: str) -> List[Dict]:
+        return await self._fetchall("SELECT assessment_id, nutritionist_id, patient_id, plan_id, notes, created_at FROM assessments WHERE plan_id = %s", (plan_id,))
+
+    # Knowledge base
+    async def get_knowledge_base(self, include_pdf_text: bool = False) -> Dict:
+        rows = await self._fetchall(KNOWLEDGE_BASE_FULL_SQL if include_pdf_text else KNOWLEDGE_BASE_SQL)
+        return {str(row['kb_id']): row for row in rows}
+
+    async def get_knowledge_base_text(self, kb_id) -> Optional[Dict]:
+        return await self._fetchone(KNOWLEDGE_BASE_TEXT_SQL, (kb_id,))
+
+
+async_data_manager = AsyncDataManager()
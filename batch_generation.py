@@ -0,0 +1,208 @@
+import argparse
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from data_manager import data_manager
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Groq request/token rates, retries and backoff are handled by rate_limiter.groq_limiter,
+# which every worker shares with the API and UI paths
+DEFAULT_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+
+
+class BatchJob:
+    """Progress and per-patient results of one batch run."""
+    def __init__(self, patient_ids: List[str], available_ingredients: Optional[str] = None, concurrency: int = DEFAULT_CONCURRENCY, label: str = "", structured: bool = False):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.patient_ids = [str(pid) for pid in patient_ids]
+        self.available_ingredients = available_ingredients
+        self.structured = structured
+        self.concurrency = max(1, concurrency)
+        self.label = label
+        self.status = "pending"
+        self.results: List[Dict] = []
+        self.error = None
+        self.created_at = datetime.now()
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def _add_result(self, result: Dict):
+        with self._lock:
+            self.results.append(result)
+
+    def progress(self) -> Dict:
+        with self._lock:
+            results = list(self.results)
+        completed = sum(1 for r in results if r["status"] == "saved")
+        failed = len(results) - completed
+        total = len(self.patient_ids)
+        elapsed = ((self._finished or time.monotonic()) - self._started) if self._started else 0.0
+        per_minute = len(results) / elapsed * 60 if elapsed > 0 else 0.0
+        remaining = total - len(results)
+        return {
+            "job_id": self.job_id,
+            "label": self.label,
+            "status": self.status,
+            "total": total,
+            "completed": completed,
+            "failed": failed,
+            "remaining": remaining,
+            "elapsed_seconds": round(elapsed, 1),
+            "plans_per_minute": round(per_minute, 2),
+            "eta_seconds": round(remaining / per_minute * 60, 1) if per_minute and self.status == "running" else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "results": results,
+        }
+
+
+def resolve_patient_ids(barangay_id: Optional[int] = None, patient_ids: Optional[List] = None) -> List[str]:
+    """Patients to generate for: the explicit list, otherwise everyone in the barangay."""
+    if patient_ids:
+        return [str(pid) for pid in dict.fromkeys(patient_ids)]
+    if barangay_id is not None:
+        return [str(p['patient_id']) for p in data_manager.get_patients_by_barangay(barangay_id)]
+    raise ValueError("Provide a barangay_id or a list of patient_ids")
+
+
+def _generate_one(patient_id: str, job: BatchJob, context: Dict, nutrition_ai) -> Dict:
+    from nutrition_chain import generate_and_save_meal_plan
+    started = time.monotonic()
+    patient_data = data_manager.get_patient_by_id(patient_id)
+    if not patient_data:
+        return {"patient_id": patient_id, "status": "failed", "error": "Patient not found"}
+    try:
+        result = generate_and_save_meal_plan(
+            patient_id,
+            available_ingredients=job.available_ingredients,
+            nutrition_ai=nutrition_ai,
+            patient_data=patient_data,
+            context=context,
+            structured=job.structured
+        )
+    except Exception as e:
+        return {"patient_id": patient_id, "status": "failed", "error": str(e)}
+    if not result["plan_id"]:
+        return {"patient_id": patient_id, "status": "failed", "error": result["meal_plan"] or "Empty meal plan"}
+    return {"patient_id": patient_id, "status": "saved", "plan_id": result["plan_id"], "seconds": round(time.monotonic() - started, 1)}
+
+
+def run_batch(job: BatchJob, on_progress: Optional[Callable[[Dict], None]] = None) -> BatchJob:
+    """Generate and save a plan for every patient in the job, concurrency plans at a time."""
+    from llm_registry import llm_registry
+    from nutrition_chain import load_shared_context
+
+    job.status = "running"
+    job._started = time.monotonic()
+    try:
+        llm_registry.api_key()
+        # Food database and knowledge base are read once for the whole batch
+        context = load_shared_context()
+        nutrition_ai = llm_registry.nutrition_ai()
+        with ThreadPoolExecutor(max_workers=job.concurrency, thread_name_prefix=f"batch-{job.job_id}") as pool:
+            futures = {pool.submit(_generate_one, pid, job, context, nutrition_ai): pid for pid in job.patient_ids}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"patient_id": futures[future], "status": "failed", "error": str(e)}
+                job._add_result(result)
+                if on_progress:
+                    on_progress(job.progress())
+        job.status = "completed"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        logger.exception("Batch job %s failed", job.job_id)
+    finally:
+        job._finished = time.monotonic()
+    return job
+
+
+class BatchJobManager:
+    """In-process registry of batch jobs run on background threads."""
+    def __init__(self, max_jobs: int = 50):
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, BatchJob] = {}
+        self._lock = threading.Lock()
+
+    def start(self, patient_ids: List[str], available_ingredients: Optional[str] = None, concurrency: int = DEFAULT_CONCURRENCY, label: str = "", structured: bool = False) -> BatchJob:
+        job = BatchJob(patient_ids, available_ingredients, concurrency, label, structured)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            # Forget the oldest finished jobs
+            finished = [j for j in self._jobs.values() if j.status in ("completed", "failed")]
+            for old in sorted(finished, key=lambda j: j.created_at)[:max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[old.job_id]
+        threading.Thread(target=run_batch, args=(job,), name=f"batch-{job.job_id}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        summaries = []
+        for job in sorted(jobs, key=lambda j: j.created_at, reverse=True):
+            summary = job.progress()
+            summary.pop("results")
+            summaries.append(summary)
+        return summaries
+
+
+batch_jobs = BatchJobManager()
+
+
+def main():
+    """
+    python batch_generation.py --barangay 3 --concurrency 4
+    python batch_generation.py --patients 12,15,19 --ingredients "rice, malunggay, eggs"
+    """
+    parser = argparse.ArgumentParser(description="Generate and save meal plans for a barangay or a list of patients.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--barangay", type=int, help="barangay_id whose children all get a plan")
+    target.add_argument("--patients", help="comma-separated patient ids")
+    parser.add_argument("--ingredients", default=None, help="available ingredients passed to every plan")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--structured", action="store_true", help="generate schema-validated JSON plans (stored with the text)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    patient_ids = resolve_patient_ids(
+        barangay_id=args.barangay,
+        patient_ids=[pid.strip() for pid in args.patients.split(',') if pid.strip()] if args.patients else None
+    )
+    if not patient_ids:
+        print("No patients found.")
+        return
+
+    def report(progress):
+        last = progress["results"][-1]
+        detail = f"plan {last['plan_id']}" if last["status"] == "saved" else last.get("error")
+        print(f"[{progress['completed'] + progress['failed']}/{progress['total']}] patient {last['patient_id']}: "
+              f"{last['status']} ({detail}) - {progress['plans_per_minute']} plans/min")
+
+    job = run_batch(BatchJob(patient_ids, args.ingredients, args.concurrency, structured=args.structured), on_progress=report)
+    summary = job.progress()
+    print(f"Done: {summary['completed']} saved, {summary['failed']} failed in {summary['elapsed_seconds']}s "
+          f"({summary['plans_per_minute']} plans/min)")
+    if job.error:
+        print(f"Batch error: {job.error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+-- Retrieval chunks for knowledge base entries, written by DataManager.save_knowledge_base
+-- Run once: mysql -u your_username -p your_database < create_knowledge_chunks_table.sql
+-- Existing knowledge_base rows are chunked automatically the first time the search index loads.
+
+CREATE TABLE IF NOT EXISTS knowledge_chunks (
+    chunk_id INT AUTO_INCREMENT PRIMARY KEY,
+    kb_id INT NOT NULL,
+    chunk_index INT NOT NULL,
+    chunk_text TEXT NOT NULL,
+    token_count INT NOT NULL,
+    term_freqs JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_knowledge_chunks_kb_chunk (kb_id, chunk_index),
+    CONSTRAINT fk_knowledge_chunks_kb FOREIGN KEY (kb_id) REFERENCES knowledge_base (kb_id) ON DELETE CASCADE
+);
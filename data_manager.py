@@ -1,8 +1,189 @@
 from db import get_connection
+from kb_index import KnowledgeIndex, build_chunks
+from llm_cache import generation_cache
+from food_matcher import food_matcher
+from exclusion_index import exclusion_index
+from food_catalog import food_catalog
+from food_search import food_search, DEFAULT_PER_PAGE
+from meal_plan_schema import normalize_plan_details
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+from contextlib import contextmanager
+from collections import deque
+from dotenv import load_dotenv
+import threading
+import time
 import uuid
 import json
+import os
+
+load_dotenv()
+
+# Column lists shared by DataManager and AsyncDataManager
+USER_COLUMNS = "user_id, role_id, first_name, middle_name, last_name, birth_date, sex, email, email_verified_at, password, contact_number, address, is_active, remember_token, license_number, years_experience, qualifications, professional_experience, professional_id_path, verification_status, rejection_reason, verified_at, verified_by, account_status, deleted_at, created_at, updated_at"
+PATIENT_COLUMNS = "patient_id, first_name, middle_name, last_name, barangay_id, contact_number, age_months, sex, date_of_admission, total_household_adults, total_household_children, total_household_twins, is_4ps_beneficiary, weight_kg, height_cm, weight_for_age, height_for_age, bmi_for_age, breastfeeding, allergies, religion, other_medical_problems, edema, created_at, updated_at, parent_id"
+FOOD_COLUMNS = "food_id, food_name_and_description, alternate_common_names, energy_kcal, nutrition_tags"
+FOODS_SIGNATURE_SQL = (
+    "SELECT COUNT(*) AS total, BIT_XOR(CRC32(CONCAT_WS('|', food_id, food_name_and_description, "
+    "alternate_common_names, energy_kcal, nutrition_tags))) AS checksum FROM foods"
+)
+MEAL_PLAN_COLUMNS = "plan_id, patient_id, plan_details, plan_data, generated_at"
+# Columns callers may project meal plan reads to
+MEAL_PLAN_COLUMN_NAMES = ("plan_id", "patient_id", "plan_details", "plan_data", "generated_at")
+ASSESSMENT_COLUMNS = "assessment_id, nutritionist_id, patient_id, plan_id, assessment_date, notes, treatment, recovery_status, completed_at, created_at, updated_at"
+# The listing leaves out pdf_text (often megabytes per row); KNOWLEDGE_BASE_FULL_SQL includes it
+_KNOWLEDGE_BASE_SQL_TEMPLATE = """
+    SELECT 
+        kb.kb_id, 
+        kb.user_id,
+        kb.ai_summary, 
+        kb.pdf_name, 
+        {pdf_text_columns}
+        kb.added_at,
+        CONCAT(u.first_name, 
+               CASE 
+                   WHEN u.middle_name IS NOT NULL AND u.middle_name != '' 
+                   THEN CONCAT(' ', u.middle_name, ' ') 
+                   ELSE ' ' 
+               END, 
+               u.last_name) as uploaded_by_name
+    FROM knowledge_base kb
+    LEFT JOIN users u ON kb.user_id = u.user_id
+    ORDER BY kb.added_at DESC
+"""
+KNOWLEDGE_BASE_SQL = _KNOWLEDGE_BASE_SQL_TEMPLATE.format(pdf_text_columns="CHAR_LENGTH(kb.pdf_text) AS pdf_text_length,")
+KNOWLEDGE_BASE_FULL_SQL = _KNOWLEDGE_BASE_SQL_TEMPLATE.format(pdf_text_columns="kb.pdf_text, CHAR_LENGTH(kb.pdf_text) AS pdf_text_length,")
+KNOWLEDGE_BASE_TEXT_SQL = "SELECT kb_id, pdf_name, pdf_text FROM knowledge_base WHERE kb_id = %s"
+
+MEAL_PLAN_OVERVIEW_SQL = """
+    SELECT
+        mp.plan_id, mp.patient_id, mp.plan_details, mp.plan_data, mp.generated_at,
+        p.patient_id AS child_id, p.first_name AS child_first_name, p.middle_name AS child_middle_name, p.last_name AS child_last_name,
+        p.age_months, p.allergies, p.religion, p.other_medical_problems, p.barangay_id, p.parent_id,
+        u.first_name AS parent_first_name, u.middle_name AS parent_middle_name, u.last_name AS parent_last_name,
+        b.barangay_name,
+        (
+            SELECT JSON_ARRAYAGG(JSON_OBJECT(
+                'assessment_id', a.assessment_id,
+                'nutritionist_id', a.nutritionist_id,
+                'notes', a.notes,
+                'created_at', a.created_at
+            ))
+            FROM assessments a
+            WHERE a.plan_id = mp.plan_id
+        ) AS notes
+    FROM meal_plans mp
+    LEFT JOIN patients p ON p.patient_id = mp.patient_id
+    LEFT JOIN users u ON u.user_id = p.parent_id
+    LEFT JOIN barangays b ON b.barangay_id = p.barangay_id
+"""
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection becomes free within the wait timeout."""
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of MySQL connections created with db.get_connection.
+    Connections are opened lazily up to `size`; callers beyond that wait up to `timeout` seconds.
+    """
+    def __init__(self, factory, size: int = 10, timeout: float = 10.0):
+        self._factory = factory
+        self.size = max(1, int(size))
+        self.timeout = float(timeout)
+        self._idle = deque()
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        # Metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def acquire(self):
+        """Check out a live connection, opening a new one if the pool is not full yet."""
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout:.1f}s (pool size {self.size})")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._created += 1
+            self._in_use += 1
+
+        try:
+            if conn is None:
+                conn = self._factory()
+            elif not self._is_alive(conn):
+                self._close_quietly(conn)
+                conn = self._factory()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.perf_counter() - start
+        with self._cond:
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def release(self, conn, discard: bool = False):
+        """Return a connection to the pool, or close it if it is no longer usable."""
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._created -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+        if discard:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict:
+        """Snapshot of pool usage and checkout latency."""
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "avg_checkout_ms": round(self._total_wait / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "max_checkout_ms": round(self._max_wait * 1000, 3),
+            }
+
+    @staticmethod
+    def _is_alive(conn) -> bool:
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
 
 class DataManager:
     def update_food(self, food_id, food_data):
@@ -22,59 +203,144 @@ class DataManager:
             food_data.get('nutrition_tags', ''),
             food_id
         )
-        self.cursor.execute(sql, params)
-        self.conn.commit()
+        with self._cursor(commit=True) as cursor:
+            cursor.execute(sql, params)
+        # Cached generations were rendered against the old food list
+        generation_cache.invalidate_foods()
+        food_catalog.update_food(food_id, food_data)
+        food_matcher.update_food(food_id, food_data)
+        exclusion_index.update_food(food_id, food_data)
     
     def get_foods_data(self):
-        """Get all foods from the foods table, ordered by food_id."""
-        self.cursor.execute("SELECT food_id, food_name_and_description, alternate_common_names, energy_kcal, nutrition_tags FROM foods ORDER BY food_id")
-        return self.cursor.fetchall()
+        """All foods ordered by food_id, from the shared food catalog snapshot (do not mutate the rows)."""
+        return food_catalog.rows()
+
+    def fetch_foods(self):
+        """Read every food from MySQL, ordered by food_id (the food catalog's loader)."""
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {FOOD_COLUMNS} FROM foods ORDER BY food_id")
+            return cursor.fetchall()
+
+    def get_foods_signature(self):
+        """(row count, checksum) of the foods table: one aggregate row for the food catalog's staleness check."""
+        with self._cursor() as cursor:
+            cursor.execute(FOODS_SIGNATURE_SQL)
+            row = cursor.fetchone()
+        return (int(row['total']), int(row['checksum'] or 0))
 
     def get_food_by_id(self, food_id):
         """Get a specific food by its ID."""
-        self.cursor.execute("SELECT food_id, food_name_and_description, alternate_common_names, energy_kcal, nutrition_tags FROM foods WHERE food_id = %s", (food_id,))
-        return self.cursor.fetchone()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {FOOD_COLUMNS} FROM foods WHERE food_id = %s", (food_id,))
+            return cursor.fetchone()
 
     def search_foods(self, search_term=""):
-        """Search foods by name, description, or tags."""
-        conditions = []
-        params = []
-        if search_term:
-            conditions.append("(food_name_and_description LIKE %s OR alternate_common_names LIKE %s OR nutrition_tags LIKE %s)")
-            search_pattern = f"%{search_term}%"
-            params.extend([search_pattern, search_pattern, search_pattern])
-        where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
-        sql = f"SELECT food_id, food_name_and_description, alternate_common_names, energy_kcal, nutrition_tags FROM foods {where_clause} ORDER BY food_name_and_description"
-        self.cursor.execute(sql, params)
-        return self.cursor.fetchall()
+        """Search foods by name, alternate names or tags (prefix and typo tolerant), best match first."""
+        return food_search.search_all(search_term)
+
+    def search_foods_page(self, search_term="", page=1, per_page=DEFAULT_PER_PAGE) -> Dict:
+        """One page of search_foods results: {"foods", "total", "page", "per_page", "pages"}."""
+        return food_search.search(search_term, page, per_page)
     
     def get_nutritionists(self) -> list:
         """Get all nutritionists from MySQL, all columns."""
-        self.cursor.execute("SELECT user_id, role_id, first_name, middle_name, last_name, birth_date, sex, email, email_verified_at, password, contact_number, address, is_active, remember_token, license_number, years_experience, qualifications, professional_experience, professional_id_path, verification_status, rejection_reason, verified_at, verified_by, account_status, deleted_at, created_at, updated_at FROM users WHERE role_id = (SELECT role_id FROM roles WHERE role_name = 'nutritionist')")
-        return self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE role_id = (SELECT role_id FROM roles WHERE role_name = 'nutritionist')")
+            return cursor.fetchall()
     
-    def get_meal_plan_by_id(self, plan_id: int) -> Optional[Dict]:
-        """Get a single meal plan by its plan_id."""
-        self.cursor.execute("SELECT plan_id, patient_id, plan_details, generated_at FROM meal_plans WHERE plan_id = %s", (plan_id,))
-        return self.cursor.fetchone()
+    @staticmethod
+    def meal_plan_columns(columns: Optional[List[str]] = None) -> str:
+        """SELECT list for a meal plan read, projected to columns (unknown names are rejected)."""
+        if not columns:
+            return MEAL_PLAN_COLUMNS
+        unknown = [c for c in columns if c not in MEAL_PLAN_COLUMN_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown meal plan column(s): {', '.join(unknown)}")
+        return ", ".join(dict.fromkeys(columns))
+
+    @staticmethod
+    def _decode_plan_data(rows: List[Dict]) -> List[Dict]:
+        """
+        Turn the plan_data JSON column into the parsed plan ({"text", "parsed_days", "structured"?}).
+        Rows saved before the column existed are parsed from plan_details instead.
+        """
+        for row in rows:
+            if row is None or 'plan_data' not in row:
+                continue
+            data = row['plan_data']
+            if isinstance(data, (bytes, bytearray)):
+                data = data.decode('utf-8')
+            try:
+                row['plan_data'] = json.loads(data) if data else None
+            except (TypeError, ValueError):
+                row['plan_data'] = None
+            if row['plan_data'] is None and 'plan_details' in row:
+                row['plan_data'] = normalize_plan_details(row['plan_details'])
+        return rows
+
+    def get_meal_plan_by_id(self, plan_id: int, columns: Optional[List[str]] = None) -> Optional[Dict]:
+        """Get a single meal plan by its plan_id; plan_data holds the pre-parsed plan."""
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {self.meal_plan_columns(columns)} FROM meal_plans WHERE plan_id = %s", (plan_id,))
+            row = cursor.fetchone()
+        return self._decode_plan_data([row])[0] if row else None
 
     def get_nutritionist_notes_by_patient(self, patient_id: int) -> List[Dict]:
         """Get all nutritionist notes for a given patient_id from assessments.notes."""
-        self.cursor.execute("SELECT assessment_id, nutritionist_id, patient_id, plan_id, assessment_date, notes, treatment, recovery_status, completed_at, created_at, updated_at FROM assessments WHERE patient_id = %s", (patient_id,))
-        return self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {ASSESSMENT_COLUMNS} FROM assessments WHERE patient_id = %s", (patient_id,))
+            return cursor.fetchall()
         
     """
     Manages MySQL-based data storage for the nutrition system
     """
-    def __init__(self):
-        self.conn = get_connection()
-        self.cursor = self.conn.cursor(dictionary=True)
+    def __init__(self, pool_size: Optional[int] = None, pool_timeout: Optional[float] = None):
+        self.pool = ConnectionPool(
+            get_connection,
+            size=pool_size or int(os.getenv('DB_POOL_SIZE', '10')),
+            timeout=pool_timeout or float(os.getenv('DB_POOL_TIMEOUT', '10'))
+        )
+        self.kb_index = KnowledgeIndex()
+        self._kb_index_lock = threading.Lock()
+        self._kb_signature = None
+        self._kb_checked_at = 0.0
+        self.kb_index_refresh_seconds = float(os.getenv('KB_INDEX_REFRESH_SECONDS', '60'))
+
+    @contextmanager
+    def _cursor(self, commit: bool = False):
+        """Check a connection out of the pool for one call and yield a dictionary cursor on it."""
+        conn = self.pool.acquire()
+        healthy = True
+        try:
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+            if commit:
+                conn.commit()
+            else:
+                # End the read transaction so the next borrower does not see a stale snapshot
+                conn.rollback()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                healthy = False
+            raise
+        finally:
+            self.pool.release(conn, discard=not healthy)
+
+    def pool_stats(self) -> Dict:
+        """Connection pool metrics (in-use, waiting, checkout latency)."""
+        return self.pool.stats()
 
     def get_barangay_name(self, barangay_id: int) -> str:
         """Get barangay name by barangay_id."""
         try:
-            self.cursor.execute("SELECT barangay_name FROM barangays WHERE barangay_id = %s", (barangay_id,))
-            result = self.cursor.fetchone()
+            with self._cursor() as cursor:
+                cursor.execute("SELECT barangay_name FROM barangays WHERE barangay_id = %s", (barangay_id,))
+                result = cursor.fetchone()
             return result['barangay_name'] if result else f"Barangay {barangay_id}"
         except Exception:
             return f"Barangay {barangay_id}"
@@ -82,8 +348,9 @@ class DataManager:
     def get_all_barangays(self) -> Dict:
         """Get all barangays as a dictionary {barangay_id: barangay_name}."""
         try:
-            self.cursor.execute("SELECT barangay_id, barangay_name FROM barangays ORDER BY barangay_name")
-            rows = self.cursor.fetchall()
+            with self._cursor() as cursor:
+                cursor.execute("SELECT barangay_id, barangay_name FROM barangays ORDER BY barangay_name")
+                rows = cursor.fetchall()
             return {row['barangay_id']: row['barangay_name'] for row in rows}
         except Exception:
             return {}
@@ -108,14 +375,16 @@ class DataManager:
 
     def get_parents_data(self) -> Dict:
         """Get all parents data from MySQL, including all columns as per schema."""
-        self.cursor.execute("SELECT user_id, role_id, first_name, middle_name, last_name, birth_date, sex, email, email_verified_at, password, contact_number, address, is_active, remember_token, license_number, years_experience, qualifications, professional_experience, professional_id_path, verification_status, rejection_reason, verified_at, verified_by, account_status, deleted_at, created_at, updated_at FROM users WHERE role_id = (SELECT role_id FROM roles WHERE role_name = 'parent')")
-        rows = self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE role_id = (SELECT role_id FROM roles WHERE role_name = 'parent')")
+            rows = cursor.fetchall()
         return {str(row['user_id']): row for row in rows}
 
     def get_parent_by_id(self, parent_id: str) -> Optional[Dict]:
         """Get specific parent data from MySQL, all columns."""
-        self.cursor.execute("SELECT user_id, role_id, first_name, middle_name, last_name, birth_date, sex, email, email_verified_at, password, contact_number, address, is_active, remember_token, license_number, years_experience, qualifications, professional_experience, professional_id_path, verification_status, rejection_reason, verified_at, verified_by, account_status, deleted_at, created_at, updated_at FROM users WHERE user_id = %s AND role_id = (SELECT role_id FROM roles WHERE role_name = 'parent')", (parent_id,))
-        row = self.cursor.fetchone()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE user_id = %s AND role_id = (SELECT role_id FROM roles WHERE role_name = 'parent')", (parent_id,))
+            row = cursor.fetchone()
         return row
 
     def get_religion_by_parent(self, parent_id: str) -> Optional[str]:
@@ -129,64 +398,218 @@ class DataManager:
 
     def get_children_data(self) -> Dict:
         """Get all children data from MySQL (patients table), all columns."""
-        self.cursor.execute("SELECT patient_id, first_name, middle_name, last_name, barangay_id, contact_number, age_months, sex, date_of_admission, total_household_adults, total_household_children, total_household_twins, is_4ps_beneficiary, weight_kg, height_cm, weight_for_age, height_for_age, bmi_for_age, breastfeeding, allergies, religion, other_medical_problems, edema, created_at, updated_at, parent_id FROM patients")
-        rows = self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {PATIENT_COLUMNS} FROM patients")
+            rows = cursor.fetchall()
         return {str(row['patient_id']): row for row in rows}
 
     def get_children_by_parent(self, parent_id: str) -> List[Dict]:
         """Get all children for a specific parent from MySQL, all columns."""
-        self.cursor.execute("SELECT patient_id, first_name, middle_name, last_name, barangay_id, contact_number, age_months, sex, date_of_admission, total_household_adults, total_household_children, total_household_twins, is_4ps_beneficiary, weight_kg, height_cm, weight_for_age, height_for_age, bmi_for_age, breastfeeding, allergies, religion, other_medical_problems, edema, created_at, updated_at, parent_id FROM patients WHERE parent_id = %s", (parent_id,))
-        return self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {PATIENT_COLUMNS} FROM patients WHERE parent_id = %s", (parent_id,))
+            return cursor.fetchall()
 
     def get_children_ids_by_parent(self, parent_id: str) -> List[str]:
         """Get all children IDs for a specific parent from MySQL"""
-        self.cursor.execute("SELECT patient_id FROM patients WHERE parent_id = %s", (parent_id,))
-        rows = self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT patient_id FROM patients WHERE parent_id = %s", (parent_id,))
+            rows = cursor.fetchall()
         return [str(row['patient_id']) for row in rows]
 
+    def get_patients_by_barangay(self, barangay_id: int) -> List[Dict]:
+        """Get all patients registered in a barangay, all columns."""
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {PATIENT_COLUMNS} FROM patients WHERE barangay_id = %s ORDER BY patient_id", (barangay_id,))
+            return cursor.fetchall()
+
     def get_patient_by_id(self, patient_id: str) -> Optional[Dict]:
         """Get specific patient data from MySQL, all columns."""
-        self.cursor.execute("SELECT patient_id, first_name, middle_name, last_name, barangay_id, contact_number, age_months, sex, date_of_admission, total_household_adults, total_household_children, total_household_twins, is_4ps_beneficiary, weight_kg, height_cm, weight_for_age, height_for_age, bmi_for_age, breastfeeding, allergies, religion, other_medical_problems, edema, created_at, updated_at, parent_id FROM patients WHERE patient_id = %s", (patient_id,))
-        row = self.cursor.fetchone()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {PATIENT_COLUMNS} FROM patients WHERE patient_id = %s", (patient_id,))
+            row = cursor.fetchone()
         return row
 
     # Meal Plans Management
     def get_meal_plans(self) -> Dict:
         """Get all meal plans from MySQL, all columns."""
-        self.cursor.execute("SELECT plan_id, patient_id, plan_details, generated_at FROM meal_plans")
-        rows = self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {MEAL_PLAN_COLUMNS} FROM meal_plans")
+            rows = self._decode_plan_data(cursor.fetchall())
         return {str(row['plan_id']): row for row in rows}
 
-    def save_meal_plan(self, patient_id: str, meal_plan: str, duration_days: int, parent_id: str) -> str:
-        """Save a new meal plan to MySQL"""
+    @staticmethod
+    def _decode_overview_notes(rows: List[Dict]) -> List[Dict]:
+        """Turn the JSON_ARRAYAGG notes column of overview rows into a list of dicts (and plan_data into the parsed plan)."""
+        for row in rows:
+            notes = row.get('notes')
+            if isinstance(notes, (bytes, bytearray)):
+                notes = notes.decode('utf-8')
+            try:
+                row['notes'] = json.loads(notes) if notes else []
+            except (TypeError, ValueError):
+                row['notes'] = []
+        return DataManager._decode_plan_data(rows)
+
+    def get_meal_plan_overview(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """
+        Get meal plans joined with their child, parent, barangay and aggregated nutritionist notes
+        in a single query. Each row's 'notes' is a list of {assessment_id, nutritionist_id, notes, created_at}.
+        """
+        sql = MEAL_PLAN_OVERVIEW_SQL + " ORDER BY mp.plan_id"
+        params = ()
+        if limit is not None:
+            sql += " LIMIT %s OFFSET %s"
+            params = (int(limit), int(offset))
+        with self._cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return self._decode_overview_notes(rows)
+
+    def list_meal_plans(
+        self,
+        search: str = "",
+        barangay_ids: Optional[List[int]] = None,
+        has_notes: Optional[bool] = None,
+        sort_recent: bool = True,
+        page_size: int = 25,
+        after: Optional[tuple] = None
+    ) -> Dict:
+        """
+        Keyset-paginated meal plan listing with search, barangay and notes filters applied in SQL.
+        Rows have the get_meal_plan_overview shape. Pass the returned 'next_cursor' as `after`
+        to fetch the following page; it is None on the last page.
+        Search matches a plan ID exactly or, word by word, the start of the child's or parent's names.
+        """
+        conditions = []
+        params = []
+        for word in (search or "").split():
+            word_conditions = ["p.first_name LIKE %s", "p.last_name LIKE %s", "u.first_name LIKE %s", "u.last_name LIKE %s"]
+            pattern = word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            word_params = [pattern] * 4
+            if word.isdigit():
+                word_conditions.append("mp.plan_id = %s")
+                word_params.append(int(word))
+            conditions.append("(" + " OR ".join(word_conditions) + ")")
+            params.extend(word_params)
+        if barangay_ids:
+            conditions.append("p.barangay_id IN (" + ", ".join(["%s"] * len(barangay_ids)) + ")")
+            params.extend(barangay_ids)
+        if has_notes is not None:
+            conditions.append(("" if has_notes else "NOT ") + "EXISTS (SELECT 1 FROM assessments a2 WHERE a2.plan_id = mp.plan_id)")
+        filter_sql = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if after:
+            if sort_recent:
+                page_conditions.append("(mp.generated_at < %s OR (mp.generated_at = %s AND mp.plan_id < %s))")
+                page_params.extend([after[0], after[0], after[1]])
+            else:
+                page_conditions.append("mp.plan_id > %s")
+                page_params.append(after[0])
+        page_sql = (" WHERE " + " AND ".join(page_conditions)) if page_conditions else ""
+        order_sql = " ORDER BY mp.generated_at DESC, mp.plan_id DESC" if sort_recent else " ORDER BY mp.plan_id ASC"
+
+        count_sql = """
+            SELECT COUNT(*) AS total
+            FROM meal_plans mp
+            LEFT JOIN patients p ON p.patient_id = mp.patient_id
+            LEFT JOIN users u ON u.user_id = p.parent_id
+        """ + filter_sql
+        with self._cursor() as cursor:
+            cursor.execute(MEAL_PLAN_OVERVIEW_SQL + page_sql + order_sql + " LIMIT %s", page_params + [int(page_size) + 1])
+            rows = cursor.fetchall()
+            cursor.execute(count_sql, params)
+            total = cursor.fetchone()['total']
+
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_cursor = (last['generated_at'], last['plan_id']) if sort_recent else (last['plan_id'],)
+        return {"rows": self._decode_overview_notes(rows), "total": total, "next_cursor": next_cursor}
+
+    def count_meal_plans(self) -> int:
+        """Count all meal plans without loading them."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS total FROM meal_plans")
+            return cursor.fetchone()['total']
+
+    def save_meal_plan(self, patient_id: str, meal_plan: str, duration_days: int, parent_id: str, plan_data: Optional[Dict] = None) -> str:
+        """
+        Save a new meal plan to MySQL: plan_details as given ({"text": ...} JSON) and its parsed form in plan_data
+        (given, e.g. with structured output and reports, or parsed from plan_details) so reads never re-parse it.
+        """
         sql = """
-            INSERT INTO meal_plans (patient_id, plan_details, generated_at)
-            VALUES (%s, %s, %s)
+            INSERT INTO meal_plans (patient_id, plan_details, plan_data, generated_at)
+            VALUES (%s, %s, %s, %s)
         """
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.cursor.execute(sql, (patient_id, meal_plan, now))
-        self.conn.commit()
-        return str(self.cursor.lastrowid)
+        plan_data = json.dumps(plan_data or normalize_plan_details(meal_plan))
+        with self._cursor(commit=True) as cursor:
+            cursor.execute(sql, (patient_id, meal_plan, plan_data, now))
+            return str(cursor.lastrowid)
+
+    def backfill_meal_plan_data(self, batch_size: int = 500) -> int:
+        """Fill plan_data for plans saved before the column existed. Returns the number of rows updated."""
+        updated = 0
+        while True:
+            with self._cursor() as cursor:
+                cursor.execute("SELECT plan_id, plan_details FROM meal_plans WHERE plan_data IS NULL LIMIT %s", (int(batch_size),))
+                rows = cursor.fetchall()
+            if not rows:
+                return updated
+            with self._cursor(commit=True) as cursor:
+                cursor.executemany(
+                    "UPDATE meal_plans SET plan_data = %s WHERE plan_id = %s",
+                    [(json.dumps(normalize_plan_details(row['plan_details'])), row['plan_id']) for row in rows]
+                )
+            updated += len(rows)
+
+    def get_meal_plans_for_audit(self, after_plan_id: int = 0, limit: int = 2000) -> List[Dict]:
+        """Next page of meal plans (plan_id > after_plan_id) with the patient fields the nutrition audit needs."""
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT mp.plan_id, mp.patient_id, mp.plan_details, mp.plan_data, p.age_months, p.breastfeeding "
+                "FROM meal_plans mp LEFT JOIN patients p ON p.patient_id = mp.patient_id "
+                "WHERE mp.plan_id > %s ORDER BY mp.plan_id LIMIT %s",
+                (after_plan_id, int(limit))
+            )
+            return self._decode_plan_data(cursor.fetchall())
 
-    def get_meal_plans_by_patient(self, patient_id: str, months_back: int = 6) -> List[Dict]:
-        """Get meal plans for a patient within the last X months from MySQL, all columns."""
+    def save_meal_plan_nutrition(self, plan_data_by_id: List[tuple]) -> int:
+        """Rewrite plan_data for (plan_id, plan_data) pairs, e.g. after adding a nutrition report. Returns the row count."""
+        if not plan_data_by_id:
+            return 0
+        with self._cursor(commit=True) as cursor:
+            cursor.executemany(
+                "UPDATE meal_plans SET plan_data = %s WHERE plan_id = %s",
+                [(json.dumps(plan_data), plan_id) for plan_id, plan_data in plan_data_by_id]
+            )
+        return len(plan_data_by_id)
+
+    def get_meal_plans_by_patient(self, patient_id: str, months_back: int = 6, columns: Optional[List[str]] = None) -> List[Dict]:
+        """Get meal plans for a patient within the last X months from MySQL (all columns, or the projected ones)."""
         cutoff_date = (datetime.now() - timedelta(days=months_back * 30)).strftime('%Y-%m-%d %H:%M:%S')
-        self.cursor.execute(
-            "SELECT plan_id, patient_id, plan_details, generated_at FROM meal_plans WHERE patient_id = %s AND generated_at >= %s ORDER BY generated_at DESC",
-            (patient_id, cutoff_date)
-        )
-        return self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute(
+                f"SELECT {self.meal_plan_columns(columns)} FROM meal_plans WHERE patient_id = %s AND generated_at >= %s ORDER BY generated_at DESC",
+                (patient_id, cutoff_date)
+            )
+            return self._decode_plan_data(cursor.fetchall())
 
     def get_meal_plans_by_parent(self, parent_id: str) -> List[Dict]:
         """Get all recent meal plans for a parent's children from MySQL, all columns."""
-        self.cursor.execute("SELECT plan_id, patient_id, plan_details, generated_at FROM meal_plans WHERE patient_id IN (SELECT patient_id FROM patients WHERE parent_id = %s) ORDER BY generated_at DESC", (parent_id,))
-        return self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {MEAL_PLAN_COLUMNS} FROM meal_plans WHERE patient_id IN (SELECT patient_id FROM patients WHERE parent_id = %s) ORDER BY generated_at DESC", (parent_id,))
+            return self._decode_plan_data(cursor.fetchall())
 
     # Parent Recipes Management
 
     def get_parent_recipes(self) -> Dict:
-        self.cursor.execute("SELECT id, parent_id, name, description, created_at FROM parent_recipes")
-        rows = self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT id, parent_id, name, description, created_at FROM parent_recipes")
+            rows = cursor.fetchall()
         return {str(row['id']): row for row in rows}
 
     def save_parent_recipe(self, parent_id: str, recipe_name: str, recipe_description: str) -> str:
@@ -195,18 +618,20 @@ class DataManager:
             VALUES (%s, %s, %s, %s)
         """
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.cursor.execute(sql, (parent_id, recipe_name, recipe_description, now))
-        self.conn.commit()
-        return str(self.cursor.lastrowid)
+        with self._cursor(commit=True) as cursor:
+            cursor.execute(sql, (parent_id, recipe_name, recipe_description, now))
+            return str(cursor.lastrowid)
 
     def get_recipes_by_parent(self, parent_id: str) -> List[Dict]:
-        self.cursor.execute("SELECT id, parent_id, name, description, created_at FROM parent_recipes WHERE parent_id = %s", (parent_id,))
-        return self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT id, parent_id, name, description, created_at FROM parent_recipes WHERE parent_id = %s", (parent_id,))
+            return cursor.fetchall()
 
     # Nutritionist Notes Management
     def get_nutritionist_notes(self) -> Dict:
-        self.cursor.execute("SELECT assessment_id, nutritionist_id, patient_id, plan_id, assessment_date, notes, treatment, recovery_status, completed_at, created_at, updated_at FROM assessments")
-        rows = self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT {ASSESSMENT_COLUMNS} FROM assessments")
+            rows = cursor.fetchall()
         return {str(row['assessment_id']): row for row in rows}
 
     def save_nutritionist_note(self, plan_id: str, patient_id: str, nutritionist_id: str, note: str) -> str:
@@ -215,67 +640,136 @@ class DataManager:
         Otherwise, insert a new assessment row.
         """
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        # Check for existing assessment
-        self.cursor.execute(
-            "SELECT assessment_id, notes FROM assessments WHERE plan_id = %s AND patient_id = %s AND nutritionist_id = %s",
-            (plan_id, patient_id, nutritionist_id)
-        )
-        row = self.cursor.fetchone()
-        if row:
-            # Append new note to existing notes (newline separator)
-            existing_notes = row.get('notes') or ''
-            if existing_notes.strip():
-                updated_notes = existing_notes.rstrip() + '\n- ' + note.strip()
-            else:
-                updated_notes = note.strip()
-            self.cursor.execute(
-                "UPDATE assessments SET notes = %s, updated_at = %s WHERE assessment_id = %s",
-                (updated_notes, now, row['assessment_id'])
+        with self._cursor(commit=True) as cursor:
+            # Check for existing assessment (locked so concurrent notes append instead of overwriting)
+            cursor.execute(
+                "SELECT assessment_id, notes FROM assessments WHERE plan_id = %s AND patient_id = %s AND nutritionist_id = %s FOR UPDATE",
+                (plan_id, patient_id, nutritionist_id)
             )
-            self.conn.commit()
-            return str(row['assessment_id'])
-        else:
-            # Insert new row
-            sql = """
-                INSERT INTO assessments (plan_id, patient_id, nutritionist_id, notes, assessment_date, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            self.cursor.execute(sql, (plan_id, patient_id, nutritionist_id, note.strip(), now, now))
-            self.conn.commit()
-            return str(self.cursor.lastrowid)
+            row = cursor.fetchone()
+            if row:
+                # Append new note to existing notes (newline separator)
+                existing_notes = row.get('notes') or ''
+                if existing_notes.strip():
+                    updated_notes = existing_notes.rstrip() + '\n- ' + note.strip()
+                else:
+                    updated_notes = note.strip()
+                cursor.execute(
+                    "UPDATE assessments SET notes = %s, updated_at = %s WHERE assessment_id = %s",
+                    (updated_notes, now, row['assessment_id'])
+                )
+                assessment_id = row['assessment_id']
+            else:
+                # Insert new row
+                sql = """
+                    INSERT INTO assessments (plan_id, patient_id, nutritionist_id, notes, assessment_date, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """
+                cursor.execute(sql, (plan_id, patient_id, nutritionist_id, note.strip(), now, now))
+                assessment_id = cursor.lastrowid
+        generation_cache.invalidate_patient(patient_id)
+        return str(assessment_id)
 
     def get_notes_for_meal_plan(self, plan_id: str) -> List[Dict]:
-        self.cursor.execute("SELECT assessment_id, nutritionist_id, patient_id, plan_id, notes, created_at FROM assessments WHERE plan_id = %s", (plan_id,))
-        return self.cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT assessment_id, nutritionist_id, patient_id, plan_id, notes, created_at FROM assessments WHERE plan_id = %s", (plan_id,))
+            return cursor.fetchall()
 
     # Knowledge Base Management
-    def get_knowledge_base(self) -> Dict:
-        """Get all knowledge base entries with admin full names who uploaded them."""
-        sql = """
-            SELECT 
-                kb.kb_id, 
-                kb.user_id,
-                kb.ai_summary, 
-                kb.pdf_name, 
-                kb.pdf_text, 
-                kb.added_at,
-                CONCAT(u.first_name, 
-                       CASE 
-                           WHEN u.middle_name IS NOT NULL AND u.middle_name != '' 
-                           THEN CONCAT(' ', u.middle_name, ' ') 
-                           ELSE ' ' 
-                       END, 
-                       u.last_name) as uploaded_by_name
-            FROM knowledge_base kb
-            LEFT JOIN users u ON kb.user_id = u.user_id
-            ORDER BY kb.added_at DESC
+    def get_knowledge_base(self, include_pdf_text: bool = False) -> Dict:
         """
-        self.cursor.execute(sql)
-        rows = self.cursor.fetchall()
+        Get all knowledge base entries with admin full names who uploaded them.
+        The raw pdf_text is left out unless include_pdf_text is set; use get_knowledge_base_text for one entry.
+        """
+        sql = KNOWLEDGE_BASE_FULL_SQL if include_pdf_text else KNOWLEDGE_BASE_SQL
+        with self._cursor() as cursor:
+            cursor.execute(sql)
+            rows = cursor.fetchall()
         return {str(row['kb_id']): row for row in rows}
 
+    def get_knowledge_base_text(self, kb_id) -> Optional[Dict]:
+        """Load the full extracted PDF text of one knowledge base entry."""
+        with self._cursor() as cursor:
+            cursor.execute(KNOWLEDGE_BASE_TEXT_SQL, (kb_id,))
+            return cursor.fetchone()
+
+    def _knowledge_base_signature(self):
+        with self._cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS n, COALESCE(MAX(kb_id), 0) AS max_id FROM knowledge_base")
+            row = cursor.fetchone()
+        return (int(row['n']), int(row['max_id']))
+
+    @staticmethod
+    def _insert_knowledge_chunks(cursor, kb_id, ai_summary_text: str) -> List:
+        """Write the chunks of one entry to knowledge_chunks; returns (chunk_id, term_freqs) pairs."""
+        inserted = []
+        for chunk in build_chunks(ai_summary_text):
+            cursor.execute(
+                "INSERT INTO knowledge_chunks (kb_id, chunk_index, chunk_text, token_count, term_freqs) VALUES (%s, %s, %s, %s, %s)",
+                (kb_id, chunk['chunk_index'], chunk['chunk_text'], chunk['token_count'], json.dumps(chunk['term_freqs']))
+            )
+            inserted.append((cursor.lastrowid, chunk['term_freqs']))
+        return inserted
+
+    def _backfill_knowledge_chunks(self):
+        """Chunk knowledge base entries saved before knowledge_chunks existed."""
+        with self._cursor(commit=True) as cursor:
+            cursor.execute("""
+                SELECT kb.kb_id, kb.ai_summary FROM knowledge_base kb
+                WHERE NOT EXISTS (SELECT 1 FROM knowledge_chunks kc WHERE kc.kb_id = kb.kb_id)
+            """)
+            for row in cursor.fetchall():
+                self._insert_knowledge_chunks(cursor, row['kb_id'], row.get('ai_summary') or '')
+
+    def _ensure_kb_index(self):
+        """
+        Build the knowledge base index on first use and rebuild it when another process
+        has changed the table (checked at most every KB_INDEX_REFRESH_SECONDS).
+        """
+        now = time.monotonic()
+        if self.kb_index.loaded and now - self._kb_checked_at < self.kb_index_refresh_seconds:
+            return
+        with self._kb_index_lock:
+            if self.kb_index.loaded and now - self._kb_checked_at < self.kb_index_refresh_seconds:
+                return
+            signature = self._knowledge_base_signature()
+            if not self.kb_index.loaded or signature != self._kb_signature:
+                self._backfill_knowledge_chunks()
+                # Term statistics only; chunk text is read for the hits in search_knowledge_base
+                with self._cursor() as cursor:
+                    cursor.execute("SELECT chunk_id, kb_id, term_freqs FROM knowledge_chunks ORDER BY kb_id, chunk_index")
+                    rows = cursor.fetchall()
+                by_kb = {}
+                for row in rows:
+                    term_freqs = row['term_freqs']
+                    if isinstance(term_freqs, (str, bytes)):
+                        term_freqs = json.loads(term_freqs)
+                    by_kb.setdefault(row['kb_id'], []).append((row['chunk_id'], term_freqs))
+                self.kb_index.clear()
+                for kb_id, chunks in by_kb.items():
+                    self.kb_index.add(kb_id, chunks)
+                self.kb_index.loaded = True
+                self._kb_signature = signature
+            self._kb_checked_at = time.monotonic()
+
+    def get_knowledge_chunks(self, chunk_ids: List[int]) -> List[Dict]:
+        """Fetch chunk rows by id, returned in the order of chunk_ids."""
+        if not chunk_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(chunk_ids))
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT chunk_id, kb_id, chunk_index, chunk_text, token_count FROM knowledge_chunks WHERE chunk_id IN ({placeholders})", tuple(chunk_ids))
+            rows = {row['chunk_id']: row for row in cursor.fetchall()}
+        return [rows[chunk_id] for chunk_id in chunk_ids if chunk_id in rows]
+
+    def search_knowledge_base(self, query: str, k: int = 4) -> List[str]:
+        """Top-k knowledge base chunks for a query, ranked by BM25."""
+        self._ensure_kb_index()
+        hits = self.kb_index.search(query, k)
+        return [row['chunk_text'] for row in self.get_knowledge_chunks([chunk_id for chunk_id, _ in hits])]
+
     def save_knowledge_base(self, ai_summary, pdf_name, pdf_text=None, uploaded_by=None, uploaded_by_id=None):
-        """Save knowledge base entry with user_id."""
+        """Save knowledge base entry with user_id, and its retrieval chunks in the same transaction."""
         sql = "INSERT INTO knowledge_base (user_id, ai_summary, pdf_name, pdf_text, added_at) VALUES (%s, %s, %s, %s, %s)"
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         # Convert ai_summary to plain text if it's a list
@@ -284,21 +778,77 @@ class DataManager:
         else:
             ai_summary_text = str(ai_summary) if ai_summary else ""
         
-        self.cursor.execute(sql, (
-            uploaded_by_id,  # Store the user_id of the admin who uploaded
-            ai_summary_text,
-            pdf_name,
-            pdf_text,
-            now
-        ))
-        self.conn.commit()
-        return str(self.cursor.lastrowid)
+        with self._cursor(commit=True) as cursor:
+            cursor.execute(sql, (
+                uploaded_by_id,  # Store the user_id of the admin who uploaded
+                ai_summary_text,
+                pdf_name,
+                pdf_text,
+                now
+            ))
+            kb_id = cursor.lastrowid
+            chunks = self._insert_knowledge_chunks(cursor, kb_id, ai_summary_text)
+        if self.kb_index.loaded:
+            with self._kb_index_lock:
+                self.kb_index.add(kb_id, chunks)
+                if self._kb_signature is not None:
+                    self._kb_signature = (self._kb_signature[0] + 1, max(self._kb_signature[1], int(kb_id)))
+        return str(kb_id)
 
     def delete_knowledge_base_entry(self, kb_id):
-        """Delete a knowledge base entry by its ID"""
+        """Delete a knowledge base entry and its chunks by its ID"""
         sql = "DELETE FROM knowledge_base WHERE kb_id = %s"
-        self.cursor.execute(sql, (kb_id,))
-        self.conn.commit()
+        with self._cursor(commit=True) as cursor:
+            cursor.execute("DELETE FROM knowledge_chunks WHERE kb_id = %s", (kb_id,))
+            cursor.execute(sql, (kb_id,))
+            deleted = cursor.rowcount
+        if self.kb_index.loaded and deleted:
+            with self._kb_index_lock:
+                self.kb_index.remove(kb_id)
+                if self._kb_signature is not None:
+                    self._kb_signature = (self._kb_signature[0] - deleted, self._kb_signature[1])
         return True
 
+    # Admin Users & Audit Logs
+    def get_admin_users(self) -> List[Dict]:
+        """Get all admin accounts as user_id and full_name."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT user_id, CONCAT(first_name, ' ', last_name) as full_name FROM users WHERE role_id = (SELECT role_id FROM roles WHERE role_name = 'admin') ORDER BY user_id")
+            return cursor.fetchall()
+
+    def get_staff_users(self) -> List[Dict]:
+        """Get all nutritionist and admin accounts with their role names."""
+        with self._cursor() as cursor:
+            cursor.execute("""
+                SELECT u.user_id, CONCAT(u.first_name, ' ', u.last_name) as full_name, r.role_name 
+                FROM users u 
+                JOIN roles r ON u.role_id = r.role_id 
+                WHERE r.role_name IN ('nutritionist', 'admin')
+                ORDER BY u.user_id
+            """)
+            return cursor.fetchall()
+
+    def get_audit_logs(self, user_id: str) -> List[Dict]:
+        """Get audit log rows for a user, most recent first."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT log_id, log_timestamp, action, description FROM audit_logs WHERE user_id = %s ORDER BY log_timestamp DESC", (user_id,))
+            return cursor.fetchall()
+
+    def save_audit_log(self, action: str, description: str, user_id: str) -> str:
+        """Insert an audit log row."""
+        sql = "INSERT INTO audit_logs (log_timestamp, action, description, user_id) VALUES (%s, %s, %s, %s)"
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._cursor(commit=True) as cursor:
+            cursor.execute(sql, (now, action, description, user_id))
+            return str(cursor.lastrowid)
+
+def _foods_changed_elsewhere(foods):
+    """Another process edited the foods table: drop generations and indexes built from the old rows."""
+    generation_cache.invalidate_foods()
+    food_matcher.reload(foods)
+    exclusion_index.reload(foods)
+
+
+food_catalog.on_reload(_foods_changed_elsewhere)
+
 data_manager = DataManager()
\ No newline at end of file
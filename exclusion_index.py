@@ -0,0 +1,233 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from food_selector import (
+    ALLERGEN_SYNONYMS,
+    CHOKING_HAZARDS,
+    RELIGION_EXCLUSIONS,
+    _food_text,
+    _split_terms,
+    _terms_pattern,
+    allergen_keys,
+    child_age_months,
+    child_exclusions,
+)
+
+logger = logging.getLogger(__name__)
+
+AGE_EXCLUSIONS = {
+    "choking": CHOKING_HAZARDS,
+    "honey": ["honey", "pulot"],
+}
+# Distinct allergy/religion/age combinations whose food_id sets are kept
+MAX_CACHED_REQUESTS = 256
+
+
+def exclusion_categories() -> Dict[str, List[str]]:
+    """Category name -> food name terms, from the allergen, religion and age tables in food_selector."""
+    categories = {f"allergen:{key}": terms for key, terms in ALLERGEN_SYNONYMS.items()}
+    categories.update({f"religion:{key}": terms for key, terms in RELIGION_EXCLUSIONS.items()})
+    categories.update({f"age:{key}": terms for key, terms in AGE_EXCLUSIONS.items()})
+    return categories
+
+
+def _tag_text(food: Dict) -> str:
+    """nutrition_tags that can mark an allergen; "gluten-free"-style tags are ignored."""
+    tags = [tag.strip() for tag in (food.get('nutrition_tags') or '').lower().split(',')]
+    return " ".join(tag for tag in tags if tag and "free" not in tag)
+
+
+class Exclusions:
+    """The foods one request must not use: a food_id set from the index, plus a term fallback for unindexed rows."""
+    def __init__(self, categories: Tuple[str, ...], food_ids: FrozenSet[int], known_ids: FrozenSet[int], terms: List[str], reasons: Dict[int, str]):
+        self.categories = categories
+        self.food_ids = food_ids
+        self.terms = terms
+        self._known_ids = known_ids
+        self._reasons = reasons
+        self._fallback_re = _terms_pattern(terms)
+
+    def excludes(self, food: Dict) -> bool:
+        food_id = food.get('food_id')
+        if food_id in self._known_ids:
+            return food_id in self.food_ids
+        # A row the index has not seen (added since it was built): check its names directly
+        return bool(self._fallback_re and self._fallback_re.search(_food_text(food)))
+
+    def reason(self, food_id: int) -> Optional[str]:
+        """The category that excludes food_id, e.g. "allergen:shellfish"."""
+        return self._reasons.get(food_id)
+
+    def __len__(self):
+        return len(self.food_ids)
+
+
+class ExclusionIndex:
+    """
+    Allergen, religious-restriction and age-hazard categories mapped to bitsets over the foods table
+    (one packed bit per food, built once from names, alternate names and nutrition_tags).
+    for_patient() turns a child's free-text allergies and religion into categories and ORs their
+    bitsets, so food lists and plan validation test membership instead of matching terms per row.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._categories = exclusion_categories()
+        self._patterns = {name: _terms_pattern(terms) for name, terms in self._categories.items()}
+        # nutrition_tags only mark allergens and religious restrictions, by whole word ("egg" in "contains egg",
+        # not in "veggies"); age hazards describe the food itself, so they are matched on names only
+        self._tag_patterns = {
+            name: _terms_pattern(terms + [name.split(":", 1)[1]]) if name.startswith("allergen:") else _terms_pattern(terms)
+            for name, terms in self._categories.items() if not name.startswith("age:")
+        }
+        self._names = list(self._categories)
+        self._ids: List[int] = []
+        self._position: Dict[int, int] = {}
+        self._texts: List[Tuple[str, str]] = []
+        self._bits = np.zeros((len(self._names), 0), dtype=np.uint8)
+        self._adhoc: Dict[str, np.ndarray] = {}
+        self._requests: "OrderedDict[tuple, Exclusions]" = OrderedDict()
+        self._known_ids: FrozenSet[int] = frozenset()
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def _food_categories(self, name_text: str, tag_text: str) -> List[int]:
+        rows = []
+        for row, name in enumerate(self._names):
+            tag_pattern = self._tag_patterns.get(name)
+            if self._patterns[name].search(name_text) or (tag_pattern and tag_pattern.search(tag_text)):
+                rows.append(row)
+        return rows
+
+    def _set_column(self, position: int, rows: List[int]):
+        byte, mask = position >> 3, np.uint8(0x80 >> (position & 7))
+        self._bits[:, byte] &= ~mask
+        for row in rows:
+            self._bits[row, byte] |= mask
+
+    def build(self, foods: List[Dict]):
+        with self._lock:
+            indexed = [food for food in foods if food.get('food_id') is not None]
+            self._ids = [int(food['food_id']) for food in indexed]
+            self._position = {food_id: i for i, food_id in enumerate(self._ids)}
+            self._texts = [(_food_text(food), _tag_text(food)) for food in indexed]
+            matrix = np.zeros((len(self._names), len(indexed)), dtype=bool)
+            for position, (name_text, tag_text) in enumerate(self._texts):
+                matrix[self._food_categories(name_text, tag_text), position] = True
+            self._bits = np.packbits(matrix, axis=1)
+            self._invalidate()
+            self._loaded = True
+            logger.info(
+                "Exclusion index: %d foods, %d categories, %d exclusions",
+                len(self._ids), len(self._names), int(matrix.sum())
+            )
+
+    def reload(self, foods: List[Dict]):
+        """Rebuild from a fresh foods list if the index is in use."""
+        if self._loaded:
+            self.build(foods)
+
+    def _invalidate(self):
+        self._adhoc.clear()
+        self._requests.clear()
+        self._known_ids = frozenset(self._ids)
+
+    def update_food(self, food_id, food_data: Dict):
+        """Recompute one food's bits after DataManager.update_food (foods the index has not seen are appended)."""
+        with self._lock:
+            if not self._loaded:
+                return
+            food_id = int(food_id)
+            position = self._position.get(food_id)
+            if position is None:
+                position = len(self._ids)
+                self._ids.append(food_id)
+                self._position[food_id] = position
+                self._texts.append(("", ""))
+                if position >> 3 >= self._bits.shape[1]:
+                    self._bits = np.hstack([self._bits, np.zeros((len(self._names), 1), dtype=np.uint8)])
+            food = {**food_data, 'food_id': food_id}
+            self._texts[position] = (_food_text(food), _tag_text(food))
+            self._set_column(position, self._food_categories(*self._texts[position]))
+            self._invalidate()
+
+    def categories_for(self, patient_data: Dict, religion: Optional[str] = None) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """(categories, ad-hoc terms) for a child, following food_selector.child_exclusions."""
+        categories, adhoc = set(), set()
+        for allergy in _split_terms(patient_data.get('allergies')):
+            matched = allergen_keys(allergy)
+            if matched:
+                categories.update(f"allergen:{key}" for key in matched)
+            else:
+                # Unknown allergen: foods that name it directly
+                adhoc.add(allergy)
+        religion_val = (patient_data.get('religion') or religion or '').lower()
+        categories.update(f"religion:{key}" for key in RELIGION_EXCLUSIONS if key in religion_val)
+        age_months = child_age_months(patient_data)
+        if age_months < 24:
+            categories.add("age:choking")
+        if age_months < 12:
+            categories.add("age:honey")
+        return tuple(sorted(categories)), tuple(sorted(adhoc))
+
+    def _adhoc_bits(self, term: str) -> np.ndarray:
+        bits = self._adhoc.get(term)
+        if bits is None:
+            pattern = _terms_pattern([term])
+            column = np.fromiter((bool(pattern.search(name_text)) for name_text, _ in self._texts), dtype=bool, count=len(self._texts))
+            bits = self._adhoc[term] = np.packbits(column)
+        return bits
+
+    def for_patient(self, patient_data: Dict, religion: Optional[str] = None, foods: Optional[List[Dict]] = None) -> Exclusions:
+        """Exclusions for one child; the index is built from foods (or the foods table) on first use."""
+        with self._lock:
+            if not self._loaded:
+                if foods is None:
+                    from data_manager import data_manager
+                    foods = data_manager.get_foods_data()
+                self.build(foods)
+            categories, adhoc = self.categories_for(patient_data, religion)
+            key = (categories, adhoc)
+            cached = self._requests.get(key)
+            if cached is not None:
+                self._requests.move_to_end(key)
+                return cached
+            rows = [self._bits[self._names.index(name)] for name in categories] + [self._adhoc_bits(term) for term in adhoc]
+            if rows:
+                combined = np.bitwise_or.reduce(np.vstack(rows), axis=0)
+                mask = np.unpackbits(combined, count=len(self._ids)).astype(bool)
+            else:
+                mask = np.zeros(len(self._ids), dtype=bool)
+            food_ids = frozenset(np.asarray(self._ids)[mask].tolist())
+            reasons = {}
+            for name in categories:
+                column = np.unpackbits(self._bits[self._names.index(name)], count=len(self._ids)).astype(bool)
+                for food_id in np.asarray(self._ids)[column & mask].tolist():
+                    reasons.setdefault(food_id, name)
+            for term in adhoc:
+                column = np.unpackbits(self._adhoc_bits(term), count=len(self._ids)).astype(bool)
+                for food_id in np.asarray(self._ids)[column].tolist():
+                    reasons.setdefault(food_id, f"allergen:{term}")
+            exclusions = Exclusions(categories + adhoc, food_ids, self._known_ids, child_exclusions(patient_data, religion), reasons)
+            self._requests[key] = exclusions
+            if len(self._requests) > MAX_CACHED_REQUESTS:
+                self._requests.popitem(last=False)
+            return exclusions
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {}
+            for row, name in enumerate(self._names):
+                count = int(np.unpackbits(self._bits[row], count=len(self._ids)).sum()) if self._ids else 0
+                if count:
+                    counts[name] = count
+            return {"foods": len(self._ids), "cached_requests": len(self._requests), "foods_per_category": counts}
+
+
+exclusion_index = ExclusionIndex()
@@ -1,14 +1,75 @@
 
+import json
+import re
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from nutrition_ai import ChildNutritionAI
 from data_manager import data_manager
-from nutrition_chain import get_meal_plan_with_langchain, generate_patient_assessment
+from async_data_manager import async_data_manager
+from llm_cache import generation_cache, llm_flights
+from llm_registry import llm_registry
+from prompt_budget import prompt_metrics
+from rate_limiter import CircuitOpenError, groq_limiter, is_outage, retry_after_seconds
+from job_queue import job_queue, job_workers
+from batch_generation import batch_jobs, resolve_patient_ids, DEFAULT_CONCURRENCY
+from plan_nutrition import audit_meal_plans
+from exclusion_index import exclusion_index
+from food_catalog import food_catalog
+from food_search import food_search, DEFAULT_PER_PAGE
+from nutrition_chain import generate_meal_plan_pipeline, generate_structured_meal_plan, generate_draft_meal_plan, MEAL_PLAN_OPTIMIZER_FALLBACK, generate_patient_assessment, stream_and_save_meal_plan, stream_patient_assessment, parse_assessment_sections, meal_plan_flights
 from typing import List, Optional
 
 
 app = FastAPI(title="Nutritionist LLM API", description="API for LLM-powered nutrition functions", version="1.0")
-nutrition_ai = ChildNutritionAI()
+nutrition_ai = llm_registry.nutrition_ai()
+
+def clean_meal_plan_text(text):
+    """Flatten markdown/ALL-CAPS sections of a generated meal plan into "SECTION: content" runs."""
+    # Remove markdown headers and join sections as a single line
+    lines = text.splitlines()
+    result = []
+    current_section = None
+    section_content = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        # Detect section headers (markdown or all-caps with colon)
+        header_match = re.match(r'^(#+)\s*(.*)', line)
+        alt_header_match = re.match(r'^([A-Z][A-Z\- ]+):$', line)
+        if header_match:
+            # Save previous section
+            if current_section:
+                result.append(f"{current_section}: {' '.join(section_content).strip()}")
+            current_section = header_match.group(2).strip().upper()
+            section_content = []
+        elif alt_header_match:
+            if current_section:
+                result.append(f"{current_section}: {' '.join(section_content).strip()}")
+            current_section = alt_header_match.group(1).strip().upper()
+            section_content = []
+        else:
+            section_content.append(line)
+    # Add last section
+    if current_section:
+        result.append(f"{current_section}: {' '.join(section_content).strip()}")
+    # Join all sections with a space, no embedded \n
+    return ' '.join(result)
+
+def sse_event(event: str, data) -> str:
+    """One Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.on_event("startup")
+def start_job_workers():
+    job_workers.start()
+
+@app.on_event("shutdown")
+async def close_async_pool():
+    job_workers.stop()
+    await async_data_manager.close()
+    llm_registry.close()
 
 class NutritionAnalysis(BaseModel):
     patient_id: int
@@ -16,6 +77,8 @@ class NutritionAnalysis(BaseModel):
 class MealPlanRequest(BaseModel):
     patient_id: int
     available_foods: Optional[str] = None
+    # Schema-constrained JSON generation: the response also carries days -> meals -> food ids, portions, kcal
+    structured: Optional[bool] = False
 
 class NutritionQuestionRequest(BaseModel):
     question: str
@@ -32,6 +95,8 @@ class SaveMealPlanRequest(BaseModel):
 class MealPlansByChildRequest(BaseModel):
     patient_id: int
     most_recent: Optional[bool] = False
+    # Optional projection, e.g. ["plan_id", "generated_at"] to skip the plan text
+    columns: Optional[List[str]] = None
 
 class SaveAdminLogRequest(BaseModel):
     action: str
@@ -40,20 +105,39 @@ class SaveAdminLogRequest(BaseModel):
 class AssessmentRequest(BaseModel):
     patient_id: int
 
+class BatchMealPlanRequest(BaseModel):
+    barangay_id: Optional[int] = None
+    patient_ids: Optional[List[int]] = None
+    available_foods: Optional[str] = None
+    concurrency: Optional[int] = None
+    structured: Optional[bool] = False
+
+def groq_http_error(error: Exception) -> Optional[HTTPException]:
+    """503 (circuit open, Groq down) or 429 (still throttled after retries) with Retry-After; None for other errors."""
+    if isinstance(error, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(int(error.retry_after))})
+    if getattr(error, 'status_code', None) == 429:
+        retry_after = retry_after_seconds(error)
+        headers = {"Retry-After": str(max(int(retry_after), 1))} if retry_after is not None else None
+        return HTTPException(status_code=429, detail="Groq rate limit reached, retry later", headers=headers)
+    if is_outage(error):
+        return HTTPException(status_code=503, detail=f"Groq is unavailable: {error}", headers={"Retry-After": str(int(groq_limiter.cooldown_seconds))})
+    return None
+
 @app.post("/nutrition/analysis")
-def nutrition_analysis(request: NutritionAnalysis):
+async def nutrition_analysis(request: NutritionAnalysis):
     """Run nutrition analysis for a patient and return the result."""
     try:
-        patient_data = data_manager.get_patient_by_id(request.patient_id)
+        patient_data = await async_data_manager.get_patient_by_id(request.patient_id)
         if not patient_data:
             raise HTTPException(status_code=404, detail="Patient not found")
 
-        from nutrition_ai import ChildNutritionAI
-        nutrition_ai = ChildNutritionAI()
         # Get latest assessment for notes and treatment
-        assessments = data_manager.get_nutritionist_notes_by_patient(request.patient_id)
+        assessments = await async_data_manager.get_nutritionist_notes_by_patient(request.patient_id)
         latest_assessment = assessments[0] if assessments else {}
-        analysis_result = nutrition_ai.analyze_child_nutrition(
+        # The LLM call is blocking, so keep it off the event loop
+        analysis_result = await run_in_threadpool(
+            nutrition_ai.analyze_child_nutrition,
             patient_id=request.patient_id,
             age_in_months=patient_data.get('age_months'),
             allergies=patient_data.get('allergies'),
@@ -93,19 +177,21 @@ def nutrition_analysis(request: NutritionAnalysis):
 
         parsed = parse_nutrition_analysis(analysis_result)
         return {"patient_id": request.patient_id, "nutrition_analysis": parsed}
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise groq_http_error(e) or HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate_meal_plan")
-def generate_meal_plan(request: MealPlanRequest):
+async def generate_meal_plan(request: MealPlanRequest):
     """Generate a meal plan for a patient using LangChain prompt template, using nutrition analysis for guidance, but only return the meal plan."""
     try:
         # Fetch patient data for context
-        patient_data = data_manager.get_patient_by_id(request.patient_id)
+        patient_data = await async_data_manager.get_patient_by_id(request.patient_id)
         if not patient_data:
             raise HTTPException(status_code=404, detail="Patient not found")
         # Extract all relevant info from patient and parent
-        name = data_manager.format_full_name(
+        name = async_data_manager.format_full_name(
             patient_data.get('first_name', ''),
             patient_data.get('middle_name', ''),
             patient_data.get('last_name', '')
@@ -115,82 +201,123 @@ def generate_meal_plan(request: MealPlanRequest):
         height_cm = patient_data.get('height_cm')
         other_medical_problems = patient_data.get('other_medical_problems')
         parent_id = patient_data.get('parent_id')
-        religion = data_manager.get_religion_by_parent(parent_id) if parent_id else None
-
-        # Nutrition analysis (LLM) for internal use only
-        if age_months is not None:
-            _ = nutrition_ai.analyze_child_nutrition(
-                patient_id=request.patient_id,
-                age_in_months=age_months,
-                allergies=patient_data.get('allergies'),
-                other_medical_problems=other_medical_problems,
-                parent_id=parent_id,
-                notes=None,
-                treatment=None,
-                sex=patient_data.get('sex', ''),
-                weight_for_age=patient_data.get('weight_for_age', ''),
-                height_for_age=patient_data.get('height_for_age', ''),
-                bmi_for_age=patient_data.get('bmi_for_age', ''),
-                breastfeeding=patient_data.get('breastfeeding', ''),
-                religion=religion if religion else ''
-            )
-        # Generate meal plan (LangChain) with all context
-        meal_plan_text = get_meal_plan_with_langchain(
+        religion = await async_data_manager.get_religion_by_parent(parent_id) if parent_id else None
+
+        if request.structured:
+            try:
+                result = await run_in_threadpool(
+                    generate_structured_meal_plan,
+                    patient_id=request.patient_id,
+                    available_ingredients=request.available_foods,
+                    religion=religion,
+                    nutrition_ai=nutrition_ai,
+                    patient_data=patient_data
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=502, detail=str(e))
+            return {"meal_plan": clean_meal_plan_text(result["meal_plan"]), "structured": result["structured"]}
+
+        # Analysis -> meal plan pipeline: the analysis LLM call runs once and feeds the plan prompt
+        pipeline_result = await run_in_threadpool(
+            generate_meal_plan_pipeline,
             patient_id=request.patient_id,
-            available_ingredients=request.available_foods
+            available_ingredients=request.available_foods,
+            religion=religion,
+            nutrition_ai=nutrition_ai
         )
-
-        def clean_meal_plan_text(text):
-            import re
-            # Remove markdown headers and join sections as a single line
-            lines = text.splitlines()
-            result = []
-            current_section = None
-            section_content = []
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                # Detect section headers (markdown or all-caps with colon)
-                header_match = re.match(r'^(#+)\s*(.*)', line)
-                alt_header_match = re.match(r'^([A-Z][A-Z\- ]+):$', line)
-                if header_match:
-                    # Save previous section
-                    if current_section:
-                        result.append(f"{current_section}: {' '.join(section_content).strip()}")
-                    current_section = header_match.group(2).strip().upper()
-                    section_content = []
-                elif alt_header_match:
-                    if current_section:
-                        result.append(f"{current_section}: {' '.join(section_content).strip()}")
-                    current_section = alt_header_match.group(1).strip().upper()
-                    section_content = []
-                else:
-                    section_content.append(line)
-            # Add last section
-            if current_section:
-                result.append(f"{current_section}: {' '.join(section_content).strip()}")
-            # Join all sections with a space, no embedded \n
-            return ' '.join(result)
+        meal_plan_text = pipeline_result["meal_plan"]
 
         cleaned_meal_plan = clean_meal_plan_text(meal_plan_text)
         return {
-            "meal_plan": cleaned_meal_plan
+            "meal_plan": cleaned_meal_plan,
+            "validation": pipeline_result.get("validation")
         }
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        if MEAL_PLAN_OPTIMIZER_FALLBACK:
+            try:
+                draft = await run_in_threadpool(
+                    generate_draft_meal_plan,
+                    request.patient_id,
+                    available_ingredients=request.available_foods,
+                    religion=religion,
+                    patient_data=patient_data
+                )
+                return {"meal_plan": clean_meal_plan_text(draft["meal_plan"]), "structured": draft["structured"], "source": draft["source"]}
+            except ValueError:
+                pass
+        raise groq_http_error(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise groq_http_error(e) or HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate_meal_plan/draft")
+async def generate_meal_plan_draft(request: MealPlanRequest, save: bool = False):
+    """
+    Instant meal plan from the local optimizer (no LLM): 7 days x 4 meals from the foods table,
+    sized to the child's age-based kcal target with allergens and religious restrictions excluded.
+    """
+    patient_data = await async_data_manager.get_patient_by_id(request.patient_id)
+    if not patient_data:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    parent_id = patient_data.get('parent_id')
+    religion = await async_data_manager.get_religion_by_parent(parent_id) if parent_id else None
+    try:
+        draft = await run_in_threadpool(
+            generate_draft_meal_plan,
+            request.patient_id,
+            available_ingredients=request.available_foods,
+            religion=religion,
+            patient_data=patient_data,
+            save=save
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {**draft, "meal_plan": clean_meal_plan_text(draft["meal_plan"])}
+
+@app.post("/generate_meal_plan/stream")
+async def generate_meal_plan_stream(request: MealPlanRequest):
+    """
+    Stream the meal plan as Server-Sent Events: "token" frames with text chunks while Groq generates,
+    then one "done" frame with the cleaned plan and the plan_id it was saved under (or an "error" frame).
+    """
+    patient_data = await async_data_manager.get_patient_by_id(request.patient_id)
+    if not patient_data:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    parent_id = patient_data.get('parent_id')
+    religion = await async_data_manager.get_religion_by_parent(parent_id) if parent_id else None
+
+    # Plain generator: Starlette iterates it in the threadpool, so the blocking Groq stream stays off the event loop
+    def events():
+        # Saved once the full plan has arrived; identical concurrent requests share the stream and plan_id
+        outcome = {}
+        try:
+            for chunk in stream_and_save_meal_plan(
+                request.patient_id,
+                available_ingredients=request.available_foods,
+                religion=religion,
+                nutrition_ai=nutrition_ai,
+                result=outcome
+            ):
+                yield sse_event("token", chunk)
+            done = outcome["result"]
+            yield sse_event("done", {"plan_id": done["plan_id"], "meal_plan": clean_meal_plan_text(done["meal_plan"]), "shared": outcome["shared"]})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/assessment")
-def generate_assessment(request: AssessmentRequest):
+async def generate_assessment(request: AssessmentRequest):
     """Generate a comprehensive pediatric dietary assessment for a patient."""
     try:
         # Fetch patient data
-        patient_data = data_manager.get_patient_by_id(request.patient_id)
+        patient_data = await async_data_manager.get_patient_by_id(request.patient_id)
         if not patient_data:
             raise HTTPException(status_code=404, detail="Patient not found")
         
         # Generate assessment using LangChain
-        assessment = generate_patient_assessment(patient_id=request.patient_id)
+        assessment = await run_in_threadpool(generate_patient_assessment, patient_id=request.patient_id)
         
         return {
             "patient_id": request.patient_id,
@@ -199,66 +326,69 @@ def generate_assessment(request: AssessmentRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/assessment/stream")
+async def generate_assessment_stream(request: AssessmentRequest):
+    """Stream the assessment as Server-Sent Events: "token" frames, then "done" with the parsed sections."""
+    patient_data = await async_data_manager.get_patient_by_id(request.patient_id)
+    if not patient_data:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    def events():
+        parts = []
+        try:
+            for chunk in stream_patient_assessment(request.patient_id):
+                parts.append(chunk)
+                yield sse_event("token", chunk)
+            yield sse_event("done", {"patient_id": request.patient_id, "assessment": parse_assessment_sections("".join(parts))})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Combined endpoint: returns all foods
 @app.post("/get_foods_data")
-def get_foods_data():
+async def get_foods_data():
     try:
-        foods = data_manager.get_foods_data()
+        foods = await async_data_manager.get_foods_data()
         return {"foods": foods}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class SearchFoodsRequest(BaseModel):
+    query: Optional[str] = ""
+    page: Optional[int] = 1
+    per_page: Optional[int] = DEFAULT_PER_PAGE
+
+@app.post("/search_foods")
+async def search_foods(request: SearchFoodsRequest):
+    """Ranked, paginated food search over names, alternate names and tags (prefix and typo tolerant)."""
+    try:
+        return await async_data_manager.search_foods_page(request.query or "", request.page or 1, request.per_page or DEFAULT_PER_PAGE)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/get_children_by_parent")
-def get_children_by_parent(request: ChildrenByParentRequest):
+async def get_children_by_parent(request: ChildrenByParentRequest):
     try:
-        children = data_manager.get_children_by_parent(request.parent_id)
+        children = await async_data_manager.get_children_by_parent(request.parent_id)
         return {"children": children}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/get_meal_plans_by_child")
-def get_meal_plans_by_child(request: MealPlansByChildRequest):
+async def get_meal_plans_by_child(request: MealPlansByChildRequest):
+    """Meal plans for a child; plans are parsed once when saved, so parsed_plan_details is read as stored."""
     try:
-        import json
-        plans = data_manager.get_meal_plans_by_patient(request.patient_id)
-        def parse_plan_details(plan):
-            try:
-                details = plan.get('plan_details')
-                if details:
-                    # If details is a JSON string, parse it
-                    parsed = json.loads(details)
-                    # If parsed is a dict with a 'text' key, try to further parse the text into days/meals
-                    if isinstance(parsed, dict) and 'text' in parsed:
-                        import re
-                        text = parsed['text']
-                        days = {}
-                        current_day = None
-                        current_meals = {}
-                        for line in text.splitlines():
-                            line = line.strip()
-                            if not line:
-                                continue
-                            day_match = re.match(r'^Day (\d+):', line)
-                            if day_match:
-                                if current_day and current_meals:
-                                    days[current_day] = current_meals
-                                current_day = f"Day {day_match.group(1)}"
-                                current_meals = {}
-                            elif current_day and ':' in line:
-                                meal, desc = line.split(':', 1)
-                                meal = meal.strip().replace('-', '').replace(' ', '_').lower()
-                                desc = desc.strip()
-                                current_meals[meal] = desc
-                        if current_day and current_meals:
-                            days[current_day] = current_meals
-                        parsed['parsed_days'] = days
-                    return parsed
-            except Exception:
-                pass
-            return plan.get('plan_details')
+        columns = request.columns
+        if columns and 'plan_data' not in columns:
+            columns = list(columns) + ['plan_data']
+        try:
+            plans = await async_data_manager.get_meal_plans_by_patient(request.patient_id, columns=columns)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
         for plan in plans:
-            plan['parsed_plan_details'] = parse_plan_details(plan)
+            plan['parsed_plan_details'] = plan.pop('plan_data', None)
 
         if request.most_recent:
             # Return only the most recent plan (if any)
@@ -267,16 +397,22 @@ def get_meal_plans_by_child(request: MealPlansByChildRequest):
             else:
                 return {"meal_plans": []}
         return {"meal_plans": plans}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 class KnowledgeBaseRequest(BaseModel):
-    pass  # No parameters needed for get_knowledge_base
+    include_pdf_text: Optional[bool] = False
+
+class KnowledgeBaseTextRequest(BaseModel):
+    kb_id: int
 
 @app.post("/get_knowledge_base")
-def get_knowledge_base(request: KnowledgeBaseRequest):
+async def get_knowledge_base(request: KnowledgeBaseRequest):
     try:
-        kb = data_manager.get_knowledge_base()
+        # Lightweight listing by default; full PDF text is opt-in or via /get_knowledge_base_text
+        kb = await async_data_manager.get_knowledge_base(include_pdf_text=request.include_pdf_text)
         # Parse ai_summary for each document if present
         import re
         def parse_ai_summary(text):
@@ -312,15 +448,28 @@ def get_knowledge_base(request: KnowledgeBaseRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/get_knowledge_base_text")
+async def get_knowledge_base_text(request: KnowledgeBaseTextRequest):
+    """Full extracted PDF text for one knowledge base entry."""
+    try:
+        entry = await async_data_manager.get_knowledge_base_text(request.kb_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not entry:
+        raise HTTPException(status_code=404, detail="Knowledge base entry not found")
+    return {"knowledge_base_entry": entry}
+
 class MealPlanDetailRequest(BaseModel):
     plan_id: int
 
 @app.post("/get_meal_plan_detail")
-def get_meal_plan_detail(request: MealPlanDetailRequest):
+async def get_meal_plan_detail(request: MealPlanDetailRequest):
     try:
-        import json
-        plan = data_manager.get_meal_plan_by_id(request.plan_id)
-        if plan and isinstance(plan, dict) and 'plan_details' in plan:
+        # parsed_plan_details is the parsed form stored at save time
+        # ({"text", "parsed_days", "structured"?, "nutrition"?, "validation"?}), as in /get_meal_plans_by_child
+        plan = await async_data_manager.get_meal_plan_by_id(request.plan_id, columns=["plan_id", "patient_id", "plan_details", "plan_data", "generated_at"])
+        if plan:
+            plan['parsed_plan_details'] = plan.pop('plan_data')
             try:
                 plan['plan_details'] = json.loads(plan['plan_details']) if plan['plan_details'] else None
             except Exception:
@@ -328,4 +477,119 @@ def get_meal_plan_detail(request: MealPlanDetailRequest):
                 pass
         return {"meal_plan": plan}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/pool_stats")
+def pool_stats():
+    """Database connection pool metrics (in-use, waiting, checkout latency)."""
+    return {"pool": data_manager.pool_stats(), "async_pool": async_data_manager.pool_stats()}
+
+@app.get("/llm_cache_stats")
+def llm_cache_stats():
+    """LLM generation cache size and hit/miss counts."""
+    return generation_cache.stats()
+
+@app.get("/groq_limiter_stats")
+def groq_limiter_stats():
+    return groq_limiter.stats()
+
+@app.get("/food_catalog_stats")
+def food_catalog_stats():
+    """Version, size and reload/staleness-check counts of the shared food catalog snapshot."""
+    return food_catalog.stats()
+
+@app.get("/food_search_stats")
+def food_search_stats():
+    """Catalog version and vocabulary size of the food search index."""
+    return food_search.stats()
+
+@app.get("/exclusion_index_stats")
+def exclusion_index_stats():
+    """Foods per allergen/religion/age exclusion category and cached per-request exclusion sets."""
+    return exclusion_index.stats()
+
+@app.get("/single_flight_stats")
+def single_flight_stats():
+    return {"llm": llm_flights.stats(), "meal_plans": meal_plan_flights.stats()}
+
+@app.get("/prompt_metrics")
+def get_prompt_metrics(limit: int = 50):
+    """Recent per-request prompt token breakdowns and latencies, plus per-chain averages."""
+    return {"summary": prompt_metrics.summary(), "recent": prompt_metrics.recent(limit)}
+
+@app.get("/meal_plan_nutrition_audit")
+async def meal_plan_nutrition_audit(store: bool = False, top: int = 20):
+    """
+    Recompute the energy totals of every saved meal plan against its child's age-based target in one pass.
+    With store=true each plan's report is saved into its plan_data.
+    """
+    try:
+        return await run_in_threadpool(audit_meal_plans, store=store, max_listed=top)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/batch_meal_plans")
+async def start_batch_meal_plans(request: BatchMealPlanRequest):
+    """Start a background job that generates and saves a meal plan for every child in a barangay or list."""
+    try:
+        patient_ids = await run_in_threadpool(resolve_patient_ids, request.barangay_id, request.patient_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not patient_ids:
+        raise HTTPException(status_code=404, detail="No patients found")
+    label = f"barangay {request.barangay_id}" if request.barangay_id is not None and not request.patient_ids else f"{len(patient_ids)} patients"
+    job = batch_jobs.start(patient_ids, request.available_foods, request.concurrency or DEFAULT_CONCURRENCY, label, request.structured)
+    progress = job.progress()
+    progress.pop("results")
+    return progress
+
+@app.get("/batch_meal_plans")
+def list_batch_meal_plans():
+    return {"jobs": batch_jobs.list()}
+
+@app.get("/batch_meal_plans/{job_id}")
+def get_batch_meal_plans(job_id: str):
+    """Progress, throughput and per-patient results (plan_id or error) of a batch job."""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job.progress()
+
+@app.post("/jobs/meal_plan")
+async def submit_meal_plan_job(request: MealPlanRequest):
+    """Queue a meal plan generation and return at once; poll /jobs/{job_id} for the result."""
+    patient_data = await async_data_manager.get_patient_by_id(request.patient_id)
+    if not patient_data:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    parent_id = patient_data.get('parent_id')
+    religion = await async_data_manager.get_religion_by_parent(parent_id) if parent_id else None
+    job_id = await run_in_threadpool(job_queue.submit, "meal_plan", {
+        "patient_id": request.patient_id,
+        "available_foods": request.available_foods,
+        "religion": religion,
+        "structured": request.structured,
+    })
+    return {"job_id": job_id, "status": "queued"}
+
+@app.post("/jobs/assessment")
+async def submit_assessment_job(request: AssessmentRequest):
+    """Queue a patient assessment and return at once; poll /jobs/{job_id} for the result."""
+    patient_data = await async_data_manager.get_patient_by_id(request.patient_id)
+    if not patient_data:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    job_id = await run_in_threadpool(job_queue.submit, "assessment", {"patient_id": request.patient_id})
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status, attempts, result (meal plan text cleaned like /generate_meal_plan) and latency breakdown of a job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["kind"] == "meal_plan" and job.get("result"):
+        job["result"]["meal_plan"] = clean_meal_plan_text(job["result"]["meal_plan"])
+    return job
+
+@app.get("/jobs")
+def list_jobs(status: Optional[str] = None, limit: int = 50):
+    return {"counts": job_queue.stats(), "jobs": job_queue.list(status, limit)}
@@ -0,0 +1,187 @@
+import logging
+import os
+import threading
+import time
+from functools import cached_property
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) a snapshot is checked against MySQL for changes made by other processes
+FOOD_CATALOG_CHECK_SECONDS = float(os.getenv('FOOD_CATALOG_CHECK_SECONDS', '30'))
+
+
+def _kcal(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class FoodCatalogSnapshot:
+    """
+    One immutable version of the foods table in columnar form. Derived views (rows, tag set,
+    name list, kcal array, id lookup) are computed on first use and shared by every caller of
+    this version; callers must not mutate them.
+    """
+    def __init__(self, version: int, foods: List[Dict], signature=None):
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+        self.ids = np.array([int(food['food_id']) for food in foods], dtype=np.int64)
+        self.names: Tuple[str, ...] = tuple(food.get('food_name_and_description') or '' for food in foods)
+        self.alternate_names: Tuple[str, ...] = tuple(food.get('alternate_common_names') or '' for food in foods)
+        self.nutrition_tags: Tuple[str, ...] = tuple(food.get('nutrition_tags') or '' for food in foods)
+        energy = [_kcal(food.get('energy_kcal')) for food in foods]
+        self.kcal = np.array([np.nan if kcal is None else kcal for kcal in energy], dtype=float)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @cached_property
+    def rows(self) -> List[Dict]:
+        """The foods as DataManager.get_foods_data() dicts, ordered by food_id."""
+        return [
+            {
+                "food_id": int(food_id),
+                "food_name_and_description": name,
+                "alternate_common_names": alternate,
+                "energy_kcal": None if np.isnan(kcal) else float(kcal),
+                "nutrition_tags": tags,
+            }
+            for food_id, name, alternate, kcal, tags in zip(self.ids, self.names, self.alternate_names, self.kcal, self.nutrition_tags)
+        ]
+
+    @cached_property
+    def positions(self) -> Dict[int, int]:
+        return {int(food_id): i for i, food_id in enumerate(self.ids)}
+
+    @cached_property
+    def tag_set(self) -> List[str]:
+        """Every distinct nutrition tag, sorted."""
+        return sorted({tag.strip() for tags in self.nutrition_tags for tag in tags.replace(';', ',').split(',') if tag.strip()})
+
+    @cached_property
+    def name_list(self) -> List[str]:
+        return list(self.names)
+
+    def get(self, food_id) -> Optional[Dict]:
+        position = self.positions.get(int(food_id))
+        return self.rows[position] if position is not None else None
+
+    def replace(self, food_id: int, food: Dict, signature=None) -> "FoodCatalogSnapshot":
+        """The next version with one row replaced (or added), leaving this snapshot untouched."""
+        rows = list(self.rows)
+        position = self.positions.get(food_id)
+        if position is None:
+            rows.append(food)
+            rows.sort(key=lambda row: row['food_id'])
+        else:
+            rows[position] = food
+        return FoodCatalogSnapshot(self.version + 1, rows, signature)
+
+
+class FoodCatalog:
+    """
+    Process-wide cache of the foods table. Every reader shares the current snapshot; it is replaced
+    when DataManager.update_food changes a row (version bump) or when the periodic checksum query
+    shows another process changed the table (full reload). on_reload listeners rebuild derived
+    indexes after such reloads.
+    """
+    def __init__(self, check_seconds: float = FOOD_CATALOG_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lock = threading.RLock()
+        self._snapshot: Optional[FoodCatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._listeners: List[Callable[[List[Dict]], None]] = []
+        self.loads = 0
+        self.checks = 0
+
+    @staticmethod
+    def _data_manager():
+        from data_manager import data_manager
+        return data_manager
+
+    def on_reload(self, listener: Callable[[List[Dict]], None]):
+        """listener(rows) runs after a reload caused by an outside change (not on the first load)."""
+        self._listeners.append(listener)
+
+    def is_fresh(self) -> bool:
+        return self._snapshot is not None and time.monotonic() - self._checked_at < self.check_seconds
+
+    def _load(self):
+        data_manager = self._data_manager()
+        signature = data_manager.get_foods_signature()
+        rows = data_manager.fetch_foods()
+        previous = self._snapshot
+        self._snapshot = FoodCatalogSnapshot((previous.version + 1) if previous else 1, rows, signature)
+        self._checked_at = time.monotonic()
+        self.loads += 1
+        logger.info("Food catalog v%d: %d foods", self._snapshot.version, len(self._snapshot))
+        if previous is not None:
+            for listener in self._listeners:
+                try:
+                    listener(self._snapshot.rows)
+                except Exception as e:
+                    logger.warning("Food catalog reload listener failed: %s", e)
+
+    def snapshot(self) -> FoodCatalogSnapshot:
+        """The current snapshot, reloaded first if it is missing or MySQL's checksum changed."""
+        if self.is_fresh():
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is None:
+                self._load()
+            elif not self.is_fresh():
+                self.checks += 1
+                if self._data_manager().get_foods_signature() != self._snapshot.signature:
+                    self._load()
+                else:
+                    self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def rows(self) -> List[Dict]:
+        return self.snapshot().rows
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version if self._snapshot else 0
+
+    def update_food(self, food_id, food_data: Dict):
+        """Apply a row written by update_food to the cached snapshot (same defaults as the UPDATE statement)."""
+        with self._lock:
+            if self._snapshot is None:
+                return
+            food_id = int(food_id)
+            food = {
+                "food_id": food_id,
+                "food_name_and_description": food_data.get('food_name_and_description', ''),
+                "alternate_common_names": food_data.get('alternate_common_names', ''),
+                "energy_kcal": _kcal(food_data.get('energy_kcal', 0)),
+                "nutrition_tags": food_data.get('nutrition_tags', ''),
+            }
+            self._snapshot = self._snapshot.replace(food_id, food, self._data_manager().get_foods_signature())
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Force a checksum check on the next read."""
+        self._checked_at = 0.0
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else 0,
+            "foods": len(snapshot) if snapshot else 0,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "loads": self.loads,
+            "checks": self.checks,
+            "check_seconds": self.check_seconds,
+        }
+
+
+food_catalog = FoodCatalog()
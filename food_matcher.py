@@ -0,0 +1,378 @@
+import difflib
+import logging
+import re
+import threading
+import unicodedata
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from food_selector import _terms_pattern
+
+logger = logging.getLogger(__name__)
+
+# Minimum difflib similarity for a fuzzy match of an unknown dish to a food name
+FUZZY_CUTOFF = 0.86
+MIN_TERM_LENGTH = 3
+# How a food's term was derived; only specific terms are trusted for allergen checks through the food row
+FULL, ALTERNATE, SHORT = "full", "alternate", "short"
+
+MEAL_LABELS = {
+    "breakfast": "breakfast", "almusal": "breakfast",
+    "lunch": "lunch", "tanghalian": "lunch",
+    "snack": "snack", "merienda": "snack", "meryenda": "snack",
+    "dinner": "dinner", "supper": "dinner", "hapunan": "dinner",
+}
+# Words in a dish description that are not food names (portions, preparation, filler)
+NON_FOOD_WORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "to", "or", "with", "and", "some", "little", "bit", "few",
+    "cup", "cups", "tbsp", "tsp", "tablespoon", "tablespoons", "teaspoon", "teaspoons", "piece", "pieces", "pc", "pcs",
+    "slice", "slices", "serving", "servings", "bowl", "bowls", "glass", "glasses", "g", "grams", "gram", "ml", "oz", "kcal",
+    "small", "medium", "large", "half", "whole", "mashed", "boiled", "steamed", "fried", "sauteed", "ginisa", "ginisang",
+    "fresh", "cooked", "soft", "pureed", "puree", "chopped", "minced", "sliced", "diced", "grated", "plain", "homemade",
+    "optional", "style", "filipino", "side", "baked", "grilled", "warm", "cold", "ripe", "finely", "thin",
+    "thinly", "lightly", "mixed", "mix", "topped", "served", "dish", "meal", "food", "portion",
+}
+
+_DAY_RE = re.compile(r"^day\s*(\d+)\b", re.IGNORECASE)
+_MEAL_LINE_RE = re.compile(r"^([a-z][a-z ]{2,30}?)\s*:\s*(.+)$", re.IGNORECASE)
+_MARKUP_RE = re.compile(r"[*_#`>]+")
+_PAREN_RE = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+_SPLIT_RE = re.compile(r",|;|/|\+|&|\bwith\b|\band\b|\bat\b|\bor\b", re.IGNORECASE)
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accents folded (ñ -> n), everything but letters and digits turned into single spaces."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def food_terms(food: Dict) -> List[Tuple[str, str]]:
+    """(normalized term, kind) names a food may be written as: full name, its comma prefixes, alternate names."""
+    name = food.get('food_name_and_description') or ''
+    terms = [(normalize(name), FULL)]
+    parts = [part for part in name.split(',') if part.strip()]
+    for end in range(1, len(parts)):
+        terms.append((normalize(",".join(parts[:end])), SHORT))
+    for alternate in re.split(r"[,;/]", food.get('alternate_common_names') or ''):
+        terms.append((normalize(alternate), ALTERNATE))
+    seen = {}
+    for term, kind in terms:
+        if len(term) >= MIN_TERM_LENGTH and term not in seen:
+            seen[term] = kind
+    return list(seen.items())
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over normalized text; scans in time linear in the text plus matches.
+    Patterns are matched on whole words (the text and patterns are space-padded). Patterns can be
+    added and removed after construction: additions extend the trie and relink failure edges in one
+    BFS pass, removals just drop the pattern's value from its node.
+    """
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._depth: List[int] = [0]
+        self._values: List[Dict] = [{}]
+        self._output: List[int] = [-1]
+        self._dirty = False
+
+    def add(self, pattern: str, value, kind: str = FULL):
+        node = 0
+        for ch in f" {pattern} ":
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._depth.append(self._depth[node] + 1)
+                self._values.append({})
+                self._output.append(-1)
+                self._goto[node][ch] = nxt
+                self._dirty = True
+            node = nxt
+        self._values[node][value] = kind
+        self._dirty = True
+
+    def remove(self, pattern: str, value):
+        node = 0
+        for ch in f" {pattern} ":
+            node = self._goto[node].get(ch)
+            if node is None:
+                return
+        self._values[node].pop(value, None)
+
+    def build(self):
+        """(Re)compute failure and output links; called automatically before a scan after changes."""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._output[child] = -1
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                # Nearest proper suffix that is a pattern end (values are checked at scan time, so removals stay cheap)
+                suffix = self._fail[child]
+                self._output[child] = suffix if self._values[suffix] else self._output[suffix]
+                queue.append(child)
+        self._dirty = False
+
+    def scan(self, text: str) -> Iterator[Tuple[int, int, Dict]]:
+        """(start, end, {value: kind}) for every pattern occurrence in the normalized text (offsets exclude padding)."""
+        if self._dirty:
+            self.build()
+        padded = f" {text} "
+        node = 0
+        for i, ch in enumerate(padded):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            hit = node if self._values[node] else self._output[node]
+            while hit > 0:
+                if self._values[hit]:
+                    # Padded span [i - depth + 1, i] -> unpadded word span
+                    yield i - self._depth[hit] + 1, i - 1, self._values[hit]
+                hit = self._output[hit]
+
+    def __len__(self):
+        return len(self._goto)
+
+
+def leftmost_longest(matches) -> List[Tuple[int, int, Dict]]:
+    """Non-overlapping matches, preferring the earliest and then the longest."""
+    chosen = []
+    last_end = -1
+    for start, end, values in sorted(matches, key=lambda m: (m[0], -(m[1] - m[0]))):
+        if start >= last_end:
+            chosen.append((start, end, values))
+            last_end = end
+    return chosen
+
+
+class MealLine:
+    """One "Meal: description" line of a plan, with enough context to rewrite it in place."""
+    __slots__ = ("line_no", "day", "meal", "prefix", "description")
+
+    def __init__(self, line_no: int, day: int, meal: str, prefix: str, description: str):
+        self.line_no = line_no
+        self.day = day
+        self.meal = meal
+        self.prefix = prefix
+        self.description = description
+
+
+def meal_lines(text: str) -> List[MealLine]:
+    """Meal lines of a plan under "Day N" headings, tolerating the markdown bullets and bold the LLM uses."""
+    found = []
+    day = None
+    for line_no, raw in enumerate((text or "").splitlines()):
+        plain = _MARKUP_RE.sub("", raw).strip().lstrip("-•").strip()
+        day_match = _DAY_RE.match(plain)
+        if day_match:
+            day = int(day_match.group(1))
+            rest = plain[day_match.end():].lstrip(" :-|")
+            if not rest:
+                continue
+            plain = rest
+        if day is None:
+            continue
+        meal_match = _MEAL_LINE_RE.match(plain)
+        if not meal_match:
+            continue
+        label = meal_match.group(1).lower()
+        meal = next((meal for word, meal in MEAL_LABELS.items() if word in label), None)
+        if meal is None:
+            continue
+        colon = raw.find(":", raw.lower().find(next(word for word in MEAL_LABELS if word in label)))
+        prefix = raw[:colon + 1]
+        if raw[colon + 1:colon + 3] == "**":
+            prefix += "**"
+        found.append(MealLine(line_no, day, meal, prefix.rstrip() + " ", meal_match.group(2).strip()))
+    return found
+
+
+def dish_text(description: str) -> str:
+    """The dish part of a meal description: before the " - benefit" tail, without portions in brackets."""
+    dish = re.split(r"\s[-–—]\s", description, maxsplit=1)[0]
+    return _PAREN_RE.sub(" ", dish)
+
+
+def splice_meal_lines(text: str, replacements: Dict[Tuple[int, str], str]) -> Tuple[str, List[str]]:
+    """Replace the descriptions of (day, meal) lines in a plan, keeping each line's formatting. Returns (text, replaced labels)."""
+    lines = (text or "").splitlines()
+    replaced = []
+    for meal_line in meal_lines(text):
+        new_description = replacements.get((meal_line.day, meal_line.meal))
+        if new_description:
+            lines[meal_line.line_no] = meal_line.prefix + new_description.strip()
+            replaced.append(f"Day {meal_line.day} {meal_line.meal}")
+    return "\n".join(lines), replaced
+
+
+class FoodMatcher:
+    """
+    Food-name matcher over the foods table: an Aho-Corasick automaton of every food's names
+    (food_name_and_description, its comma prefixes, alternate_common_names), with a difflib fallback
+    for misspellings. validate() checks a generated plan for foods that are not in the database and
+    for allergen/restricted terms. update_food() keeps the automaton current without a full rebuild.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._automaton: Optional[AhoCorasick] = None
+        self._foods: Dict[int, Dict] = {}
+        self._terms: Dict[int, List[Tuple[str, str]]] = {}
+        self._term_foods: Dict[str, set] = {}
+        self._terms_by_initial: Dict[str, List[str]] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._automaton is not None
+
+    def load(self, foods: List[Dict]):
+        with self._lock:
+            self._automaton = AhoCorasick()
+            self._foods = {}
+            self._terms = {}
+            self._term_foods = {}
+            self._terms_by_initial = {}
+            for food in foods:
+                if food.get('food_id') is not None:
+                    self._add_food(int(food['food_id']), food)
+            self._automaton.build()
+            logger.info("Food matcher: %d foods, %d automaton states", len(self._foods), len(self._automaton))
+
+    def reload(self, foods: List[Dict]):
+        """Rebuild from a fresh foods list if the matcher is in use."""
+        if self.loaded:
+            self.load(foods)
+
+    def _add_food(self, food_id: int, food: Dict):
+        terms = food_terms(food)
+        self._foods[food_id] = food
+        self._terms[food_id] = terms
+        for term, kind in terms:
+            self._automaton.add(term, food_id, kind)
+            owners = self._term_foods.setdefault(term, set())
+            if not owners:
+                self._terms_by_initial.setdefault(term[0], []).append(term)
+            owners.add(food_id)
+
+    def _remove_food(self, food_id: int):
+        for term, _ in self._terms.pop(food_id, []):
+            self._automaton.remove(term, food_id)
+            owners = self._term_foods.get(term)
+            if owners is not None:
+                owners.discard(food_id)
+                if not owners:
+                    del self._term_foods[term]
+                    self._terms_by_initial[term[0]].remove(term)
+        self._foods.pop(food_id, None)
+
+    def update_food(self, food_id, food_data: Dict):
+        """Apply one changed foods row: only its own terms are re-indexed."""
+        with self._lock:
+            if self._automaton is None:
+                return
+            food_id = int(food_id)
+            food = {**self._foods.get(food_id, {}), **food_data, 'food_id': food_id}
+            if food_terms(food) == self._terms.get(food_id):
+                self._foods[food_id] = food
+                return
+            self._remove_food(food_id)
+            self._add_food(food_id, food)
+
+    def food(self, food_id: int) -> Optional[Dict]:
+        return self._foods.get(food_id)
+
+    def match(self, text: str) -> List[Tuple[str, Dict]]:
+        """(matched text, {food_id: kind}) for the food names in text, leftmost-longest and non-overlapping."""
+        normalized = normalize(text)
+        with self._lock:
+            matches = leftmost_longest(self._automaton.scan(normalized))
+        return [(normalized[start:end], values) for start, end, values in matches]
+
+    def fuzzy(self, text: str) -> Optional[Tuple[str, List[int]]]:
+        """(term, food_ids) of the closest food name to a short phrase, or None below FUZZY_CUTOFF."""
+        phrase = normalize(text)
+        if len(phrase) < MIN_TERM_LENGTH:
+            return None
+        with self._lock:
+            candidates = self._terms_by_initial.get(phrase[0], [])
+            close = difflib.get_close_matches(phrase, candidates, n=1, cutoff=FUZZY_CUTOFF)
+            if not close:
+                return None
+            return close[0], sorted(self._term_foods.get(close[0], ()))
+
+    def validate(self, plan_text: str, exclusions: Optional[List[str]] = None, excluded=None) -> Dict:
+        """
+        Check every meal line of a plan against the foods table. Returns
+        {"ok", "meals_checked", "known_food_ids", "unknown_foods", "fuzzy_matches", "allergen_hits"}:
+        unknown_foods are dish parts matching no food name even fuzzily; allergen_hits are
+        excluded terms (allergens, religious restrictions, age hazards) named in a dish, or foods
+        the dish names that are excluded. excluded (an exclusion_index Exclusions) decides the latter
+        by food_id and supplies the terms; without it each food's description is scanned for the terms.
+        """
+        if exclusions is None and excluded is not None:
+            exclusions = excluded.terms
+        # Same whole-word (plus plural) matching and compound vocabulary as the prompt filter
+        exclusion_re = _terms_pattern([normalize(term) for term in exclusions or []])
+        known = set()
+        unknown, fuzzy_matches, allergen_hits = [], [], []
+        lines = meal_lines(plan_text)
+        for line in lines:
+            where = {"day": line.day, "meal": line.meal}
+            dish = dish_text(line.description)
+            if exclusion_re:
+                allergen_hits.extend({**where, "term": hit.group(0), "source": "dish"} for hit in exclusion_re.finditer(normalize(dish)))
+            for part in _SPLIT_RE.split(dish):
+                words = [word for word in normalize(part).split() if not word.isdigit()]
+                if not any(word not in NON_FOOD_WORDS for word in words):
+                    continue
+                matches = self.match(" ".join(words))
+                if not matches:
+                    content = " ".join(word for word in words if word not in NON_FOOD_WORDS)
+                    close = self.fuzzy(content) or self.fuzzy(" ".join(words))
+                    if close is None:
+                        unknown.append({**where, "text": part.strip()})
+                        continue
+                    term, food_ids = close
+                    fuzzy_matches.append({**where, "text": part.strip(), "matched": term, "food_ids": food_ids})
+                    matches = [(term, {food_id: SHORT for food_id in food_ids})]
+                for _, values in matches:
+                    known.update(values)
+                    for food_id, kind in values.items():
+                        if kind == SHORT or food_id not in self._foods:
+                            continue
+                        food = self._foods[food_id]
+                        if excluded is not None:
+                            if food_id in excluded.food_ids:
+                                allergen_hits.append({**where, "term": excluded.reason(food_id), "source": food.get('food_name_and_description')})
+                            continue
+                        if not exclusion_re:
+                            continue
+                        description = normalize(f"{food.get('food_name_and_description') or ''} {food.get('alternate_common_names') or ''}")
+                        allergen_hits.extend(
+                            {**where, "term": hit.group(0), "source": food.get('food_name_and_description')}
+                            for hit in exclusion_re.finditer(description)
+                        )
+        # One hit per (day, meal, term)
+        seen = set()
+        allergen_hits = [h for h in allergen_hits if (h["day"], h["meal"], h["term"]) not in seen and not seen.add((h["day"], h["meal"], h["term"]))]
+        return {
+            "ok": not unknown and not allergen_hits,
+            "meals_checked": len(lines),
+            "known_food_ids": sorted(known),
+            "unknown_foods": unknown,
+            "fuzzy_matches": fuzzy_matches,
+            "allergen_hits": allergen_hits,
+        }
+
+
+food_matcher = FoodMatcher()
@@ -0,0 +1,188 @@
+import bisect
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from food_catalog import FoodCatalogSnapshot, food_catalog
+from food_matcher import normalize
+
+# Score multiplier per field a term occurs in (the best field counts)
+FIELD_WEIGHTS = (
+    ("food_name_and_description", 3.0),
+    ("alternate_common_names", 2.0),
+    ("nutrition_tags", 1.0),
+)
+# Score multiplier for a query word that only matches as a prefix / within one typo
+PREFIX_WEIGHT = 0.7
+TYPO_WEIGHT = 0.5
+# Query words shorter than this are matched exactly or by prefix only
+MIN_TYPO_LENGTH = 4
+# Matching food_id outranks any text match
+FOOD_ID_SCORE = 100.0
+DEFAULT_PER_PAGE = 10
+
+
+def tokenize(text) -> List[str]:
+    """Accent-folded lowercase words (same normalization as food_matcher)."""
+    return normalize(str(text or "")).split()
+
+
+def _deletes(term: str) -> List[str]:
+    return [term[:i] + term[i + 1:] for i in range(len(term))]
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if a and b differ by one insertion, deletion, substitution or adjacent transposition."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class FoodSearchIndex:
+    """
+    Inverted index over one FoodCatalogSnapshot: every word of a food's name, alternate names and
+    nutrition tags maps to the catalog positions that contain it with a field weight. Query words
+    match vocabulary words exactly, as a prefix (bisect over the sorted vocabulary) or within one
+    typo (deletion neighbourhood); every query word must match, and foods are ranked by the sum
+    of idf * field weight * match quality, then by name.
+    """
+    def __init__(self, snapshot: FoodCatalogSnapshot):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        postings: Dict[str, Dict[int, float]] = {}
+        columns = (snapshot.names, snapshot.alternate_names, snapshot.nutrition_tags)
+        for (_, weight), values in zip(FIELD_WEIGHTS, columns):
+            for position, text in enumerate(values):
+                for term in set(tokenize(text)):
+                    entry = postings.setdefault(term, {})
+                    if entry.get(position, 0.0) < weight:
+                        entry[position] = weight
+        n = len(snapshot)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, entry in postings.items():
+            idf = math.log(1 + (n - len(entry) + 0.5) / (len(entry) + 0.5))
+            self._postings[term] = (
+                np.fromiter(entry.keys(), dtype=np.int32, count=len(entry)),
+                np.fromiter(entry.values(), dtype=float, count=len(entry)) * idf,
+            )
+        self._vocabulary = sorted(self._postings)
+        self._deletions: Dict[str, List[str]] = {}
+        for term in self._vocabulary:
+            if len(term) >= MIN_TYPO_LENGTH - 1:
+                for variant in [term] + _deletes(term):
+                    self._deletions.setdefault(variant, []).append(term)
+        # Position of each food in name order, for tie-breaks and the empty query
+        self._name_rank = np.empty(n, dtype=np.int64)
+        self._name_rank[np.argsort(np.array([name.lower() for name in snapshot.names], dtype=object), kind="stable")] = np.arange(n)
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def candidates(self, word: str) -> Dict[str, float]:
+        """Vocabulary terms a query word matches, with their match quality."""
+        matches = {}
+        start = bisect.bisect_left(self._vocabulary, word)
+        for term in self._vocabulary[start:]:
+            if not term.startswith(word):
+                break
+            matches[term] = 1.0 if term == word else PREFIX_WEIGHT
+        if len(word) >= MIN_TYPO_LENGTH:
+            for variant in [word] + _deletes(word):
+                for term in self._deletions.get(variant, ()):
+                    if term not in matches and _within_one_edit(word, term):
+                        matches[term] = TYPO_WEIGHT
+        return matches
+
+    def scores(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(matching positions in rank order, their scores); an empty query returns every food in catalog order."""
+        n = len(self.snapshot)
+        words = tokenize(query)
+        if not words:
+            return np.arange(n), np.zeros(n)
+        total = np.zeros(n)
+        matched = np.ones(n, dtype=bool)
+        for word in dict.fromkeys(words):
+            score = np.zeros(n)
+            for term, quality in self.candidates(word).items():
+                positions, weights = self._postings[term]
+                score[positions] = np.maximum(score[positions], weights * quality)
+            if word.isdigit():
+                score[self.snapshot.ids == int(word)] = FOOD_ID_SCORE
+            matched &= score > 0
+            total += score
+        positions = np.flatnonzero(matched)
+        order = np.lexsort((self._name_rank[positions], -total[positions]))
+        return positions[order], total[positions][order]
+
+    def search(self, query: str, page: int = 1, per_page: int = DEFAULT_PER_PAGE) -> Dict:
+        positions, _ = self.scores(query)
+        total = len(positions)
+        per_page = max(1, int(per_page))
+        pages = max(1, (total - 1) // per_page + 1)
+        page = min(max(1, int(page)), pages)
+        start = (page - 1) * per_page
+        rows = self.snapshot.rows
+        return {
+            "foods": [rows[position] for position in positions[start:start + per_page].tolist()],
+            "total": total,
+            "page": page,
+            "per_page": per_page,
+            "pages": pages,
+        }
+
+
+class FoodSearch:
+    """Keeps a FoodSearchIndex for the current food_catalog version, rebuilt when the version changes."""
+    def __init__(self, catalog=food_catalog):
+        self._catalog = catalog
+        self._lock = threading.Lock()
+        self._index: Optional[FoodSearchIndex] = None
+        self.builds = 0
+
+    def index(self) -> FoodSearchIndex:
+        snapshot = self._catalog.snapshot()
+        index = self._index
+        if index is None or index.snapshot is not snapshot:
+            with self._lock:
+                if self._index is None or self._index.snapshot is not snapshot:
+                    self._index = FoodSearchIndex(snapshot)
+                    self.builds += 1
+                index = self._index
+        return index
+
+    def search(self, query: str = "", page: int = 1, per_page: int = DEFAULT_PER_PAGE) -> Dict:
+        """One page of foods matching query: {"foods", "total", "page", "per_page", "pages"}."""
+        return self.index().search(query, page, per_page)
+
+    def search_all(self, query: str = "") -> List[Dict]:
+        """Every food matching query, best match first."""
+        index = self.index()
+        positions, _ = index.scores(query)
+        rows = index.snapshot.rows
+        return [rows[position] for position in positions.tolist()]
+
+    def stats(self) -> Dict:
+        index = self._index
+        return {
+            "version": index.version if index else 0,
+            "foods": len(index) if index else 0,
+            "terms": len(index._vocabulary) if index else 0,
+            "builds": self.builds,
+        }
+
+
+food_search = FoodSearch()
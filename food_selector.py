@@ -0,0 +1,254 @@
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from prompt_budget import estimate_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FOOD_TOKEN_BUDGET = int(os.getenv('FOOD_PROMPT_TOKEN_BUDGET', '1500'))
+# Never trim the candidate list below this many foods, budget permitting
+MIN_FOODS = 25
+
+# Allergen vocabulary shared by the prompt filter, the exclusion index and the plan validator.
+# Terms match whole words (plus a plural "s"/"es"), so compound and local names are listed explicitly:
+# "catfish" is not caught by "fish", and "egg" no longer catches "eggplant".
+EGG_TERMS = ["egg", "itlog", "balut", "penoy", "kwek-kwek", "leche flan", "mayonnaise", "mayo", "omelet", "omelette",
+             "torta", "tortang", "custard", "meringue", "eggnog"]
+MILK_TERMS = ["milk", "gatas", "cheese", "keso", "yogurt", "butter", "buttermilk", "cream", "leche", "milkshake",
+              "pastillas", "ghee", "kesong puti"]
+FISH_TERMS = ["fish", "isda", "catfish", "hito", "milkfish", "bangus", "tilapia", "galunggong", "mackerel", "tuna",
+              "sardine", "sardinas", "dilis", "anchovy", "tuyo", "tinapa", "daing", "dalag", "mudfish", "lapu-lapu",
+              "grouper", "salmon", "tamban", "sapsap", "tulingan", "maya-maya", "snapper", "swordfish", "fishball",
+              "fish ball", "patis", "bagoong"]
+SHELLFISH_TERMS = ["shrimp", "hipon", "prawn", "crab", "alimango", "alimasag", "shellfish", "crayfish", "lobster",
+                   "alamang", "tahong", "mussel", "talaba", "oyster", "clam", "halaan", "scallop", "squid", "pusit",
+                   "cuttlefish", "bagoong"]
+NUT_TERMS = ["peanut", "mani", "groundnut", "kare-kare", "cashew", "kasoy", "almond", "pili", "walnut", "hazelnut",
+             "pistachio", "pecan", "macadamia", "nut"]
+WHEAT_TERMS = ["wheat", "bread", "breadcrumb", "tinapay", "pandesal", "monay", "ensaymada", "noodle", "pansit", "pancit",
+               "mami", "miki", "misua", "pasta", "spaghetti", "macaroni", "flour", "biscuit", "cracker"]
+
+# Allergy keywords -> food name terms (English and Filipino) that contain the allergen
+ALLERGEN_SYNONYMS = {
+    "egg": EGG_TERMS,
+    "milk": MILK_TERMS,
+    "dairy": MILK_TERMS,
+    "lactose": ["milk", "gatas", "cheese", "keso", "yogurt", "cream", "milkshake", "pastillas", "kesong puti"],
+    "peanut": ["peanut", "mani", "groundnut", "kare-kare"],
+    "nut": NUT_TERMS,
+    "fish": FISH_TERMS,
+    "shellfish": SHELLFISH_TERMS,
+    "shrimp": ["shrimp", "hipon", "prawn", "alamang", "bagoong"],
+    "crab": ["crab", "alimango", "alimasag"],
+    "seafood": sorted(set(FISH_TERMS + SHELLFISH_TERMS)),
+    "soy": ["soy", "soya", "soybean", "tofu", "tokwa", "taho", "toyo", "miso", "tempeh"],
+    "wheat": WHEAT_TERMS,
+    "gluten": WHEAT_TERMS,
+    "chicken": ["chicken", "manok"],
+    "pork": ["pork", "baboy"],
+    "beef": ["beef", "baka"],
+}
+
+PORK_TERMS = ["pork", "baboy", "lechon", "ham", "bacon", "longganisa", "chicharon", "lard", "tocino", "liempo", "dinuguan", "sisig"]
+# Religion keywords -> food name terms the diet forbids
+RELIGION_EXCLUSIONS = {
+    "islam": PORK_TERMS,
+    "muslim": PORK_TERMS,
+    "adventist": PORK_TERMS + ["shrimp", "hipon", "crab", "alimango", "squid", "pusit", "shellfish", "tahong"],
+    "hindu": ["beef", "baka", "bulalo", "tapa"],
+    "iglesia": ["dinuguan", "blood", "dugo"],
+}
+
+CHOKING_HAZARDS = ["peanut", "mani", "nut", "popcorn", "candy", "chicharon", "whole grape", "hard candy"]
+SOFT_TEXTURE_TERMS = ["lugaw", "porridge", "arroz caldo", "mashed", "puree", "soup", "sabaw", "boiled", "nilaga", "tinola", "steamed", "banana", "saging", "squash", "kalabasa", "egg", "itlog", "papaya", "avocado", "camote", "kamote"]
+
+# Priority keywords found in patient growth indicators / conditions -> nutrition_tags keywords to favour
+PRIORITY_RULES = [
+    (("underweight", "wasted", "wasting", "severely"), ("energy", "calorie", "protein", "fat")),
+    (("stunted", "stunting", "short"), ("protein", "calcium", "zinc", "vitamin a")),
+    (("overweight", "obese", "obesity"), ("fiber", "low fat", "low-fat", "vegetable")),
+    (("anemia", "anaemia", "iron"), ("iron",)),
+    (("diarrhea", "diarrhoea"), ("zinc", "potassium", "easy to digest")),
+    (("constipation",), ("fiber",)),
+]
+
+NONE_VALUES = {"", "none", "no", "n/a", "na", "not specified", "unknown"}
+
+
+def format_food_line(food: Dict, with_id: bool = False) -> str:
+    """How a food appears in the FOOD DATABASE prompt section; with_id prefixes "[food_id]" for structured output."""
+    name = food.get('food_name_and_description')
+    if with_id and food.get('food_id') is not None:
+        name = f"[{food['food_id']}] {name}"
+    kcal = food.get('energy_kcal')
+    if kcal is not None:
+        return f"{name} (Energy: {kcal} kcal)"
+    return name
+
+
+def _split_terms(value: Optional[str]) -> List[str]:
+    if not value or str(value).strip().lower() in NONE_VALUES:
+        return []
+    return [term.strip().lower() for term in re.split(r'[,;/]|\band\b', str(value)) if term.strip()]
+
+
+def _food_text(food: Dict) -> str:
+    return f"{food.get('food_name_and_description') or ''} {food.get('alternate_common_names') or ''}".lower()
+
+
+def _term_regex(term: str) -> str:
+    # Words of a term may be separated by spaces or hyphens ("kare-kare", "kare kare")
+    return r'[\s\-]+'.join(re.escape(word) for word in re.split(r'[\s\-]+', term.strip()))
+
+
+def _terms_pattern(terms):
+    """
+    One compiled pattern matching any of terms as whole words, allowing a plural "s"/"es"
+    ("egg" matches "eggs" but not "eggplant"), or None when empty.
+    """
+    terms = [term.lower() for term in terms if term and term.strip()]
+    if not terms:
+        return None
+    alternatives = '|'.join(_term_regex(term) for term in sorted(set(terms), key=len, reverse=True))
+    return re.compile(r'\b(?:' + alternatives + r')(?:e?s)?\b')
+
+
+_ALLERGEN_KEY_PATTERNS = {key: _terms_pattern([key]) for key in ALLERGEN_SYNONYMS}
+
+
+def allergen_keys(allergy: str) -> List[str]:
+    """ALLERGEN_SYNONYMS keys named in one allergy entry, as whole words ("shellfish" is not "fish", "eggplant" not "egg")."""
+    return [key for key, pattern in _ALLERGEN_KEY_PATTERNS.items() if pattern.search(allergy)]
+
+
+def excluded_terms(allergies: Optional[str], religion: Optional[str]) -> List[str]:
+    """Food name terms that must not appear for this allergy/religion combination."""
+    terms = []
+    for allergy in _split_terms(allergies):
+        matched = allergen_keys(allergy)
+        if matched:
+            for key in matched:
+                terms.extend(ALLERGEN_SYNONYMS[key])
+        else:
+            # Unknown allergen: exclude foods that name it directly
+            terms.append(allergy)
+    religion_val = (religion or '').lower()
+    for key, forbidden in RELIGION_EXCLUSIONS.items():
+        if key in religion_val:
+            terms.extend(forbidden)
+    return sorted(set(terms))
+
+
+def child_age_months(patient_data: Dict) -> int:
+    try:
+        return int(patient_data.get('age_months') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def child_exclusions(patient_data: Dict, religion: Optional[str] = None) -> List[str]:
+    """Food name terms unsafe for this child: allergens, religious restrictions, and age-based hazards."""
+    age_months = child_age_months(patient_data)
+    exclusions = excluded_terms(patient_data.get('allergies'), patient_data.get('religion') or religion)
+    if age_months < 24:
+        exclusions = exclusions + CHOKING_HAZARDS
+    if age_months < 12:
+        exclusions = exclusions + ["honey", "pulot"]
+    return exclusions
+
+
+def priority_tags(patient_data: Dict) -> List[str]:
+    """nutrition_tags keywords that match this child's growth and medical priorities."""
+    indicators = " ".join(str(patient_data.get(field) or '') for field in (
+        'weight_for_age', 'height_for_age', 'bmi_for_age', 'other_medical_problems'
+    )).lower()
+    tags = []
+    for triggers, wanted in PRIORITY_RULES:
+        if any(trigger in indicators for trigger in triggers):
+            tags.extend(wanted)
+    return sorted(set(tags))
+
+
+def is_excluded(food: Dict, excluded=None, exclusion_re=None) -> bool:
+    """
+    Whether a food is unsafe for the child: by the exclusion_index Exclusions when given,
+    otherwise by matching exclusion_re (see child_exclusions) against the food's names.
+    """
+    if excluded is not None:
+        return excluded.excludes(food)
+    return bool(exclusion_re and exclusion_re.search(_food_text(food)))
+
+
+def select_foods(
+    foods: List[Dict],
+    patient_data: Dict,
+    available_ingredients: Optional[str] = None,
+    religion: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    excluded=None
+) -> Tuple[List[Dict], Dict]:
+    """
+    Rank and trim the food catalog for one child before it goes into the meal plan prompt.
+    Foods containing the child's allergens or religiously forbidden items are dropped, choking hazards
+    are dropped under 24 months, and the rest are ranked by available ingredients, priority
+    nutrition tags and (for younger children) soft textures, then cut to token_budget (keeping at least MIN_FOODS).
+    excluded is an exclusion_index Exclusions for the child; without it the exclusion terms are matched per row.
+    Returns (selected_foods, stats).
+    """
+    token_budget = DEFAULT_FOOD_TOKEN_BUDGET if token_budget is None else token_budget
+    age_months = child_age_months(patient_data)
+    wanted_tags = priority_tags(patient_data)
+    exclusion_re = _terms_pattern(child_exclusions(patient_data, religion)) if excluded is None else None
+    ingredient_re = _terms_pattern(_split_terms(available_ingredients))
+    soft_re = _terms_pattern(SOFT_TEXTURE_TERMS) if age_months < 24 else None
+
+    scored = []
+    excluded_count = 0
+    for food in foods:
+        if not food.get('food_name_and_description'):
+            continue
+        if is_excluded(food, excluded, exclusion_re):
+            excluded_count += 1
+            continue
+        text = _food_text(food)
+        tags = (food.get('nutrition_tags') or '').lower()
+        score = 0
+        if ingredient_re and ingredient_re.search(text):
+            score += 5
+        score += 3 * sum(1 for tag in wanted_tags if tag in tags)
+        if soft_re and soft_re.search(text):
+            score += 2
+        if tags:
+            score += 1
+        scored.append((score, food))
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    all_tokens = sum(estimate_tokens(format_food_line(food)) + 1 for food in foods if food.get('food_name_and_description'))
+    selected = []
+    used_tokens = 0
+    for score, food in scored:
+        line_tokens = estimate_tokens(format_food_line(food)) + 1
+        if used_tokens + line_tokens > token_budget and len(selected) >= MIN_FOODS:
+            break
+        selected.append(food)
+        used_tokens += line_tokens
+
+    stats = {
+        "total_foods": len(foods),
+        "excluded": excluded_count,
+        "selected": len(selected),
+        "prompt_tokens": used_tokens,
+        "prompt_tokens_saved": max(all_tokens - used_tokens, 0),
+        "priority_tags": wanted_tags,
+    }
+    logger.info(
+        "Food pre-filter: %d/%d foods kept (%d excluded), ~%d prompt tokens, ~%d saved",
+        stats["selected"], stats["total_foods"], excluded_count, used_tokens, stats["prompt_tokens_saved"]
+    )
+    return selected, stats
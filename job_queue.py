@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from prompt_budget import prompt_metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_DB = os.getenv('JOB_QUEUE_DB', 'jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# A running job not finished within this many seconds is assumed lost (worker crash) and re-queued
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '900'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    result TEXT,
+    error TEXT,
+    timings TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+"""
+
+
+class PermanentJobError(Exception):
+    """A job failure that retrying cannot fix (e.g. unknown patient)."""
+
+
+class JobQueue:
+    """
+    Persistent job queue in a local SQLite file, so long-running generations survive restarts
+    and need no external broker. Jobs move queued -> running -> succeeded | failed; failed attempts
+    are re-queued with backoff until max_attempts.
+    """
+    def __init__(self, path: str = JOB_QUEUE_DB):
+        self.path = path
+        self._handlers: Dict[str, Callable[[Dict], Dict]] = {}
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _initialize(self):
+        """Create the SQLite file and schema on first use (not at import time)."""
+        with self._lock:
+            if self._initialized:
+                return
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+            finally:
+                conn.close()
+            self._initialized = True
+
+    @contextmanager
+    def _connect(self):
+        if not self._initialized:
+            self._initialize()
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def register(self, kind: str, handler: Callable[[Dict], Dict]):
+        """handler(payload) -> JSON-serializable result; raise PermanentJobError to fail without retrying."""
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, payload: Dict, max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, payload, status, max_attempts, created_at, available_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, default=str), max_attempts, now, now)
+            )
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """Atomically take the oldest runnable job, or None."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND available_at <= ? "
+                    "ORDER BY available_at, created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, worker = ? WHERE job_id = ?",
+                    (now, worker, row["job_id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        job = dict(row)
+        job.update(status="running", attempts=row["attempts"] + 1, started_at=now, worker=worker)
+        return job
+
+    def _finish(self, job_id: str, status: str, result=None, error: Optional[str] = None, timings: Optional[Dict] = None, available_at: Optional[float] = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, timings = ?, finished_at = ?, "
+                "available_at = COALESCE(?, available_at) WHERE job_id = ?",
+                (
+                    status,
+                    json.dumps(result, default=str) if result is not None else None,
+                    error,
+                    json.dumps(timings, default=str) if timings is not None else None,
+                    time.time() if status in ("succeeded", "failed") else None,
+                    available_at,
+                    job_id,
+                )
+            )
+
+    def requeue_stale(self) -> int:
+        """
+        Put running jobs whose lease expired (their worker died) back in the queue, or fail them once
+        they have used max_attempts, so a job that crashes its worker every time is not retried forever.
+        Returns the number re-queued.
+        """
+        now = time.time()
+        cutoff = now - JOB_LEASE_SECONDS
+        with self._connect() as conn:
+            failed = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE status = 'running' AND started_at < ? AND attempts >= max_attempts",
+                ("Worker lost while running the final attempt", now, cutoff)
+            ).rowcount
+            if failed:
+                logger.warning("Failed %d stale job(s) that reached max_attempts", failed)
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', available_at = ? WHERE status = 'running' AND started_at < ?",
+                (now, cutoff)
+            )
+            return cursor.rowcount
+
+    def run_job(self, job: Dict):
+        """Execute one claimed job and record its outcome and latency breakdown."""
+        handler = self._handlers.get(job["kind"])
+        started = time.time()
+        timings = {
+            "queue_wait_ms": round((started - job["created_at"]) * 1000, 1),
+            "attempt": job["attempts"],
+        }
+        try:
+            if handler is None:
+                raise PermanentJobError(f"No handler registered for '{job['kind']}'")
+            with prompt_metrics.capture() as llm_calls:
+                result = handler(json.loads(job["payload"]))
+        except Exception as e:
+            timings["run_ms"] = round((time.time() - started) * 1000, 1)
+            retry_after = getattr(e, 'retry_after', None)
+            if isinstance(e, PermanentJobError) or job["attempts"] >= job["max_attempts"]:
+                logger.warning("Job %s (%s) failed: %s", job["job_id"], job["kind"], e)
+                self._finish(job["job_id"], "failed", error=str(e), timings=timings)
+            else:
+                # Jittered exponential backoff, or the delay the rate limiter asked for
+                delay = retry_after if retry_after else random.uniform(0.5, 1.0) * 5 * 2 ** (job["attempts"] - 1)
+                logger.info("Job %s attempt %d failed (%s), retrying in %.0fs", job["job_id"], job["attempts"], e, delay)
+                self._finish(job["job_id"], "queued", error=str(e), timings=timings, available_at=time.time() + delay)
+            return
+        timings["run_ms"] = round((time.time() - started) * 1000, 1)
+        timings["total_ms"] = round((time.time() - job["created_at"]) * 1000, 1)
+        timings["llm_calls"] = [
+            {key: entry.get(key) for key in ("chain", "prompt_tokens", "latency_ms", "first_token_ms", "cached", "coalesced") if key in entry}
+            for entry in llm_calls
+        ]
+        timings["llm_ms"] = round(sum(entry.get("latency_ms", 0) for entry in llm_calls), 1)
+        self._finish(job["job_id"], "succeeded", result=result, timings=timings)
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        for field in ("payload", "result", "timings"):
+            if job.get(field):
+                job[field] = json.loads(job[field])
+        for field in ("created_at", "available_at", "started_at", "finished_at"):
+            if job.get(field):
+                job[field] = datetime.fromtimestamp(job[field]).isoformat(timespec='seconds')
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Most recent jobs without their results."""
+        sql = "SELECT job_id, kind, payload, status, attempts, max_attempts, error, timings, created_at, available_at, started_at, finished_at FROM jobs"
+        params: list = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["total"] for row in rows}
+
+
+class JobWorkers:
+    """Background threads that poll the queue and run jobs, concurrency at a time."""
+    def __init__(self, queue: JobQueue, concurrency: int = JOB_WORKERS, poll_seconds: float = 1.0):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _loop(self, name: str):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(name)
+            except sqlite3.Error as e:
+                logger.warning("Job queue claim failed: %s", e)
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_seconds)
+                continue
+            self.queue.run_job(job)
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        requeued = self.queue.requeue_stale()
+        if requeued:
+            logger.info("Re-queued %d stale job(s)", requeued)
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(self.concurrency):
+            name = f"{prefix}:worker-{i}"
+            thread = threading.Thread(target=self._loop, args=(name,), name=f"job-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+def _meal_plan_job(payload: Dict) -> Dict:
+    from llm_registry import llm_registry
+    from nutrition_chain import generate_meal_plan_pipeline, generate_structured_meal_plan
+    if payload.get("structured"):
+        try:
+            return generate_structured_meal_plan(
+                payload["patient_id"],
+                available_ingredients=payload.get("available_foods"),
+                religion=payload.get("religion"),
+                nutrition_ai=llm_registry.nutrition_ai()
+            )
+        except ValueError as e:
+            if "Patient data not found" in str(e):
+                raise PermanentJobError(str(e))
+            raise
+    result = generate_meal_plan_pipeline(
+        payload["patient_id"],
+        available_ingredients=payload.get("available_foods"),
+        religion=payload.get("religion"),
+        nutrition_ai=llm_registry.nutrition_ai()
+    )
+    if result["meal_plan"].startswith("Error: Patient"):
+        raise PermanentJobError(result["meal_plan"])
+    return result
+
+
+def _assessment_job(payload: Dict) -> Dict:
+    from nutrition_chain import generate_patient_assessment
+    assessment = generate_patient_assessment(payload["patient_id"])
+    if assessment.get("error"):
+        raise PermanentJobError(assessment["error"])
+    if assessment.get("patient_profile_summary", "").startswith("Error generating assessment"):
+        # generate_patient_assessment reports LLM failures in-band; surface them so the job is retried
+        raise RuntimeError(assessment["patient_profile_summary"])
+    return {"patient_id": payload["patient_id"], "assessment": assessment}
+
+
+job_queue = JobQueue()
+job_queue.register("meal_plan", _meal_plan_job)
+job_queue.register("assessment", _assessment_job)
+job_workers = JobWorkers(job_queue)
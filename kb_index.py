@@ -0,0 +1,151 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "that", "the", "to", "with",
+}
+# Summaries up to this length are stored as a single chunk, longer ones line by line
+SINGLE_CHUNK_CHARS = 500
+# Upper bound on indexed tokens per chunk; longer lines are split into windows
+MAX_CHUNK_TOKENS = 120
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens without stopwords."""
+    if not text:
+        return []
+    return [tok for tok in TOKEN_RE.findall(text.lower()) if tok not in STOPWORDS]
+
+
+def normalize_chunk_text(text: str) -> str:
+    """Collapse whitespace and strip markdown bullets/emphasis from a chunk."""
+    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
+    text = re.sub(r'^\s*(?:[-*•]|\d+[.)])\s+', '', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _split_long(text: str, max_tokens: int) -> List[str]:
+    words = text.split(' ')
+    if len(tokenize(text)) <= max_tokens:
+        return [text]
+    return [' '.join(words[i:i + max_tokens]) for i in range(0, len(words), max_tokens)]
+
+
+def build_chunks(ai_summary: str, max_tokens: int = MAX_CHUNK_TOKENS) -> List[Dict]:
+    """
+    Split a knowledge base summary into normalized, size-bounded chunks with
+    precomputed token counts and term frequencies, ready for the knowledge_chunks table.
+    """
+    if not ai_summary or not ai_summary.strip():
+        return []
+    if len(ai_summary) <= SINGLE_CHUNK_CHARS:
+        pieces = [normalize_chunk_text(ai_summary)]
+    else:
+        pieces = [normalize_chunk_text(line) for line in ai_summary.split('\n')]
+    chunks = []
+    for piece in pieces:
+        for text in _split_long(piece, max_tokens) if piece else []:
+            term_freqs = Counter(tokenize(text))
+            if not term_freqs:
+                continue
+            chunks.append({
+                "chunk_index": len(chunks),
+                "chunk_text": text,
+                "token_count": sum(term_freqs.values()),
+                "term_freqs": dict(term_freqs),
+            })
+    return chunks
+
+
+class KnowledgeIndex:
+    """
+    In-memory BM25 inverted index over knowledge base chunks.
+    Only term statistics are held here; chunk text stays in the knowledge_chunks table
+    and is read for the top-ranked chunk ids. Documents are added and removed by kb_id so
+    the index can follow save_knowledge_base / delete_knowledge_base_entry.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._chunks: Dict[int, Tuple[str, int, Tuple[str, ...]]] = {}  # chunk_id -> (kb_id, length, terms)
+        self._doc_chunks: Dict[str, List[int]] = {}
+        self._total_length = 0
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def document_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._doc_chunks)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._chunks.clear()
+            self._doc_chunks.clear()
+            self._total_length = 0
+            self.loaded = False
+
+    def add(self, kb_id, chunks: Iterable[Tuple[int, Dict[str, int]]]):
+        """Index (chunk_id, term_freqs) pairs for one knowledge base entry, replacing any previous version."""
+        kb_id = str(kb_id)
+        with self._lock:
+            self._remove_locked(kb_id)
+            chunk_ids = []
+            for chunk_id, term_freqs in chunks:
+                if not term_freqs:
+                    continue
+                length = sum(term_freqs.values())
+                self._chunks[chunk_id] = (kb_id, length, tuple(term_freqs))
+                self._total_length += length
+                for term, tf in term_freqs.items():
+                    self._postings.setdefault(term, {})[chunk_id] = tf
+                chunk_ids.append(chunk_id)
+            if chunk_ids:
+                self._doc_chunks[kb_id] = chunk_ids
+
+    def remove(self, kb_id):
+        """Drop every chunk of a knowledge base entry from the index."""
+        with self._lock:
+            self._remove_locked(str(kb_id))
+
+    def _remove_locked(self, kb_id: str):
+        for chunk_id in self._doc_chunks.pop(kb_id, []):
+            _, length, terms = self._chunks.pop(chunk_id)
+            self._total_length -= length
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """Return up to k (chunk_id, score) pairs ranked by BM25."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._chunks)
+            if not terms or n == 0:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    length = self._chunks[chunk_id][1]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
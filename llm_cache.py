@@ -0,0 +1,289 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from dotenv import load_dotenv
+
+from prompt_budget import estimate_tokens, prompt_metrics
+from rate_limiter import groq_limiter
+from single_flight import SingleFlight
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(prompt: str, params: Dict) -> str:
+    """Content address for one generation: the fully rendered prompt plus model parameters."""
+    payload = json.dumps({"prompt": prompt, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def patient_tag(patient_id) -> str:
+    return f"patient:{patient_id}"
+
+
+FOODS_TAG = "foods"
+
+
+class GenerationCache:
+    """
+    LLM generation cache: a size-bounded in-memory LRU with TTL, plus an optional
+    on-disk tier (one JSON file per key) shared by processes pointing at the same directory.
+    Entries carry tags (e.g. "patient:12", "foods") so data changes can evict them.
+    """
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 21600, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, expires_at, tags)
+        self._tag_index: Dict[str, set] = {}
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            self._delete_disk(key)
+            return None
+        return entry
+
+    def _write_disk(self, key: str, value, expires_at: float, tags):
+        if not self.disk_dir:
+            return
+        tmp_path = self._disk_path(key) + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"value": value, "expires_at": expires_at, "tags": list(tags)}, f)
+            os.replace(tmp_path, self._disk_path(key))
+        except (OSError, TypeError) as e:
+            logger.warning("Could not write LLM cache entry to disk: %s", e)
+
+    def _delete_disk(self, key: str):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _store_locked(self, key: str, value, expires_at: float, tags):
+        self._drop_locked(key)
+        self._entries[key] = (value, expires_at, tuple(tags))
+        for tag in tags:
+            self._tag_index.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop_locked(next(iter(self._entries)))
+
+    def _drop_locked(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+    def get(self, key: str):
+        """Cached value for key, or None when missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._drop_locked(key)
+        disk_entry = self._read_disk(key)
+        with self._lock:
+            if disk_entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.max_entries > 0:
+                self._store_locked(key, disk_entry["value"], disk_entry["expires_at"], disk_entry.get("tags", ()))
+        return disk_entry["value"]
+
+    def set(self, key: str, value, tags: Iterable[str] = ()):
+        tags = tuple(tags)
+        expires_at = time.time() + self.ttl_seconds
+        if self.max_entries > 0:
+            with self._lock:
+                self._store_locked(key, value, expires_at, tags)
+        self._write_disk(key, value, expires_at, tags)
+
+    def get_or_compute(self, prompt: str, params: Dict, compute: Callable[[], Any], tags: Iterable[str] = ()):
+        """Return the cached generation for prompt+params, calling compute() on a miss. Errors are not cached."""
+        key = make_cache_key(prompt, params)
+        value = self.get(key)
+        if value is not None:
+            logger.debug("LLM cache hit %s", key[:12])
+            return value
+        value = compute()
+        if value is not None:
+            self.set(key, value, tags)
+        return value
+
+    def invalidate_tag(self, tag: str):
+        """Evict every entry carrying tag, in memory and on disk."""
+        with self._lock:
+            for key in list(self._tag_index.get(tag, ())):
+                self._drop_locked(key)
+        if not self.disk_dir:
+            return
+        try:
+            names = os.listdir(self.disk_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            entry = self._read_disk(key)
+            if entry and tag in entry.get("tags", ()):
+                self._delete_disk(key)
+
+    def invalidate_patient(self, patient_id):
+        self.invalidate_tag(patient_tag(patient_id))
+
+    def invalidate_foods(self):
+        self.invalidate_tag(FOODS_TAG)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tag_index.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_dir": self.disk_dir,
+            }
+
+
+def llm_params(llm) -> Dict:
+    """Model parameters that change the output of a ChatGroq/LangChain LLM."""
+    return {
+        "model": getattr(llm, 'model_name', None),
+        "temperature": getattr(llm, 'temperature', None),
+        "max_tokens": getattr(llm, 'max_tokens', None),
+    }
+
+
+def max_output_tokens(llm) -> int:
+    """Completion tokens reserved against the tokens/min limit before a call."""
+    return getattr(llm, 'max_tokens', None) or 1024
+
+
+def run_chain_llm(chain, inputs: Dict, prompt: Optional[str] = None) -> str:
+    """chain.run(**inputs) behind the shared Groq rate limiter (queueing, retries, circuit breaker)."""
+    prompt = prompt if prompt is not None else chain.prompt.format(**inputs)
+    return groq_limiter.call(
+        lambda: chain.run(**inputs),
+        prompt_tokens=estimate_tokens(prompt),
+        max_output_tokens=max_output_tokens(chain.llm),
+        count_output=estimate_tokens
+    )
+
+
+def run_chain_cached(chain, inputs: Dict, tags: Iterable[str] = (), name: Optional[str] = None, validate: Optional[Callable[[str], Any]] = None) -> str:
+    """
+    chain.run(**inputs), served from generation_cache when the rendered prompt was seen before.
+    Concurrent calls with the same prompt share one in-flight generation.
+    validate(result) may raise to reject a fresh generation; rejected results are not cached.
+    Records prompt size, latency and cache status for the chain name in prompt_metrics.
+    """
+    prompt = chain.prompt.format(**inputs)
+    params = llm_params(chain.llm)
+    entry = prompt_metrics.take_pending(name)
+    called = []
+
+    def compute():
+        called.append(True)
+        result = run_chain_llm(chain, inputs, prompt)
+        if validate is not None:
+            validate(result)
+        return result
+
+    start = time.perf_counter()
+    result, shared = llm_flights.do(
+        make_cache_key(prompt, params),
+        lambda: generation_cache.get_or_compute(prompt, params, compute, tags)
+    )
+    entry.update(
+        prompt_tokens=estimate_tokens(prompt),
+        latency_ms=round((time.perf_counter() - start) * 1000, 1),
+        cached=not called and not shared,
+        coalesced=shared
+    )
+    prompt_metrics.record(entry)
+    return result
+
+
+def stream_chain_cached(chain, inputs: Dict, tags: Iterable[str] = (), name: Optional[str] = None) -> Iterator[str]:
+    """
+    Streaming counterpart of run_chain_cached: yields text chunks from the chain's LLM and caches
+    the full text once the stream completes. A cache hit is yielded as a single chunk.
+    """
+    prompt = chain.prompt.format(**inputs)
+    entry = prompt_metrics.take_pending(name)
+    entry["prompt_tokens"] = estimate_tokens(prompt)
+    key = make_cache_key(prompt, llm_params(chain.llm))
+    start = time.perf_counter()
+    cached = generation_cache.get(key)
+    if cached is not None:
+        entry.update(latency_ms=round((time.perf_counter() - start) * 1000, 1), cached=True)
+        prompt_metrics.record(entry)
+        yield cached
+        return
+    parts = []
+    chunks = groq_limiter.stream(
+        lambda: chain.llm.stream(prompt),
+        prompt_tokens=entry["prompt_tokens"],
+        max_output_tokens=max_output_tokens(chain.llm),
+        count_output=lambda streamed: sum(estimate_tokens(getattr(c, 'content', c) or '') for c in streamed)
+    )
+    for chunk in chunks:
+        text = getattr(chunk, 'content', chunk)
+        if text:
+            if not parts:
+                entry["first_token_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            parts.append(text)
+            yield text
+    entry.update(latency_ms=round((time.perf_counter() - start) * 1000, 1), cached=False)
+    prompt_metrics.record(entry)
+    if parts:
+        generation_cache.set(key, "".join(parts), tags)
+
+
+# Identical prompts generated concurrently (e.g. the analysis for one patient requested twice)
+llm_flights = SingleFlight()
+
+generation_cache = GenerationCache(
+    max_entries=int(os.getenv('LLM_CACHE_SIZE', '256')),
+    ttl_seconds=float(os.getenv('LLM_CACHE_TTL_SECONDS', '21600')),
+    disk_dir=os.getenv('LLM_CACHE_DIR') or None,
+)
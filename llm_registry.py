@@ -0,0 +1,137 @@
+import os
+import threading
+from typing import Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from groq import Groq
+from langchain.chains import LLMChain
+from langchain.prompts import PromptTemplate
+from langchain_groq import ChatGroq
+
+load_dotenv()
+
+DEFAULT_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+
+class LLMRegistry:
+    """
+    Process-wide Groq clients, ChatGroq models, compiled PromptTemplates and LLMChains.
+    Everything is built once and shared across threads (FastAPI worker threads, Streamlit sessions),
+    so HTTP keep-alive connections are reused instead of re-created per request.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._http_client = None
+        self._groq_client = None
+        self._llms: Dict[tuple, ChatGroq] = {}
+        self._prompts: Dict[str, PromptTemplate] = {}
+        self._chains: Dict[tuple, LLMChain] = {}
+        self._nutrition_ai = None
+
+    @staticmethod
+    def api_key() -> str:
+        api_key = os.getenv('GROQ_API_KEY')
+        if not api_key:
+            raise ValueError("GROQ_API_KEY not found in environment variables")
+        return api_key
+
+    def http_client(self) -> httpx.Client:
+        """Pooled HTTP client shared by every Groq call in the process."""
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    max_connections = int(os.getenv('GROQ_MAX_CONNECTIONS', '20'))
+                    self._http_client = httpx.Client(
+                        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                        timeout=float(os.getenv('GROQ_TIMEOUT_SECONDS', '120'))
+                    )
+        return self._http_client
+
+    def groq_client(self) -> Groq:
+        if self._groq_client is None:
+            with self._lock:
+                if self._groq_client is None:
+                    # Retries are owned by rate_limiter.groq_limiter, not the SDK
+                    self._groq_client = Groq(api_key=self.api_key(), http_client=self.http_client(), max_retries=0)
+        return self._groq_client
+
+    def llm(self, temperature: float = 0.3, max_tokens: Optional[int] = None, model: str = DEFAULT_MODEL, json_mode: bool = False) -> ChatGroq:
+        """Shared ChatGroq instance for a model/temperature/max_tokens combination; json_mode forces a JSON object response."""
+        key = (model, temperature, max_tokens, json_mode)
+        llm = self._llms.get(key)
+        if llm is None:
+            with self._lock:
+                llm = self._llms.get(key)
+                if llm is None:
+                    llm = ChatGroq(
+                        groq_api_key=self.api_key(),
+                        model_name=model,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        max_retries=0,
+                        http_client=self.http_client(),
+                        model_kwargs={"response_format": {"type": "json_object"}} if json_mode else {}
+                    )
+                    self._llms[key] = llm
+        return llm
+
+    def register_prompt(self, name: str, template: str, input_variables: List[str]) -> PromptTemplate:
+        """Compile a PromptTemplate once under name; later registrations of the same name return it."""
+        prompt = self._prompts.get(name)
+        if prompt is None:
+            with self._lock:
+                prompt = self._prompts.get(name)
+                if prompt is None:
+                    prompt = PromptTemplate(input_variables=input_variables, template=template)
+                    self._prompts[name] = prompt
+        return prompt
+
+    def prompt(self, name: str) -> PromptTemplate:
+        try:
+            return self._prompts[name]
+        except KeyError:
+            raise KeyError(f"Prompt '{name}' has not been registered") from None
+
+    def chain(self, name: str, temperature: float = 0.3, max_tokens: Optional[int] = None, model: str = DEFAULT_MODEL, json_mode: bool = False) -> LLMChain:
+        """Shared LLMChain for a registered prompt and model settings."""
+        key = (name, model, temperature, max_tokens, json_mode)
+        chain = self._chains.get(key)
+        if chain is None:
+            with self._lock:
+                chain = self._chains.get(key)
+                if chain is None:
+                    chain = LLMChain(llm=self.llm(temperature, max_tokens, model, json_mode), prompt=self.prompt(name))
+                    self._chains[key] = chain
+        return chain
+
+    def nutrition_ai(self):
+        """Shared ChildNutritionAI instance."""
+        if self._nutrition_ai is None:
+            with self._lock:
+                if self._nutrition_ai is None:
+                    from nutrition_ai import ChildNutritionAI
+                    self._nutrition_ai = ChildNutritionAI()
+        return self._nutrition_ai
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "llms": len(self._llms),
+                "prompts": sorted(self._prompts),
+                "chains": len(self._chains),
+                "http_client_open": self._http_client is not None and not self._http_client.is_closed,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._groq_client = None
+            self._llms.clear()
+            self._chains.clear()
+            self._nutrition_ai = None
+
+
+llm_registry = LLMRegistry()
@@ -0,0 +1,211 @@
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from food_selector import (
+    SOFT_TEXTURE_TERMS,
+    _food_text,
+    _split_terms,
+    _terms_pattern,
+    child_age_months,
+    child_exclusions,
+    is_excluded,
+    priority_tags,
+)
+from meal_plan_schema import Meal, MealItem, MealPlanDay, StructuredMealPlan
+
+logger = logging.getLogger(__name__)
+
+# Meal slots and their share of the daily energy target
+MEAL_SLOTS = (("breakfast", 0.25), ("lunch", 0.30), ("snack", 0.15), ("dinner", 0.30))
+# Share of a lunch/dinner target given to the staple (rice, lugaw, root crops...)
+STAPLE_SHARE = 0.4
+
+# Daily kcal expected from food, by age band (upper bound in months, exclusive):
+# (breastfed child: complementary foods only, not breastfed: full requirement). Follows the PDRI/WHO bands.
+AGE_KCAL_TARGETS = [
+    (9, 200, 600),
+    (12, 300, 700),
+    (24, 550, 1000),
+    (36, 1000, 1000),
+    (61, 1350, 1350),
+]
+# Portion limits in grams per item, by age band (upper bound in months, exclusive)
+PORTION_LIMITS = [(12, 15, 80), (24, 20, 120), (61, 30, 200)]
+
+STAPLE_TERMS = ["rice", "kanin", "lugaw", "porridge", "arroz", "camote", "kamote", "bread", "pandesal", "noodle",
+                "pancit", "pansit", "corn", "mais", "oatmeal", "potato", "patatas", "gabi", "cassava", "kamoteng kahoy"]
+SNACK_TERMS = ["banana", "saging", "fruit", "papaya", "mango", "mangga", "biscuit", "yogurt", "camote", "kamote",
+               "puto", "suman", "avocado", "guava", "bayabas", "pineapple", "pinya", "melon", "watermelon", "pakwan"]
+
+# Score weights: nutrition/ingredient fit versus energy fit versus repetition
+FIT_WEIGHT = 10.0
+REPEAT_PENALTY = 4.0
+SAME_DAY_PENALTY = 8.0
+
+
+def daily_kcal_target(patient_data: Dict) -> int:
+    """Daily energy (kcal) the plan's foods should provide for this child's age and feeding."""
+    age_months = child_age_months(patient_data)
+    if age_months < 6:
+        raise ValueError("Children under 6 months should be exclusively breastfed; no food plan is generated")
+    breastfeeding = str(patient_data.get('breastfeeding') or '').strip().lower() in ("yes", "y", "true", "1")
+    for upper, breastfed_kcal, full_kcal in AGE_KCAL_TARGETS:
+        if age_months < upper:
+            return breastfed_kcal if breastfeeding else full_kcal
+    return AGE_KCAL_TARGETS[-1][2]
+
+
+def _portion_limits(age_months: int):
+    for upper, low, high in PORTION_LIMITS:
+        if age_months < upper:
+            return low, high
+    return PORTION_LIMITS[-1][1], PORTION_LIMITS[-1][2]
+
+
+class _Catalog:
+    """The candidate foods for one child as parallel arrays."""
+    def __init__(self, foods: List[Dict], patient_data: Dict, available_ingredients: Optional[str], religion: Optional[str], excluded=None):
+        age_months = child_age_months(patient_data)
+        exclusion_re = _terms_pattern(child_exclusions(patient_data, religion)) if excluded is None else None
+        ingredient_re = _terms_pattern(_split_terms(available_ingredients))
+        soft_re = _terms_pattern(SOFT_TEXTURE_TERMS) if age_months < 24 else None
+        staple_re = _terms_pattern(STAPLE_TERMS)
+        snack_re = _terms_pattern(SNACK_TERMS)
+        wanted_tags = priority_tags(patient_data)
+
+        rows = []
+        for food in sorted(foods, key=lambda f: (f.get('food_id') is None, f.get('food_id') or 0)):
+            try:
+                kcal = float(food.get('energy_kcal') or 0)
+            except (TypeError, ValueError):
+                continue
+            if kcal <= 0 or not food.get('food_name_and_description'):
+                continue
+            if is_excluded(food, excluded, exclusion_re):
+                continue
+            text = _food_text(food)
+            tags = (food.get('nutrition_tags') or '').lower()
+            rows.append((
+                food, kcal,
+                sum(1 for tag in wanted_tags if tag in tags),
+                bool(ingredient_re and ingredient_re.search(text)),
+                bool(soft_re and soft_re.search(text)),
+                bool(tags),
+                bool(staple_re.search(text)),
+                bool(snack_re.search(text)),
+            ))
+        self.foods = [row[0] for row in rows]
+        self.kcal_per_100g = np.array([row[1] for row in rows], dtype=float)
+        tag_hits = np.array([row[2] for row in rows], dtype=float)
+        ingredient = np.array([row[3] for row in rows], dtype=bool)
+        soft = np.array([row[4] for row in rows], dtype=bool)
+        tagged = np.array([row[5] for row in rows], dtype=bool)
+        self.staple = np.array([row[6] for row in rows], dtype=bool)
+        self.snack = np.array([row[7] for row in rows], dtype=bool)
+        # Same preferences select_foods ranks by; a tiny index term makes ties deterministic
+        self.base_score = 3 * tag_hits + 5 * ingredient + 2 * soft + tagged - np.arange(len(rows)) * 1e-9
+        self.portion_low, self.portion_high = _portion_limits(age_months)
+
+    def __len__(self):
+        return len(self.foods)
+
+
+def _pick(catalog: _Catalog, target_kcal: float, mask: np.ndarray, usage: np.ndarray, used_today: np.ndarray,
+          bonus: Optional[np.ndarray] = None, max_grams: Optional[float] = None):
+    """Best food for one slot as (index, grams), or None when no candidate is allowed."""
+    if not mask.any() or target_kcal <= 0:
+        return None
+    max_grams = max_grams or catalog.portion_high
+    grams = np.clip(target_kcal / catalog.kcal_per_100g * 100, catalog.portion_low, max_grams)
+    kcal = grams * catalog.kcal_per_100g / 100
+    fit = -np.abs(kcal - target_kcal) / target_kcal
+    score = catalog.base_score + FIT_WEIGHT * fit - REPEAT_PENALTY * usage - SAME_DAY_PENALTY * used_today
+    if bonus is not None:
+        score = score + bonus
+    score = np.where(mask, score, -np.inf)
+    index = int(np.argmax(score))
+    # Portions are rounded to 5 g so they are practical to measure
+    return index, float(max(np.round(grams[index] / 5) * 5, 5))
+
+
+def optimize_meal_plan(
+    foods: List[Dict],
+    patient_data: Dict,
+    available_ingredients: Optional[str] = None,
+    religion: Optional[str] = None,
+    days: int = 7,
+    kcal_target: Optional[float] = None,
+    excluded=None
+) -> StructuredMealPlan:
+    """
+    Deterministic local meal plan: days x (breakfast, lunch, snack, dinner) from the foods table.
+    Unsafe foods (allergens, religious restrictions, age hazards) are excluded; each slot greedily takes
+    the food whose clipped portion lands closest to the slot's share of the remaining daily kcal, favouring
+    priority nutrition tags, available ingredients and soft textures, and penalising repeats for variety.
+    excluded is an exclusion_index Exclusions for the child (otherwise exclusion terms are matched per food).
+    Raises ValueError for children under 6 months or when no usable food remains.
+    """
+    target = float(kcal_target or daily_kcal_target(patient_data))
+    catalog = _Catalog(foods, patient_data, available_ingredients, religion, excluded)
+    if not len(catalog):
+        raise ValueError("No foods with energy values are safe for this child")
+    everything = np.ones(len(catalog), dtype=bool)
+    snack_bonus = np.where(catalog.snack, 3.0, 0.0)
+    usage = np.zeros(len(catalog))
+
+    plan_days = []
+    for day_number in range(1, days + 1):
+        used_today = np.zeros(len(catalog))
+        remaining_kcal = target
+        remaining_share = 1.0
+        meals = []
+        for meal_type, share in MEAL_SLOTS:
+            slot_target = remaining_kcal * share / remaining_share
+            remaining_share -= share
+            if meal_type in ("lunch", "dinner") and catalog.staple.any() and (~catalog.staple).any():
+                staple = _pick(catalog, slot_target * STAPLE_SHARE, catalog.staple, usage, used_today)
+                main = _pick(catalog, slot_target * (1 - STAPLE_SHARE), ~catalog.staple, usage, used_today)
+                picks = [p for p in (main, staple) if p]
+            else:
+                is_snack = meal_type == "snack"
+                pick = _pick(
+                    catalog, slot_target, everything, usage, used_today,
+                    bonus=snack_bonus if is_snack else None,
+                    max_grams=catalog.portion_high * 0.6 if is_snack else None
+                )
+                picks = [pick] if pick else []
+            items = []
+            for index, grams in picks:
+                usage[index] += 1
+                used_today[index] += 1
+                kcal = round(grams * catalog.kcal_per_100g[index] / 100, 1)
+                food = catalog.foods[index]
+                items.append(MealItem(
+                    food_id=food.get('food_id'),
+                    food_name=food['food_name_and_description'],
+                    portion=f"{grams:.0f} g",
+                    kcal=kcal
+                ))
+            meal_kcal = round(sum(item.kcal for item in items), 1)
+            remaining_kcal = max(remaining_kcal - meal_kcal, 0.0)
+            if items:
+                meals.append(Meal(
+                    meal_type=meal_type,
+                    dish=" with ".join(item.food_name for item in items),
+                    items=items,
+                    kcal=meal_kcal
+                ))
+        plan_days.append(MealPlanDay(day=day_number, meals=meals, total_kcal=round(sum(m.kcal for m in meals), 1)))
+
+    plan = StructuredMealPlan(
+        estimated_daily_kcal=target,
+        days=plan_days,
+        notes="Draft computed from the food database (portions in grams of the food as listed); review with your nutritionist."
+    )
+    logger.info(
+        "Meal optimizer: %d candidate foods, target %.0f kcal/day, daily totals %s",
+        len(catalog), target, [day.total_kcal for day in plan_days]
+    )
+    return plan
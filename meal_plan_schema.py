@@ -0,0 +1,218 @@
+import json
+import re
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+MEAL_TYPES = ("breakfast", "lunch", "snack", "dinner")
+
+
+class MealItem(BaseModel):
+    food_id: Optional[int] = None
+    food_name: str
+    portion: str = ""
+    kcal: Optional[float] = Field(default=None, ge=0)
+
+
+class Meal(BaseModel):
+    meal_type: str
+    dish: str
+    items: List[MealItem] = Field(default_factory=list)
+    kcal: Optional[float] = Field(default=None, ge=0)
+    benefit: str = ""
+
+    @field_validator("meal_type")
+    @classmethod
+    def normalize_meal_type(cls, value: str) -> str:
+        return value.strip().lower()
+
+
+class MealPlanDay(BaseModel):
+    day: int = Field(ge=1, le=7)
+    meals: List[Meal] = Field(min_length=1)
+    total_kcal: Optional[float] = Field(default=None, ge=0)
+
+
+class StructuredMealPlan(BaseModel):
+    """Schema the structured meal plan generation mode must follow (days -> meals -> foods)."""
+    estimated_daily_kcal: Optional[float] = Field(default=None, ge=0)
+    days: List[MealPlanDay] = Field(min_length=1, max_length=7)
+    notes: str = ""
+
+
+STRUCTURED_OUTPUT_INSTRUCTIONS = """### OUTPUT FORMAT
+Respond with ONE JSON object and nothing else (no markdown, no commentary), matching:
+{
+  "estimated_daily_kcal": number,
+  "days": [
+    {
+      "day": 1,
+      "meals": [
+        {
+          "meal_type": "breakfast" | "lunch" | "snack" | "dinner",
+          "dish": "dish name",
+          "items": [{"food_id": id from the FOOD DATABASE, "food_name": "name as listed", "portion": "e.g. 1/2 cup", "kcal": number}],
+          "kcal": number,
+          "benefit": "short nutrition benefit"
+        }
+      ],
+      "total_kcal": number
+    }
+  ],
+  "notes": "short feeding notes for the parent"
+}
+Include all 7 days, each with breakfast, lunch, snack and dinner. food_id must be the [id] shown in the FOOD DATABASE."""
+
+
+def _extract_json(text: str) -> str:
+    """The JSON object in an LLM response, tolerating code fences or stray prose around it."""
+    text = (text or "").strip()
+    fenced = re.search(r"```(?:json)?\s*(\{.*\})\s*```", text, re.DOTALL)
+    if fenced:
+        return fenced.group(1)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object in meal plan response")
+    return text[start:end + 1]
+
+
+def parse_structured_plan(text: str, foods: Optional[List[Dict]] = None) -> StructuredMealPlan:
+    """
+    Validate an LLM response against StructuredMealPlan. When foods is given, food ids that are not in
+    the list are resolved by name (or cleared), and missing meal/day kcal totals are filled in.
+    Raises ValueError when the response does not match the schema.
+    """
+    try:
+        plan = StructuredMealPlan.model_validate_json(_extract_json(text))
+    except ValidationError as e:
+        raise ValueError(f"Meal plan does not match the schema: {e.error_count()} error(s), first: {e.errors()[0]['msg']}") from None
+    ids = {}
+    by_name = {}
+    for food in foods or []:
+        if food.get('food_id') is not None:
+            ids[int(food['food_id'])] = food
+            by_name[str(food.get('food_name_and_description') or '').strip().lower()] = food
+    for day in plan.days:
+        for meal in day.meals:
+            for item in meal.items:
+                if foods is not None and item.food_id not in ids:
+                    match = by_name.get(item.food_name.strip().lower())
+                    item.food_id = int(match['food_id']) if match else None
+            if meal.kcal is None and any(item.kcal is not None for item in meal.items):
+                meal.kcal = sum(item.kcal or 0 for item in meal.items)
+        if day.total_kcal is None and any(meal.kcal is not None for meal in day.meals):
+            day.total_kcal = sum(meal.kcal or 0 for meal in day.meals)
+    plan.days.sort(key=lambda d: d.day)
+    return plan
+
+
+def render_meal_plan_text(plan: StructuredMealPlan) -> str:
+    """Readable text for a structured plan, in the "Day N:" / "Meal: ..." layout the UIs display."""
+    lines = []
+    if plan.estimated_daily_kcal:
+        lines.append(f"Estimated daily energy need: {plan.estimated_daily_kcal:.0f} kcal")
+        lines.append("")
+    for day in plan.days:
+        lines.append(f"Day {day.day}:")
+        for meal in day.meals:
+            portions = ", ".join(f"{item.food_name} ({item.portion})" if item.portion else item.food_name for item in meal.items)
+            line = f"{meal.meal_type.capitalize()}: {meal.dish}"
+            if portions:
+                line += f" - {portions}"
+            if meal.benefit:
+                line += f" - {meal.benefit}"
+            if meal.kcal is not None:
+                line += f" ({meal.kcal:.0f} kcal)"
+            lines.append(line)
+        if day.total_kcal is not None:
+            lines.append(f"Daily Total: {day.total_kcal:.0f} kcal")
+        lines.append("")
+    if plan.notes:
+        lines.append(f"Notes: {plan.notes}")
+    return "\n".join(lines).strip()
+
+
+def parse_plan_days(text: str) -> Dict[str, Dict[str, str]]:
+    """{"Day N": {meal: description}} from "Day N:" headed plan text with "Meal: description" lines."""
+    days = {}
+    current_day = None
+    current_meals = {}
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        day_match = re.match(r'^Day (\d+):', line)
+        if day_match:
+            if current_day and current_meals:
+                days[current_day] = current_meals
+            current_day = f"Day {day_match.group(1)}"
+            current_meals = {}
+        elif current_day and ':' in line:
+            meal, desc = line.split(':', 1)
+            meal = meal.strip().replace('-', '').replace(' ', '_').lower()
+            current_meals[meal] = desc.strip()
+    if current_day and current_meals:
+        days[current_day] = current_meals
+    return days
+
+
+def normalize_plan_details(plan_details) -> Dict:
+    """
+    The parsed form of a plan, computed once when it is saved and stored in plan_data:
+    {"text", "parsed_days", "structured"?, "nutrition"?, "validation"?}. Accepts a dict of those
+    parts, a plan_details value ({"text": ...} JSON) and plain plan text.
+    """
+    parsed = None
+    if isinstance(plan_details, dict):
+        parsed = plan_details
+    elif plan_details and str(plan_details).lstrip().startswith("{"):
+        try:
+            parsed = json.loads(plan_details)
+        except (TypeError, ValueError):
+            parsed = None
+    if not isinstance(parsed, dict) or "text" not in parsed:
+        parsed = {"text": str(plan_details or "")}
+    normalized = {"text": str(parsed.get("text") or "")}
+    structured = parsed.get("structured")
+    if structured:
+        normalized["structured"] = structured
+        normalized["parsed_days"] = {
+            f"Day {day['day']}": {meal['meal_type']: meal['dish'] for meal in day['meals']}
+            for day in structured.get("days", [])
+        }
+    else:
+        normalized["parsed_days"] = parse_plan_days(normalized["text"])
+    for report in ("nutrition", "validation"):
+        if parsed.get(report):
+            normalized[report] = parsed[report]
+    return normalized
+
+
+def plan_details_json(text: str) -> str:
+    """The plan_details value saved for a meal plan: {"text": ...} JSON, as the UIs have always stored it."""
+    return json.dumps({"text": text})
+
+
+def build_plan_data(
+    text: str,
+    structured: Optional[StructuredMealPlan] = None,
+    nutrition: Optional[Dict] = None,
+    validation: Optional[Dict] = None
+) -> Dict:
+    """The plan_data saved alongside a plan's text: parsed days, plus the structured plan and reports when available."""
+    details = {"text": text}
+    if structured is not None:
+        details["structured"] = structured.model_dump()
+    if nutrition:
+        details["nutrition"] = nutrition
+    if validation:
+        details["validation"] = validation
+    return normalize_plan_details(details)
+
+
+def plan_text(plan: Dict) -> str:
+    """The plain text of a meal plan row, from plan_data when it has been decoded, else from plan_details."""
+    plan_data = plan.get('plan_data')
+    if not isinstance(plan_data, dict):
+        plan_data = normalize_plan_details(plan.get('plan_details'))
+    return plan_data.get('text') or ''
@@ -1,39 +1,19 @@
 import os
-from groq import Groq
+import hashlib
 from dotenv import load_dotenv
 from data_manager import data_manager
 from typing import Dict, List, Optional
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_groq import ChatGroq
+from llm_registry import llm_registry
+from llm_cache import run_chain_cached, run_chain_llm, patient_tag
+from prompt_budget import PromptBuilder
 
 # Load environment variables
 load_dotenv()
 
-class ChildNutritionAI:
-    def analyze_child_nutrition(
-        self,
-        patient_id: int = None,
-        age_in_months: int = None,
-        allergies: str = None,
-        other_medical_problems: str = None,
-        parent_id: str = None,
-        notes: str = None,
-        treatment: str = None,
-        sex: str = None,
-        weight_for_age: str = None,
-        height_for_age: str = None,
-        bmi_for_age: str = None,
-        breastfeeding: str = None,
-        religion: str = None
-    ) -> str:
-        """Analyze a child's nutrition profile and return a summary or recommendations. No name or location info is used. Patient ID is included for database association only."""
-        try:
-            prompt_template = PromptTemplate(
-                input_variables=[
-                    "patient_id", "age_in_months", "allergies", "other_medical_problems", "parent_id", "notes", "treatment", "sex", "weight_for_age", "height_for_age", "bmi_for_age", "breastfeeding", "religion"
-                ],
-                template="""You are a pediatric nutrition expert. Analyze the following child's nutrition profile and provide a summary of their nutritional status, potential concerns, and general recommendations. Do NOT include or request any personal names or location information. Patient ID is included for database association only.
+NUTRITION_ANALYSIS_VARIABLES = [
+    "patient_id", "age_in_months", "allergies", "other_medical_problems", "parent_id", "notes", "treatment", "sex", "weight_for_age", "height_for_age", "bmi_for_age", "breastfeeding", "religion"
+]
+NUTRITION_ANALYSIS_TEMPLATE = """You are a pediatric nutrition expert. Analyze the following child's nutrition profile and provide a summary of their nutritional status, potential concerns, and general recommendations. Do NOT include or request any personal names or location information. Patient ID is included for database association only.
 
 CHILD PROFILE:
 - Patient ID: {patient_id}
@@ -51,57 +31,8 @@ CHILD PROFILE:
 - Treatment: {treatment}
 
 Give practical, parent-friendly advice and highlight any red flags or areas for improvement."""
-            )
-            chain = LLMChain(
-                llm=self.llm,
-                prompt=prompt_template
-            )
-            result = chain.run(
-                patient_id=patient_id,
-                age_in_months=age_in_months,
-                allergies=allergies,
-                other_medical_problems=other_medical_problems,
-                parent_id=parent_id,
-                notes=notes,
-                treatment=treatment,
-                sex=sex,
-                weight_for_age=weight_for_age,
-                height_for_age=height_for_age,
-                bmi_for_age=bmi_for_age,
-                breastfeeding=breastfeeding,
-                religion=religion
-            )
-            return result
-        except Exception as e:
-            return f"Error analyzing child nutrition: {str(e)}"
-    """
-    Enhanced Nutrition AI for children (0-5 years) with BMI, allergies, and medical conditions
-    """
-    
-    def __init__(self):
-        self.api_key = os.getenv('GROQ_API_KEY')
-        if not self.api_key:
-            raise ValueError("GROQ_API_KEY not found in environment variables")
-        
-        self.client = Groq(api_key=self.api_key)
-        
-        # Initialize LangChain LLM
-        self.llm = ChatGroq(
-            groq_api_key=self.api_key,
-            model_name="meta-llama/llama-4-scout-17b-16e-instruct",
-            temperature=0.3
-        )
-    
-    def summarize_pdf_for_nutrition_knowledge(self, pdf_text: str, pdf_name: str) -> List[str]:
-        """
-        Use LLM to extract nutrition and health information relevant to 0-5 year old children
-        Returns a list of bullet points/key insights
-        """
-        try:
-            # Create LangChain prompt template
-            prompt_template = PromptTemplate(
-                input_variables=["pdf_name", "pdf_text"],
-                template="""You are a pediatric nutrition expert. I'm uploading a PDF document titled "{pdf_name}" to build a knowledge base for meal planning for children aged 0-5 years.
+
+PDF_SUMMARY_TEMPLATE = """You are a pediatric nutrition expert. I'm uploading a PDF document titled "{pdf_name}" to build a knowledge base for meal planning for children aged 0-5 years.
 
 Please analyze the following text and extract ONLY information that is relevant to:
 - Nutrition for children 0-5 years old
@@ -123,19 +54,96 @@ INSTRUCTIONS:
 6. Each bullet point should be actionable or informative for meal planning
 
 """
-            )
-            
-            # Create LangChain chain
-            chain = LLMChain(
-                llm=self.llm,
-                prompt=prompt_template
-            )
+
+llm_registry.register_prompt("nutrition_analysis", NUTRITION_ANALYSIS_TEMPLATE, NUTRITION_ANALYSIS_VARIABLES)
+llm_registry.register_prompt("pdf_summary", PDF_SUMMARY_TEMPLATE, ["pdf_name", "pdf_text"])
+
+class ChildNutritionAI:
+    def analyze_child_nutrition(
+        self,
+        patient_id: int = None,
+        age_in_months: int = None,
+        allergies: str = None,
+        other_medical_problems: str = None,
+        parent_id: str = None,
+        notes: str = None,
+        treatment: str = None,
+        sex: str = None,
+        weight_for_age: str = None,
+        height_for_age: str = None,
+        bmi_for_age: str = None,
+        breastfeeding: str = None,
+        religion: str = None,
+        output_template: Optional[str] = None
+    ) -> str:
+        """
+        Analyze a child's nutrition profile and return a summary or recommendations. No name or location info is used. Patient ID is included for database association only.
+        output_template, if given, is appended to the prompt as structured-output instructions (literal braces must be doubled).
+        Groq failures propagate (rate_limiter.CircuitOpenError, or the last 429/5xx once retries run out).
+        """
+        prompt_name = "nutrition_analysis"
+        template = NUTRITION_ANALYSIS_TEMPLATE
+        if output_template:
+            # Each structured-output variant is compiled once under its own name
+            prompt_name = f"nutrition_analysis:{hashlib.sha1(output_template.encode('utf-8')).hexdigest()[:12]}"
+            template = f"{NUTRITION_ANALYSIS_TEMPLATE}\n\n{output_template}"
+        llm_registry.register_prompt(prompt_name, template, NUTRITION_ANALYSIS_VARIABLES)
+        chain = llm_registry.chain(prompt_name, temperature=0.3)
+        inputs = dict(
+            patient_id=patient_id,
+            age_in_months=age_in_months,
+            allergies=allergies,
+            other_medical_problems=other_medical_problems,
+            parent_id=parent_id,
+            notes=notes,
+            treatment=treatment,
+            sex=sex,
+            weight_for_age=weight_for_age,
+            height_for_age=height_for_age,
+            bmi_for_age=bmi_for_age,
+            breastfeeding=breastfeeding,
+            religion=religion
+        )
+        # Accumulated nutritionist notes are the only open-ended field; trim them to the budget
+        builder = PromptBuilder("nutrition_analysis", template)
+        for name, value in inputs.items():
+            if name in ("notes", "treatment"):
+                continue
+            builder.fixed(name, value)
+        builder.section("notes", str(notes or ''), priority=2, by_lines=False, min_tokens=60)
+        builder.section("treatment", str(treatment or ''), priority=1, by_lines=False, min_tokens=60)
+        fitted = builder.fit()
+        if notes:
+            inputs["notes"] = fitted["notes"]
+        if treatment:
+            inputs["treatment"] = fitted["treatment"]
+        result = run_chain_cached(chain, inputs, tags=(patient_tag(patient_id),), name="nutrition_analysis")
+        return result
+    """
+    Enhanced Nutrition AI for children (0-5 years) with BMI, allergies, and medical conditions
+    """
+    
+    def __init__(self):
+        self.api_key = llm_registry.api_key()
+        
+        # Groq client and LangChain LLM come from the process-wide registry (shared HTTP connections)
+        self.client = llm_registry.groq_client()
+        self.llm = llm_registry.llm(temperature=0.3)
+    
+    def summarize_pdf_for_nutrition_knowledge(self, pdf_text: str, pdf_name: str) -> List[str]:
+        """
+        Use LLM to extract nutrition and health information relevant to 0-5 year old children
+        Returns a list of bullet points/key insights
+        """
+        try:
+            # Shared chain over the precompiled PDF summary prompt
+            chain = llm_registry.chain("pdf_summary", temperature=0.3)
             
             # Execute the chain
-            response = chain.run(
+            response = run_chain_llm(chain, dict(
                 pdf_name=pdf_name,
                 pdf_text=pdf_text
-            )
+            ))
             
             content = response.strip()
             
@@ -185,9 +193,11 @@ INSTRUCTIONS:
                     all_insights.extend(insights)
             
             if all_insights:
-                # Limit to most relevant insights to avoid token limit
-                relevant_insights = all_insights[:15]  # Use first 15 insights
-                pdf_insights_context = f"\n\nAI-Extracted Nutrition Guidelines from Knowledge Base:\n" + "\n".join(relevant_insights)
+                # Keep as many insights as fit the prompt budget
+                relevant_insights = PromptBuilder("patient_meal_plan").section(
+                    "pdf_insights", "\n".join(all_insights), priority=1
+                ).fit()["pdf_insights"]
+                pdf_insights_context = f"\n\nAI-Extracted Nutrition Guidelines from Knowledge Base:\n" + relevant_insights
         
         # Prepare parent recipes context
         parent_recipes_context = ""
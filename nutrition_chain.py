@@ -1,48 +1,197 @@
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_groq import ChatGroq
 import os
 from dotenv import load_dotenv
 from data_manager import data_manager
+from llm_cache import run_chain_cached, stream_chain_cached, patient_tag, FOODS_TAG, make_cache_key, llm_params
+from llm_registry import llm_registry
+from food_selector import select_foods, format_food_line
+from food_matcher import food_matcher, splice_meal_lines, MEAL_LABELS
+from exclusion_index import exclusion_index
+from prompt_budget import PromptBuilder
+from single_flight import SingleFlight
+from meal_plan_schema import STRUCTURED_OUTPUT_INSTRUCTIONS, parse_structured_plan, render_meal_plan_text, build_plan_data, plan_details_json, plan_text
+from meal_optimizer import optimize_meal_plan
+from plan_nutrition import analyze_plan
 from datetime import datetime
+import logging
 import re
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+ASSESSMENT_VARIABLES = [
+    "patient_id", "age_months", "sex", "weight_kg", "height_cm", "weight_for_age",
+    "height_for_age", "bmi_for_age", "breastfeeding", "allergies", "religion",
+    "other_medical_problems", "edema", "assessment_date", "treatment",
+    "recovery_status", "notes", "plan_id", "plan_details", "meal_plan_notes",
+    "generated_at", "food_context", "kb_context"
+]
+ASSESSMENT_TEMPLATE = """You are a Pediatric Dietary Assistant. Generate a comprehensive assessment with clear sections. Do not include personal names or location information for privacy protection.
+
+PATIENT PROFILE:
+- Patient ID: {patient_id}
+- Age: {age_months} months
+- Sex: {sex}
+- Weight: {weight_kg} kg
+- Height: {height_cm} cm
+- Weight-for-Age: {weight_for_age}
+- Height-for-Age: {height_for_age}
+- BMI-for-Age: {bmi_for_age}
+- Breastfeeding: {breastfeeding}
+- Allergies: {allergies}
+- Religion: {religion}
+- Other Medical Problems: {other_medical_problems}
+- Edema: {edema}
+
+ASSESSMENT DATA:
+- Assessment Date: {assessment_date}
+- Treatment: {treatment}
+- Recovery Status: {recovery_status}
+- Notes: {notes}
+
+MEAL PLAN DATA:
+- Plan ID: {plan_id}
+- Plan Details: {plan_details}
+- Notes: {meal_plan_notes}
+- Generated At: {generated_at}
+
+{food_context}
+{kb_context}
+
+INSTRUCTIONS: Generate a comprehensive assessment with these EXACT section headers:
+
+PATIENT PROFILE SUMMARY:
+Brief overview of the child's current nutritional status based on age, measurements, and medical conditions.
+
+NUTRITIONAL PRIORITIES:
+Key nutritional needs and priorities based on age, growth metrics, allergies, and medical conditions.
+
+AGE-APPROPRIATE GUIDELINES:
+Specific feeding guidelines for this child's age group with developmental considerations.
+
+PRACTICAL TIPS:
+Practical feeding tips for parents, preparation guidelines, and safety considerations.
+
+7-DAY MEAL PLAN:
+Detailed 7-day meal plan with age-appropriate foods, portions, and cultural considerations. Include breakfast, lunch, dinner, and snacks for each day.
+
+ASSESSMENT HISTORY:
+Review of previous assessments, growth progression, and current meal plan effectiveness.
+
+NEXT ASSESSMENT:
+Recommendations for next assessment timing, monitoring instructions, and what parents should watch for.
+
+IMPORTANT: 
+- Use age-specific recommendations (0-6 months: breastfeeding; 7-12 months: soft foods; 13-24 months: finger foods; 25-59 months: family meals)
+- Strictly avoid allergens listed: {allergies}
+- Consider religious/cultural preferences: {religion}
+- Account for medical conditions: {other_medical_problems}
+- Provide practical, actionable advice for parents"""
+
+MEAL_PLAN_VARIABLES = [
+    "food_list", "nutrition_analysis", "age_months", "weight_kg", "height_cm", "bmi_for_age", "allergies",
+    "other_medical_problems", "religion", "available_ingredients", "nutrition_tags", "age_guidelines",
+    "allergy_section", "religion_section", "filipino_context"
+]
+MEAL_PLAN_TEMPLATE = """You are a Pediatric Nutritionist specializing in Filipino cuisine for children 0-5 years.
+
+    ## PRIMARY CONSTRAINT
+    ONLY recommend foods from the database below. Never mention generic food groups or unlisted foods.
+
+    ## FOOD DATABASE
+    {food_list}
+    
+    Based your response to {nutrition_analysis}
+
+    ## CHILD PROFILE
+    - Age: {age_months} months
+    - Weight: {weight_kg} kg | Height: {height_cm} cm | BMI: {bmi_for_age}
+    - Allergies: {allergies} | Medical: {other_medical_problems} | Religion: {religion}
+    - Available Ingredients: {available_ingredients}
+
+    ## COMPREHENSIVE NUTRITION PLAN
+
+    Based on the nutrition analysis above, find fitted foods based on {nutrition_tags} and use it in suggesting foods.
+
+    Give estimated kcal needed for the patient based on the prompt
+
+    ### AGE-SPECIFIC FEEDING GUIDELINES
+    **Current Age Group ({age_months} months)**:
+    {age_guidelines}
+
+    ### ALLERGY COMPLIANCE
+    **Allergies: {allergies}**
+    {allergy_section}
+
+    ### RELIGIOUS DIETARY COMPLIANCE
+    **Religion: {religion}**
+    {religion_section}
+
+    ### 7-DAY MEAL PLAN
+    **CRITICAL: Provide complete details for ALL 7 days. No summaries or shortcuts.**
+
+    **Day 1-7: Format for each day:**
+    - **Breakfast**: [Specific dish] ([portion]) - [Nutrition benefit + kcal]
+    - **Lunch**: [Specific dish] ([portion]) - [Nutrition benefit + kcal]
+    - **Snack**: [Specific item] ([portion]) - [Purpose + kcal]
+    - **Dinner**: [Specific dish] ([portion]) - [Evening focus + kcal]
+    - **Daily Total**: [Sum all kcal from energy_kcal values]
+
+    **Day 1**: Use available ingredients {available_ingredients}
+    **Days 2-7**: Vary using database foods, different themes daily
+
+    ### PARENT OBSERVATION TRACKING
+    **Daily**: Appetite (Good/Fair/Poor), Energy levels, Sleep quality, Bowel movements
+    **Weekly**: Weight check, Growth observations, Skill development
+    **Monthly**: Height measurement, Food preferences, Feeding independence
+
+    ### RED FLAGS & EMERGENCY PROTOCOLS
+    **Immediate Care**: Severe allergic reactions, Choking, Persistent vomiting, Dehydration, High fever with poor feeding
+    **Concerning Signs**: Weight loss, Growth stagnation, Feeding aversion, Digestive issues
+    **Emergency Protocol**: Call emergency services → Contact pediatrician → Nutritionist follow-up
+
+    {filipino_context}
+
+    **FINAL VERIFICATION**: All recommendations use only database foods, respect allergies/religion, and are age-appropriate."""
+
+llm_registry.register_prompt("patient_assessment", ASSESSMENT_TEMPLATE, ASSESSMENT_VARIABLES)
+# Structured mode: same context and constraints, but the 7-day plan comes back as JSON (see meal_plan_schema)
+MEAL_PLAN_JSON_TEMPLATE = (
+    MEAL_PLAN_TEMPLATE.split("### 7-DAY MEAL PLAN")[0]
+    + "{filipino_context}\n\n    "
+    + STRUCTURED_OUTPUT_INSTRUCTIONS.replace("{", "{{").replace("}", "}}")
+)
+# Validation failures are regenerated this many times in total before giving up
+STRUCTURED_ATTEMPTS = 2
+
+MEAL_PLAN_REPAIR_VARIABLES = ["food_list", "age_months", "allergies", "religion", "issues"]
+MEAL_PLAN_REPAIR_TEMPLATE = """You are a Pediatric Nutritionist correcting specific meals of an existing 7-day meal plan.
+
+    ## FOOD DATABASE
+    {food_list}
+
+    ## CHILD PROFILE
+    - Age: {age_months} months
+    - Allergies: {allergies} | Religion: {religion}
+
+    ## MEALS TO REPLACE
+    {issues}
+
+    Write a replacement for ONLY the meals listed above, using only foods from the FOOD DATABASE and avoiding the problems noted.
+    Answer with one line per meal and nothing else, in this format:
+    Day N | Meal: [Specific dish] ([portion]) - [Nutrition benefit + kcal]"""
+# Regenerate the meals the food matcher flags (unknown foods, allergens) once before a plan is returned/saved
+MEAL_PLAN_REPAIR = os.getenv('MEAL_PLAN_REPAIR', 'false').lower() in ('1', 'true', 'yes')
+_REPAIR_LINE_RE = re.compile(r"^\W*day\s*(\d+)\s*\|\s*([a-z ]+?)\s*\**\s*:\s*(.+)$", re.IGNORECASE)
+
+llm_registry.register_prompt("meal_plan", MEAL_PLAN_TEMPLATE, MEAL_PLAN_VARIABLES)
+llm_registry.register_prompt("meal_plan_json", MEAL_PLAN_JSON_TEMPLATE, MEAL_PLAN_VARIABLES)
+llm_registry.register_prompt("meal_plan_repair", MEAL_PLAN_REPAIR_TEMPLATE, MEAL_PLAN_REPAIR_VARIABLES)
+
 def get_relevant_pdf_chunks(query, k=4):
-    """Retrieve relevant PDF text using simple keyword matching."""
+    """Retrieve the most relevant knowledge base chunks using the BM25 index."""
     try:
-        # Get PDF text directly from knowledge base
-        knowledge_base = data_manager.get_knowledge_base()
-        if not knowledge_base:
-            return []
-        
-        query_keywords = query.lower().split()
-        scored_chunks = []
-        
-        for kb in knowledge_base.values():
-            ai_summary = kb.get('ai_summary', '')
-            if ai_summary:
-                # Simple scoring based on keyword matches
-                summary_lower = ai_summary.lower()
-                score = sum(1 for keyword in query_keywords if keyword in summary_lower)
-                
-                if score > 0:
-                    # Split into smaller chunks if needed
-                    if len(ai_summary) > 500:
-                        chunks = ai_summary.split('\n')
-                        for chunk in chunks:
-                            if chunk.strip():
-                                chunk_score = sum(1 for keyword in query_keywords if keyword in chunk.lower())
-                                if chunk_score > 0:
-                                    scored_chunks.append((chunk.strip(), chunk_score))
-                    else:
-                        scored_chunks.append((ai_summary, score))
-        
-        # Sort by score and return top k
-        scored_chunks.sort(key=lambda x: x[1], reverse=True)
-        return [chunk[0] for chunk in scored_chunks[:k]]
-        
+        return data_manager.search_knowledge_base(query, k=k)
     except Exception as e:
         return []
 
@@ -133,20 +282,15 @@ def parse_assessment_sections(assessment_text):
     
     return sections
 
-def generate_patient_assessment(patient_id):
+def build_assessment_inputs(patient_id):
     """
-    Generate a comprehensive pediatric dietary assessment for a patient using LangChain and Groq LLM.
+    Gather the assessment prompt variables for a patient, or None if the patient does not exist.
     Privacy-focused: Only includes medically necessary information, no names or location data.
-    Returns structured sections instead of a single markdown string.
     """
-    api_key = os.getenv('GROQ_API_KEY')
-    if not api_key:
-        raise ValueError("GROQ_API_KEY not found in environment variables")
-
     # Get patient data
     patient_data = data_manager.get_patient_by_id(patient_id)
     if not patient_data:
-        return {"error": "Patient data not found"}
+        return None
 
     # Get assessment data
     assessment_data = data_manager.get_nutritionist_notes_by_patient(patient_id)
@@ -185,76 +329,6 @@ def generate_patient_assessment(patient_id):
     if relevant_kb:
         kb_context = "NUTRITION KNOWLEDGE BASE:\n" + "\n---\n".join(relevant_kb) + "\n"
 
-    prompt_template = PromptTemplate(
-        input_variables=[
-            "patient_id", "age_months", "sex", "weight_kg", "height_cm", "weight_for_age", 
-            "height_for_age", "bmi_for_age", "breastfeeding", "allergies", "religion", 
-            "other_medical_problems", "edema", "assessment_date", "treatment", 
-            "recovery_status", "notes", "plan_id", "plan_details", "meal_plan_notes", 
-            "generated_at", "food_context", "kb_context"
-        ],
-        template="""You are a Pediatric Dietary Assistant. Generate a comprehensive assessment with clear sections. Do not include personal names or location information for privacy protection.
-
-PATIENT PROFILE:
-- Patient ID: {patient_id}
-- Age: {age_months} months
-- Sex: {sex}
-- Weight: {weight_kg} kg
-- Height: {height_cm} cm
-- Weight-for-Age: {weight_for_age}
-- Height-for-Age: {height_for_age}
-- BMI-for-Age: {bmi_for_age}
-- Breastfeeding: {breastfeeding}
-- Allergies: {allergies}
-- Religion: {religion}
-- Other Medical Problems: {other_medical_problems}
-- Edema: {edema}
-
-ASSESSMENT DATA:
-- Assessment Date: {assessment_date}
-- Treatment: {treatment}
-- Recovery Status: {recovery_status}
-- Notes: {notes}
-
-MEAL PLAN DATA:
-- Plan ID: {plan_id}
-- Plan Details: {plan_details}
-- Notes: {meal_plan_notes}
-- Generated At: {generated_at}
-
-{food_context}
-{kb_context}
-
-INSTRUCTIONS: Generate a comprehensive assessment with these EXACT section headers:
-
-PATIENT PROFILE SUMMARY:
-Brief overview of the child's current nutritional status based on age, measurements, and medical conditions.
-
-NUTRITIONAL PRIORITIES:
-Key nutritional needs and priorities based on age, growth metrics, allergies, and medical conditions.
-
-AGE-APPROPRIATE GUIDELINES:
-Specific feeding guidelines for this child's age group with developmental considerations.
-
-PRACTICAL TIPS:
-Practical feeding tips for parents, preparation guidelines, and safety considerations.
-
-7-DAY MEAL PLAN:
-Detailed 7-day meal plan with age-appropriate foods, portions, and cultural considerations. Include breakfast, lunch, dinner, and snacks for each day.
-
-ASSESSMENT HISTORY:
-Review of previous assessments, growth progression, and current meal plan effectiveness.
-
-NEXT ASSESSMENT:
-Recommendations for next assessment timing, monitoring instructions, and what parents should watch for.
-
-IMPORTANT: 
-- Use age-specific recommendations (0-6 months: breastfeeding; 7-12 months: soft foods; 13-24 months: finger foods; 25-59 months: family meals)
-- Strictly avoid allergens listed: {allergies}
-- Consider religious/cultural preferences: {religion}
-- Account for medical conditions: {other_medical_problems}
-- Provide practical, actionable advice for parents"""
-    )
 
     # Prepare template variables - ONLY medical and nutritional data, no personal identifiers
     template_vars = {
@@ -276,30 +350,48 @@ IMPORTANT:
         "recovery_status": latest_assessment.get('recovery_status', 'Unknown'),
         "notes": latest_assessment.get('notes', 'No previous notes'),
         "plan_id": str(latest_meal_plan.get('plan_id', 'No meal plan')),
-        "plan_details": latest_meal_plan.get('plan_details', 'No meal plan generated')[:500] + "..." if len(str(latest_meal_plan.get('plan_details', ''))) > 500 else latest_meal_plan.get('plan_details', 'No meal plan generated'),
+        "plan_details": plan_text(latest_meal_plan) or 'No meal plan generated',
         "meal_plan_notes": meal_plan_notes or 'No notes on meal plan',
         "generated_at": str(latest_meal_plan.get('generated_at', 'No meal plan date')),
         "food_context": food_context,
         "kb_context": kb_context
     }
 
-    # Create LLM
-    llm = ChatGroq(
-        groq_api_key=api_key,
-        model_name="meta-llama/llama-4-scout-17b-16e-instruct",
-        temperature=0.3,
-        max_tokens=4000
-    )
+    # Fit variable-length sections into the chain's token budget; the previous plan is trimmed first
+    builder = PromptBuilder("patient_assessment", ASSESSMENT_TEMPLATE)
+    sections = {
+        "plan_details": dict(priority=4, by_lines=False, min_tokens=60),
+        "meal_plan_notes": dict(priority=3, by_lines=False, min_tokens=40),
+        "food_context": dict(priority=2),
+        "kb_context": dict(priority=2),
+        "notes": dict(priority=1, by_lines=False, min_tokens=60),
+    }
+    for name, value in template_vars.items():
+        if name in sections:
+            builder.section(name, str(value or ''), **sections[name])
+        else:
+            builder.fixed(name, value)
+    template_vars.update(builder.fit())
+    return template_vars
 
-    # Create chain
-    chain = LLMChain(
-        llm=llm,
-        prompt=prompt_template
-    )
+def generate_patient_assessment(patient_id):
+    """
+    Generate a comprehensive pediatric dietary assessment for a patient using LangChain and Groq LLM.
+    Privacy-focused: Only includes medically necessary information, no names or location data.
+    Returns structured sections instead of a single markdown string.
+    """
+    llm_registry.api_key()  # fail fast when GROQ_API_KEY is missing
+
+    template_vars = build_assessment_inputs(patient_id)
+    if template_vars is None:
+        return {"error": "Patient data not found"}
+
+    # Shared chain over the precompiled assessment prompt
+    chain = llm_registry.chain("patient_assessment", temperature=0.3, max_tokens=4000)
 
     try:
-        # Generate assessment
-        result = chain.run(**template_vars)
+        # Generate assessment (served from the generation cache when the rendered prompt is unchanged)
+        result = run_chain_cached(chain, template_vars, tags=(patient_tag(patient_id), FOODS_TAG), name="patient_assessment")
         
         # Parse the result into structured sections
         sections = parse_assessment_sections(result)
@@ -316,23 +408,151 @@ IMPORTANT:
             "next_assessment": ""
         }
 
-def get_meal_plan_with_langchain(patient_id, available_ingredients=None, religion=None):
+def stream_patient_assessment(patient_id):
+    """
+    Yield the assessment text as Groq generates it. Join the chunks and pass them to
+    parse_assessment_sections for the same structure generate_patient_assessment returns.
     """
-    Use LangChain to generate a meal plan for a patient using Groq LLM and a nutritionist-style prompt.
+    llm_registry.api_key()  # fail fast when GROQ_API_KEY is missing
+    template_vars = build_assessment_inputs(patient_id)
+    if template_vars is None:
+        raise ValueError("Patient data not found")
+    chain = llm_registry.chain("patient_assessment", temperature=0.3, max_tokens=4000)
+    yield from stream_chain_cached(chain, template_vars, tags=(patient_tag(patient_id), FOODS_TAG), name="patient_assessment")
+
+# Structured-output instructions for the analysis that feeds the meal plan prompt
+STRUCTURED_ANALYSIS_TEMPLATE = """Provide a comprehensive nutrition analysis in the following structured format:
+
+## NUTRITIONAL STATUS:
+[Provide overall assessment based on growth indicators]
+
+## POTENTIAL CONCERNS:
+[List any nutritional concerns or deficiencies identified]
+
+## DIETARY RESTRICTIONS:
+
+### Allergy-Related Restrictions:
+[If allergies present: List specific foods to avoid and safety reminders]
+[If no allergies: State "No known allergies"]
+
+### Religious Dietary Requirements:
+[If religious restrictions apply: List specific dietary guidelines]
+[If none: State "No religious dietary restrictions"]
+
+### Medical Condition Restrictions:
+[If medical conditions present: List foods to avoid and foods that are beneficial]
+[If none: State "No medical dietary restrictions"]
+
+## NUTRITIONAL RECOMMENDATIONS:
+
+### Growth-Specific Needs:
+- **Height Development**: [If height-for-age is low, specify nutrients needed for linear growth]
+- **Weight Management**: [If weight-for-age is concerning, specify appropriate interventions]
+
+### Age-Appropriate Guidelines:
+
+**0-6 months:**
+- **Primary Nutrition**: Exclusively breast milk or formula
+- **Feeding Style**: Breastfeeding on demand; practice responsive feeding by responding to the infant's hunger cues
+
+**6-12 months:**
+- **Introduction of Solids**: Start introducing small amounts of pureed or mashed, nutrient-dense foods
+- **Foods to Offer**: Iron-fortified infant cereals, fruits, vegetables, and lean proteins like finely mashed meat or fish
+- **Breast Milk/Formula**: Continues as the primary source of nutrition
+- **Feeding Environment**: Introduce solids in a calm setting, with the infant sitting upright and moderately hungry
 
-    Optionally includes available ingredients provided by the parent.
+**1-2 years:**
+- **Solid Foods**: Increase variety in texture and consistency. Most children can eat the same foods as the family, with appropriate preparation
+- **Whole Milk**: Begin offering whole cow's milk
+- **Meal Schedule**: Aim for 3 meals and 1-2 snacks per day
+
+**2-5 years:**
+- **Diverse Diet**: Continue offering a variety of healthy foods from all food groups
+- **Whole Grains**: Gradually increase the introduction of wholegrain foods
+- **Milk**: Offer low-fat milk after age 2
+- **Responsibility**: Maintain the division of responsibility: the caregiver provides healthy food, and the child decides how much to eat
+
+### Key Nutrients to Focus On:
+[List specific vitamins, minerals, and macronutrients needed based on the child's current nutritional status]
+
+## FEEDING RECOMMENDATIONS:
+[Provide practical, age-appropriate feeding advice and meal suggestions specific to this child's needs]
+
+## FOLLOW-UP RECOMMENDATIONS:
+[Suggest monitoring schedule and when to reassess nutritional status]"""
+
+def run_nutrition_analysis(patient_id, patient_data=None, nutrition_ai=None):
+    """
+    Run the structured nutrition analysis for a patient once.
+    Returns the analysis text, or an empty string if the patient is missing or the LLM call fails.
     """
-    api_key = os.getenv('GROQ_API_KEY')
-    if not api_key:
-        raise ValueError("GROQ_API_KEY not found in environment variables")
+    try:
+        patient_data = patient_data or data_manager.get_patient_by_id(patient_id)
+        if not patient_data:
+            return ""
+        nutrition_ai = nutrition_ai or llm_registry.nutrition_ai()
+        # Get latest assessment for notes and treatment
+        assessments = data_manager.get_nutritionist_notes_by_patient(patient_id)
+        latest_assessment = assessments[0] if assessments else {}
+        analysis_result = nutrition_ai.analyze_child_nutrition(
+            patient_id=patient_id,
+            age_in_months=patient_data.get('age_months'),
+            allergies=patient_data.get('allergies'),
+            other_medical_problems=patient_data.get('other_medical_problems'),
+            parent_id=patient_data.get('parent_id'),
+            notes=latest_assessment.get('notes', ''),
+            treatment=latest_assessment.get('treatment', ''),
+            sex=patient_data.get('sex', ''),
+            weight_for_age=patient_data.get('weight_for_age', ''),
+            height_for_age=patient_data.get('height_for_age', ''),
+            bmi_for_age=patient_data.get('bmi_for_age', ''),
+            breastfeeding=patient_data.get('breastfeeding', ''),
+            religion=patient_data.get('religion', ''),
+            output_template=STRUCTURED_ANALYSIS_TEMPLATE
+        )
+    except Exception:
+        return ""
+    return analysis_result or ""
+
+def load_shared_context():
+    """
+    Patient-independent data the meal plan prompt needs (food database, knowledge base).
+    Batch runs load it once and pass it as context= to every generation.
+    """
+    return {
+        "foods": data_manager.get_foods_data(),
+        "knowledge_base": data_manager.get_knowledge_base(),
+    }
 
+def generate_meal_plan_pipeline(patient_id, available_ingredients=None, religion=None, nutrition_ai=None, patient_data=None, context=None):
+    """
+    Analysis -> meal plan for one patient, with the analysis LLM call made exactly once.
+    Returns {"nutrition_analysis": str, "meal_plan": str, "validation": food_matcher report}.
+    """
+    patient_data = patient_data or data_manager.get_patient_by_id(patient_id)
+    if not patient_data:
+        return {"nutrition_analysis": "", "meal_plan": "Error: Patient data not found"}
+    _, nutrition_analysis, chain, prompt_inputs = _prepare_meal_plan(
+        patient_id, available_ingredients, religion, nutrition_ai, patient_data, context
+    )
+    meal_plan = run_chain_cached(chain, prompt_inputs, tags=(patient_tag(patient_id), FOODS_TAG), name="meal_plan")
+    meal_plan, validation = check_meal_plan(patient_id, meal_plan, patient_data, prompt_inputs, religion, context)
+    return {"nutrition_analysis": nutrition_analysis, "meal_plan": meal_plan, "validation": validation}
+
+def build_meal_plan_inputs(patient_id, available_ingredients=None, religion=None, nutrition_analysis=None, patient_data=None, context=None, structured=False):
+    """
+    Gather the meal plan prompt variables for a patient, or None if the patient does not exist.
+    When nutrition_analysis is None the analysis is run here. context is an optional
+    load_shared_context() result; without it the food and knowledge base tables are read per call.
+    structured lists foods with their ids for the JSON output template.
+    """
     # Get patient data
-    patient_data = data_manager.get_patient_by_id(patient_id)
+    patient_data = patient_data or data_manager.get_patient_by_id(patient_id)
     if not patient_data:
-        return "Error: Patient data not found"
+        return None
 
     # Get Filipino foods from knowledge base
-    knowledge_base = data_manager.get_knowledge_base()
+    knowledge_base = context["knowledge_base"] if context else data_manager.get_knowledge_base()
     filipino_foods = knowledge_base.get('filipino_foods', {})
     filipino_context = ""
     if filipino_foods:
@@ -377,13 +597,18 @@ def get_meal_plan_with_langchain(patient_id, available_ingredients=None, religio
     if relevant_pdf_chunks:
         pdf_context = "\nBACKGROUND KNOWLEDGE (for your reference only, do NOT mention or cite this in your response):\n" + "\n---\n".join(relevant_pdf_chunks)
 
-    # Get all food names, energy, and nutrition_tags from the database
-    foods_data = data_manager.get_foods_data()
+    # Candidate foods for this child (allergy/religion/age exclusions, ranked and trimmed to the token budget)
+    all_foods = context["foods"] if context else data_manager.get_foods_data()
+    foods_data, _ = select_foods(
+        all_foods,
+        patient_data,
+        available_ingredients=available_ingredients,
+        religion=religion_val,
+        excluded=exclusion_index.for_patient(patient_data, religion_val, all_foods)
+    )
     food_names = []
     all_nutrition_tags = set()
     for food in foods_data:
-        name = food.get('food_name_and_description')
-        kcal = food.get('energy_kcal')
         tags = food.get('nutrition_tags')
         if tags:
             # Split tags by comma or semicolon, strip whitespace
@@ -391,11 +616,7 @@ def get_meal_plan_with_langchain(patient_id, available_ingredients=None, religio
                 tag = tag.strip()
                 if tag:
                     all_nutrition_tags.add(tag)
-        if name:
-            if kcal is not None:
-                food_names.append(f"{name} (Energy: {kcal} kcal)")
-            else:
-                food_names.append(name)
+        food_names.append(format_food_line(food, with_id=structured))
     food_list_str = '\n- '.join(food_names)
     if food_list_str:
         food_list_str = 'FOOD DATABASE (only recommend foods from this list):\n- ' + food_list_str + '\n'
@@ -403,94 +624,11 @@ def get_meal_plan_with_langchain(patient_id, available_ingredients=None, religio
         food_list_str = ''
     nutrition_tags_str = ', '.join(sorted(all_nutrition_tags))
 
-    # --- Nutrition analysis
-    from nutrition_ai import ChildNutritionAI
-    nutrition_analysis = ""
-    try:
-        nutrition_ai = ChildNutritionAI()
-        # Get latest assessment for notes and treatment
-        assessments = data_manager.get_nutritionist_notes_by_patient(patient_id)
-        latest_assessment = assessments[0] if assessments else {}
-        # Custom prompt for structured output
-        analysis_result = nutrition_ai.analyze_child_nutrition(
-            patient_id=patient_id,
-            age_in_months=patient_data.get('age_months'),
-            allergies=patient_data.get('allergies'),
-            other_medical_problems=patient_data.get('other_medical_problems'),
-            parent_id=patient_data.get('parent_id'),
-            notes=latest_assessment.get('notes', ''),
-            treatment=latest_assessment.get('treatment', ''),
-            sex=patient_data.get('sex', ''),
-            weight_for_age=patient_data.get('weight_for_age', ''),
-            height_for_age=patient_data.get('height_for_age', ''),
-            bmi_for_age=patient_data.get('bmi_for_age', ''),
-            breastfeeding=patient_data.get('breastfeeding', ''),
-            religion=patient_data.get('religion', ''),
-            custom_prompt="""
-        Provide a comprehensive nutrition analysis in the following structured format:
-
-        ## NUTRITIONAL STATUS:
-        [Provide overall assessment based on growth indicators]
-
-        ## POTENTIAL CONCERNS:
-        [List any nutritional concerns or deficiencies identified]
-
-        ## DIETARY RESTRICTIONS:
-
-        ### Allergy-Related Restrictions:
-        [If allergies present: List specific foods to avoid and safety reminders]
-        [If no allergies: State "No known allergies"]
-
-        ### Religious Dietary Requirements:
-        [If religious restrictions apply: List specific dietary guidelines]
-        [If none: State "No religious dietary restrictions"]
-
-        ### Medical Condition Restrictions:
-        [If medical conditions present: List foods to avoid and foods that are beneficial]
-        [If none: State "No medical dietary restrictions"]
-
-        ## NUTRITIONAL RECOMMENDATIONS:
-
-        ### Growth-Specific Needs:
-        - **Height Development**: [If height-for-age is low, specify nutrients needed for linear growth]
-        - **Weight Management**: [If weight-for-age is concerning, specify appropriate interventions]
-
-        ### Age-Appropriate Guidelines:
-
-        **0-6 months:**
-        - **Primary Nutrition**: Exclusively breast milk or formula
-        - **Feeding Style**: Breastfeeding on demand; practice responsive feeding by responding to the infant's hunger cues
-
-        **6-12 months:**
-        - **Introduction of Solids**: Start introducing small amounts of pureed or mashed, nutrient-dense foods
-        - **Foods to Offer**: Iron-fortified infant cereals, fruits, vegetables, and lean proteins like finely mashed meat or fish
-        - **Breast Milk/Formula**: Continues as the primary source of nutrition
-        - **Feeding Environment**: Introduce solids in a calm setting, with the infant sitting upright and moderately hungry
-
-        **1-2 years:**
-        - **Solid Foods**: Increase variety in texture and consistency. Most children can eat the same foods as the family, with appropriate preparation
-        - **Whole Milk**: Begin offering whole cow's milk
-        - **Meal Schedule**: Aim for 3 meals and 1-2 snacks per day
-
-        **2-5 years:**
-        - **Diverse Diet**: Continue offering a variety of healthy foods from all food groups
-        - **Whole Grains**: Gradually increase the introduction of wholegrain foods
-        - **Milk**: Offer low-fat milk after age 2
-        - **Responsibility**: Maintain the division of responsibility: the caregiver provides healthy food, and the child decides how much to eat
-
-        ### Key Nutrients to Focus On:
-        [List specific vitamins, minerals, and macronutrients needed based on the child's current nutritional status]
-
-        ## FEEDING RECOMMENDATIONS:
-        [Provide practical, age-appropriate feeding advice and meal suggestions specific to this child's needs]
-
-        ## FOLLOW-UP RECOMMENDATIONS:
-        [Suggest monitoring schedule and when to reassess nutritional status]
-        """
-        )
-        nutrition_analysis = f"NUTRITION ANALYSIS FOR THIS CHILD (ID: {patient_id}):\n{analysis_result}"
-    except Exception as e:
-        nutrition_analysis = ""
+    # --- Nutrition analysis (runs once; pipeline callers pass in the result they already have)
+    if nutrition_analysis is None:
+        nutrition_analysis = run_nutrition_analysis(patient_id, patient_data)
+    if nutrition_analysis:
+        nutrition_analysis = f"NUTRITION ANALYSIS FOR THIS CHILD (ID: {patient_id}):\n{nutrition_analysis}"
 
 
     # Calculate next assessment date based on age
@@ -521,73 +659,14 @@ def get_meal_plan_with_langchain(patient_id, available_ingredients=None, religio
     age_years = age_months // 12
     age_months_remainder = age_months % 12
 
-    # Create the streamlined prompt
-    prompt_str = f"""You are a Pediatric Nutritionist specializing in Filipino cuisine for children 0-5 years.
-
-    ## PRIMARY CONSTRAINT
-    ONLY recommend foods from the database below. Never mention generic food groups or unlisted foods.
-
-    ## FOOD DATABASE
-    {food_list_str}
-    
-    Based your response to {nutrition_analysis}
-
-    ## CHILD PROFILE
-    - Age: {age_months} months
-    - Weight: {{weight_kg}} kg | Height: {{height_cm}} cm | BMI: {{bmi_for_age}}
-    - Allergies: {{allergies}} | Medical: {{other_medical_problems}} | Religion: {{religion}}
-    - Available Ingredients: {{available_ingredients}}
-
-    ## COMPREHENSIVE NUTRITION PLAN
-
-    Based on {nutrition_analysis}, find fitted foods based on {{nutrition_tags}} and use it in suggesting foods.
-
-    Give estimated kcal needed for the patient based on the prompt
-
-    ### AGE-SPECIFIC FEEDING GUIDELINES
-    **Current Age Group ({age_months} months)**:
-    {get_age_specific_guidelines(age_months)}
-
-    ### ALLERGY COMPLIANCE
-    **Allergies: {{allergies}}**
-    {allergy_section}
-
-    ### RELIGIOUS DIETARY COMPLIANCE
-    **Religion: {{religion}}**
-    {religion_section}
-
-    ### 7-DAY MEAL PLAN
-    **CRITICAL: Provide complete details for ALL 7 days. No summaries or shortcuts.**
-
-    **Day 1-7: Format for each day:**
-    - **Breakfast**: [Specific dish] ([portion]) - [Nutrition benefit + kcal]
-    - **Lunch**: [Specific dish] ([portion]) - [Nutrition benefit + kcal]
-    - **Snack**: [Specific item] ([portion]) - [Purpose + kcal]
-    - **Dinner**: [Specific dish] ([portion]) - [Evening focus + kcal]
-    - **Daily Total**: [Sum all kcal from energy_kcal values]
-
-    **Day 1**: Use available ingredients {{available_ingredients}}
-    **Days 2-7**: Vary using database foods, different themes daily
-
-    ### PARENT OBSERVATION TRACKING
-    **Daily**: Appetite (Good/Fair/Poor), Energy levels, Sleep quality, Bowel movements
-    **Weekly**: Weight check, Growth observations, Skill development
-    **Monthly**: Height measurement, Food preferences, Feeding independence
-
-    ### RED FLAGS & EMERGENCY PROTOCOLS
-    **Immediate Care**: Severe allergic reactions, Choking, Persistent vomiting, Dehydration, High fever with poor feeding
-    **Concerning Signs**: Weight loss, Growth stagnation, Feeding aversion, Digestive issues
-    **Emergency Protocol**: Call emergency services → Contact pediatrician → Nutritionist follow-up
-
-    {filipino_context}
-
-    **FINAL VERIFICATION**: All recommendations use only database foods, respect allergies/religion, and are age-appropriate."""
-    prompt_template = PromptTemplate(
-        input_variables=["weight_kg", "height_cm", "bmi_for_age", "allergies", "other_medical_problems", "religion", "available_ingredients", "nutrition_tags"],
-        template=prompt_str
-    )
 
     prompt_inputs = {
+        "food_list": food_list_str,
+        "age_months": age_months,
+        "age_guidelines": get_age_specific_guidelines(age_months),
+        "allergy_section": allergy_section,
+        "religion_section": religion_section,
+        "filipino_context": filipino_context,
         "weight_kg": patient_data.get('weight_kg', 'Unknown'),
         "height_cm": patient_data.get('height_cm', 'Unknown'),
         "bmi_for_age": patient_data.get('bmi_for_age', 'Unknown'),
@@ -595,20 +674,253 @@ def get_meal_plan_with_langchain(patient_id, available_ingredients=None, religio
         "other_medical_problems": patient_data.get('other_medical_problems', 'None'),
         "religion": religion_val,
         "available_ingredients": available_ingredients if available_ingredients else "None specified",
-        "nutrition_tags": nutrition_tags_str
+        "nutrition_tags": nutrition_tags_str,
+        "nutrition_analysis": nutrition_analysis
     }
 
-    llm = ChatGroq(
-        groq_api_key=api_key,
-        model_name="meta-llama/llama-4-scout-17b-16e-instruct",
-        temperature=0.3,
-        max_tokens=4000
+    # Fit variable-length sections into the chain's token budget (food list is trimmed last)
+    builder = PromptBuilder("meal_plan", MEAL_PLAN_JSON_TEMPLATE if structured else MEAL_PLAN_TEMPLATE)
+    sections = {
+        "filipino_context": dict(priority=4),
+        "nutrition_analysis": dict(priority=3, min_tokens=150),
+        "food_list": dict(priority=2, min_tokens=200),
+    }
+    for name, value in prompt_inputs.items():
+        if name in sections:
+            builder.section(name, value, **sections[name])
+        else:
+            builder.fixed(name, value)
+    prompt_inputs.update(builder.fit())
+    return prompt_inputs
+
+def _prepare_meal_plan(patient_id, available_ingredients=None, religion=None, nutrition_ai=None, patient_data=None, context=None, structured=False):
+    """(patient_data, nutrition_analysis, chain, prompt_inputs) for one plan; raises ValueError for an unknown patient."""
+    llm_registry.api_key()  # fail fast when GROQ_API_KEY is missing
+    patient_data = patient_data or data_manager.get_patient_by_id(patient_id)
+    if not patient_data:
+        raise ValueError("Patient data not found")
+    nutrition_analysis = run_nutrition_analysis(patient_id, patient_data, nutrition_ai)
+    prompt_inputs = build_meal_plan_inputs(patient_id, available_ingredients, religion, nutrition_analysis, patient_data, context, structured)
+    if structured:
+        chain = llm_registry.chain("meal_plan_json", temperature=0.3, max_tokens=6000, json_mode=True)
+    else:
+        chain = llm_registry.chain("meal_plan", temperature=0.3, max_tokens=4000)
+    return patient_data, nutrition_analysis, chain, prompt_inputs
+
+def _generate_structured(patient_id, chain, prompt_inputs, context=None):
+    """(text, StructuredMealPlan) from the JSON chain; responses that fail schema validation are regenerated."""
+    foods = context["foods"] if context else data_manager.get_foods_data()
+    last_error = None
+    for _ in range(STRUCTURED_ATTEMPTS):
+        try:
+            raw = run_chain_cached(
+                chain, prompt_inputs, tags=(patient_tag(patient_id), FOODS_TAG), name="meal_plan",
+                validate=lambda text: parse_structured_plan(text, foods)
+            )
+            plan = parse_structured_plan(raw, foods)
+            return render_meal_plan_text(plan), plan
+        except ValueError as e:
+            last_error = e
+    raise last_error
+
+def generate_structured_meal_plan(patient_id, available_ingredients=None, religion=None, nutrition_ai=None, patient_data=None, context=None):
+    """
+    Schema-constrained meal plan: returns {"nutrition_analysis", "meal_plan" (rendered text),
+    "structured" (days -> meals -> food ids, portions, kcal)}. Raises ValueError if the patient
+    is unknown or the model never produced a valid plan.
+    """
+    _, nutrition_analysis, chain, prompt_inputs = _prepare_meal_plan(
+        patient_id, available_ingredients, religion, nutrition_ai, patient_data, context, structured=True
+    )
+    meal_plan, plan = _generate_structured(patient_id, chain, prompt_inputs, context)
+    return {"nutrition_analysis": nutrition_analysis, "meal_plan": meal_plan, "structured": plan.model_dump()}
+
+def generate_draft_meal_plan(patient_id, available_ingredients=None, religion=None, patient_data=None, context=None, save=False):
+    """
+    Instant meal plan from the local optimizer (no LLM call): returns {"meal_plan", "structured",
+    "plan_id", "source": "optimizer"}. Used as a quick draft and as the fallback while Groq is down.
+    Raises ValueError for an unknown patient or when no plan can be built.
+    """
+    patient_data = patient_data or data_manager.get_patient_by_id(patient_id)
+    if not patient_data:
+        raise ValueError("Patient data not found")
+    foods = context["foods"] if context else data_manager.get_foods_data()
+    religion = patient_data.get('religion') or religion
+    plan = optimize_meal_plan(
+        foods, patient_data, available_ingredients, religion,
+        excluded=exclusion_index.for_patient(patient_data, religion, foods)
+    )
+    meal_plan = render_meal_plan_text(plan)
+    plan_id = _save_generated_plan(patient_id, patient_data, meal_plan, plan, foods=foods) if save else None
+    return {"meal_plan": meal_plan, "structured": plan.model_dump(), "plan_id": plan_id, "source": "optimizer"}
+
+def stream_meal_plan(patient_id, available_ingredients=None, religion=None, nutrition_ai=None):
+    """
+    Yield meal plan text chunks as Groq generates them. The nutrition analysis runs once
+    (not streamed) before the first chunk; a cached plan is yielded in one piece.
+    """
+    _, _, chain, prompt_inputs = _prepare_meal_plan(patient_id, available_ingredients, religion, nutrition_ai)
+    yield from stream_chain_cached(chain, prompt_inputs, tags=(patient_tag(patient_id), FOODS_TAG), name="meal_plan")
+
+def validate_meal_plan(meal_plan, patient_data, religion=None, foods=None):
+    """food_matcher report for a plan: dishes not in the foods table and allergen/restriction hits."""
+    if not food_matcher.loaded:
+        food_matcher.load(foods if foods is not None else data_manager.get_foods_data())
+    return food_matcher.validate(meal_plan, excluded=exclusion_index.for_patient(patient_data, religion, foods))
+
+def _validation_issues(validation):
+    """{(day, meal): [problem, ...]} for the meals a validation report flagged."""
+    issues = {}
+    for entry in validation["unknown_foods"]:
+        issues.setdefault((entry["day"], entry["meal"]), []).append(f"'{entry['text']}' is not in the food database")
+    for hit in validation["allergen_hits"]:
+        issues.setdefault((hit["day"], hit["meal"]), []).append(f"contains '{hit['term']}', which this child must avoid")
+    return issues
+
+def repair_meal_plan(patient_id, meal_plan, validation, prompt_inputs, patient_data, religion=None, foods=None):
+    """
+    Targeted regeneration: only the meals the validation flagged are rewritten by the LLM and spliced
+    back into the plan in place. Returns (meal_plan, validation); the repair is kept only if it leaves
+    fewer problems, and its validation lists the replaced meals under "repaired".
+    """
+    issues = _validation_issues(validation)
+    if not issues:
+        return meal_plan, validation
+    chain = llm_registry.chain("meal_plan_repair", temperature=0.2, max_tokens=1000)
+    repair_inputs = {key: prompt_inputs[key] for key in ("food_list", "age_months", "allergies", "religion")}
+    repair_inputs["issues"] = "\n".join(
+        f"- Day {day} {meal.capitalize()}: {'; '.join(problems)}" for (day, meal), problems in sorted(issues.items())
     )
+    response = run_chain_cached(chain, repair_inputs, tags=(patient_tag(patient_id), FOODS_TAG), name="meal_plan_repair")
+    replacements = {}
+    for line in response.splitlines():
+        match = _REPAIR_LINE_RE.match(line.strip())
+        if not match:
+            continue
+        meal = next((meal for word, meal in MEAL_LABELS.items() if word in match.group(2).lower()), None)
+        if (int(match.group(1)), meal) in issues:
+            replacements[(int(match.group(1)), meal)] = match.group(3)
+    repaired_plan, repaired = splice_meal_lines(meal_plan, replacements)
+    if not repaired:
+        return meal_plan, validation
+    revalidated = validate_meal_plan(repaired_plan, patient_data, religion, foods)
+    if len(_validation_issues(revalidated)) >= len(issues):
+        return meal_plan, validation
+    revalidated["repaired"] = repaired
+    return repaired_plan, revalidated
+
+def check_meal_plan(patient_id, meal_plan, patient_data, prompt_inputs=None, religion=None, context=None, repair=None):
+    """
+    Validate a generated plan against the foods table and, when repair is on (default MEAL_PLAN_REPAIR)
+    and prompt_inputs are given, regenerate its flagged meals once. Returns (meal_plan, validation or None).
+    """
+    if not meal_plan or meal_plan.startswith("Error"):
+        return meal_plan, None
+    foods = context["foods"] if context else None
+    religion = patient_data.get('religion') or religion
+    try:
+        validation = validate_meal_plan(meal_plan, patient_data, religion, foods)
+    except Exception as e:
+        logger.warning("Meal plan validation failed for patient %s: %s", patient_id, e)
+        return meal_plan, None
+    if (MEAL_PLAN_REPAIR if repair is None else repair) and prompt_inputs and not validation["ok"]:
+        try:
+            meal_plan, validation = repair_meal_plan(patient_id, meal_plan, validation, prompt_inputs, patient_data, religion, foods)
+        except Exception as e:
+            # Keep the original plan (and its report) when the repair call fails
+            logger.warning("Meal plan repair failed for patient %s: %s", patient_id, e)
+    return meal_plan, validation
 
-    chain = LLMChain(
-        llm=llm,
-        prompt=prompt_template
+# Serve the optimizer draft instead of a 503 while the Groq circuit breaker is open
+MEAL_PLAN_OPTIMIZER_FALLBACK = os.getenv('MEAL_PLAN_OPTIMIZER_FALLBACK', 'true').lower() in ('1', 'true', 'yes')
+
+# Generate+save runs keyed by patient and rendered prompt. Finished runs are kept briefly so a
+# repeat within the window (double click, UI and API at once) gets the same plan_id instead of a second row.
+meal_plan_flights = SingleFlight(linger_seconds=float(os.getenv('MEAL_PLAN_COALESCE_SECONDS', '30')))
+
+def _meal_plan_flight_key(patient_id, chain, prompt_inputs):
+    prompt = chain.prompt.format(**prompt_inputs)
+    return f"meal_plan:{patient_id}:{make_cache_key(prompt, llm_params(chain.llm))}"
+
+def _save_generated_plan(patient_id, patient_data, meal_plan, structured=None, duration_days=7, foods=None, validation=None):
+    """
+    Save a generated plan: its text in plan_details ({"text": ...} JSON), and in plan_data the structured
+    form when available, the energy report from plan_nutrition (computed locally against the foods table)
+    and the food_matcher validation report. Error texts are not saved.
+    """
+    if not meal_plan or meal_plan.startswith("Error"):
+        return None
+    try:
+        nutrition = analyze_plan(meal_plan, foods if foods is not None else data_manager.get_foods_data(), patient_data, structured)
+    except Exception as e:
+        # The report is advisory: never lose a generated plan over it
+        logger.warning("Nutrition analysis failed for patient %s: %s", patient_id, e)
+        nutrition = None
+    return data_manager.save_meal_plan(
+        patient_id=str(patient_id),
+        meal_plan=plan_details_json(meal_plan),
+        duration_days=duration_days,
+        parent_id=str(patient_data.get('parent_id')),
+        plan_data=build_plan_data(meal_plan, structured, nutrition, validation)
     )
 
-    result = chain.run(**prompt_inputs)
-    return result
\ No newline at end of file
+def generate_and_save_meal_plan(patient_id, available_ingredients=None, religion=None, nutrition_ai=None, patient_data=None, context=None, structured=False):
+    """
+    Analysis -> meal plan -> save_meal_plan for one patient. Identical concurrent requests share
+    one generation and one saved row. Returns {"nutrition_analysis", "meal_plan", "validation", "plan_id",
+    "shared"}, plus "structured" in structured mode.
+    """
+    try:
+        patient_data, nutrition_analysis, chain, prompt_inputs = _prepare_meal_plan(
+            patient_id, available_ingredients, religion, nutrition_ai, patient_data, context, structured
+        )
+    except ValueError as e:
+        return {"nutrition_analysis": "", "meal_plan": f"Error: {e}", "plan_id": None, "shared": False}
+    foods = context["foods"] if context else None
+
+    def generate():
+        if not structured:
+            meal_plan = run_chain_cached(chain, prompt_inputs, tags=(patient_tag(patient_id), FOODS_TAG), name="meal_plan")
+            meal_plan, validation = check_meal_plan(patient_id, meal_plan, patient_data, prompt_inputs, religion, context)
+            return {
+                "meal_plan": meal_plan,
+                "validation": validation,
+                "plan_id": _save_generated_plan(patient_id, patient_data, meal_plan, foods=foods, validation=validation),
+            }
+        try:
+            meal_plan, plan = _generate_structured(patient_id, chain, prompt_inputs, context)
+        except ValueError as e:
+            return {"meal_plan": f"Error: {e}", "plan_id": None}
+        # Structured items are already resolved to food ids; only check the plan, do not rewrite it
+        _, validation = check_meal_plan(patient_id, meal_plan, patient_data, religion=religion, context=context, repair=False)
+        return {
+            "meal_plan": meal_plan,
+            "structured": plan.model_dump(),
+            "validation": validation,
+            "plan_id": _save_generated_plan(patient_id, patient_data, meal_plan, plan, foods=foods, validation=validation),
+        }
+
+    result, shared = meal_plan_flights.do(_meal_plan_flight_key(patient_id, chain, prompt_inputs), generate)
+    return {"nutrition_analysis": nutrition_analysis, **result, "shared": shared}
+
+def stream_and_save_meal_plan(patient_id, available_ingredients=None, religion=None, nutrition_ai=None, result=None):
+    """
+    Streaming counterpart of generate_and_save_meal_plan: yields text chunks, saves the plan once the
+    stream completes, and fills result (a dict) with {"shared", "result": {"meal_plan", "validation", "plan_id"}}.
+    Concurrent identical requests follow the same stream and receive the same plan_id.
+    """
+    patient_data, _, chain, prompt_inputs = _prepare_meal_plan(patient_id, available_ingredients, religion, nutrition_ai)
+
+    def finish(chunks):
+        meal_plan = "".join(chunks)
+        # The text has already been streamed to the client, so it is checked but not repaired
+        _, validation = check_meal_plan(patient_id, meal_plan, patient_data, religion=religion, repair=False)
+        return {"meal_plan": meal_plan, "validation": validation, "plan_id": _save_generated_plan(patient_id, patient_data, meal_plan, validation=validation)}
+
+    yield from meal_plan_flights.stream(
+        _meal_plan_flight_key(patient_id, chain, prompt_inputs),
+        lambda: stream_chain_cached(chain, prompt_inputs, tags=(patient_tag(patient_id), FOODS_TAG), name="meal_plan"),
+        finish,
+        holder=result,
+        result_chunks=lambda done: [done["meal_plan"]]
+    )
\ No newline at end of file
@@ -2,7 +2,7 @@ import streamlit as st
 import os
 import json
 import pandas as pd
-from nutrition_ai import ChildNutritionAI
+from llm_registry import llm_registry
 from data_manager import data_manager
 from datetime import datetime, timedelta
 
@@ -68,11 +68,44 @@ def load_nutritionist_options():
         # Fallback to empty dict
         return {}
 
+MEAL_PLANS_PAGE_SIZE = 25
+
+def load_meal_plan_page(key_prefix, search_val, barangay_ids, has_notes, sort_recent):
+    """Fetch the current page of meal plans, restarting from page 1 whenever the filters change."""
+    filters = (search_val, tuple(barangay_ids or ()), has_notes, sort_recent)
+    cursors_key = f"{key_prefix}_page_cursors"
+    filters_key = f"{key_prefix}_page_filters"
+    if st.session_state.get(filters_key) != filters or cursors_key not in st.session_state:
+        st.session_state[filters_key] = filters
+        st.session_state[cursors_key] = [None]
+    cursors = st.session_state[cursors_key]
+    page = data_manager.list_meal_plans(
+        search=search_val,
+        barangay_ids=barangay_ids,
+        has_notes=has_notes,
+        sort_recent=sort_recent,
+        page_size=MEAL_PLANS_PAGE_SIZE,
+        after=cursors[-1]
+    )
+    page["page_number"] = len(cursors)
+    return page
+
+def render_meal_plan_page_controls(key_prefix, page):
+    """Previous/Next buttons over the keyset cursors kept in session state."""
+    cursors = st.session_state[f"{key_prefix}_page_cursors"]
+    total_pages = max(1, math.ceil(page["total"] / MEAL_PLANS_PAGE_SIZE))
+    pag_row = st.columns([0.18,0.82])
+    with pag_row[0]:
+        btn_cols = st.columns([1,1])
+        btn_cols[0].button('Previous', key=f'{key_prefix}_prev_page', on_click=lambda: cursors.pop(), disabled=(len(cursors)==1))
+        btn_cols[1].button('Next', key=f'{key_prefix}_next_page', on_click=lambda: cursors.append(page["next_cursor"]), disabled=(page["next_cursor"] is None))
+    st.caption(f"Page {page['page_number']} of {total_pages} | {page['total']} meal plans | {MEAL_PLANS_PAGE_SIZE} records per page")
+
 def initialize_session_state():
     """Initialize session state variables"""
     if 'nutrition_ai' not in st.session_state:
         try:
-            st.session_state.nutrition_ai = ChildNutritionAI()
+            st.session_state.nutrition_ai = llm_registry.nutrition_ai()
             st.session_state.api_working = True
         except Exception as e:
             st.session_state.nutrition_ai = None
@@ -121,9 +154,8 @@ def main():
         # Quick stats
         st.subheader("📊 Quick Stats")
         all_children = data_manager.get_children_data()
-        all_meal_plans = data_manager.get_meal_plans()
         st.metric("Total Children", len(all_children))
-        st.metric("Total Meal Plans", len(all_meal_plans))
+        st.metric("Total Meal Plans", data_manager.count_meal_plans())
     
     # Main tabs
     tab1, tab2, tab3 = st.tabs(["👨‍👩‍👧‍👦 All Parents", "📝 Add Notes", "🍽️ Food Database"])
@@ -145,6 +177,7 @@ def show_all_parents():
     
     # Get barangays from database
     barangay_list = ["All"]
+    barangays = {}
     try:
         barangays = data_manager.get_all_barangays()
         barangay_list.extend(sorted(barangays.values()))
@@ -178,7 +211,7 @@ def show_all_parents():
         if children:
             barangay_id = children[0].get('barangay_id')
             if barangay_id:
-                barangay = data_manager.get_barangay_name(barangay_id)
+                barangay = barangays.get(barangay_id, f"Barangay {barangay_id}")
         num_children = len(children)
         parent_rows.append({
             "parent_id": str(parent_id),
@@ -262,7 +295,6 @@ def show_all_parents():
 def show_add_notes():
     """Dedicated section for adding detailed notes to meal plans"""
     st.header("📝 Add Notes to Meal Plans")
-    parents_data = data_manager.get_parents_data()
 
     # --- FILTERS ---
     filter_cols = st.columns([2,2,2,2])
@@ -271,6 +303,7 @@ def show_add_notes():
     
     # Get barangays from database - FIXED: Use the same approach as show_all_parents()
     barangay_list = ["All"]
+    barangays = {}
     try:
         barangays = data_manager.get_all_barangays()
         barangay_list.extend(sorted(barangays.values()))
@@ -286,47 +319,42 @@ def show_add_notes():
         sort_recent = st.checkbox("Sort by Most Recent", value=True, key="add_notes_sort_recent")
 
     # --- GET AND PREPARE MEAL PLANS ---
-    all_plans = data_manager.get_meal_plans()
+    # One page of plans, joined with child, parent, barangay and aggregated notes
+    barangay_ids = [bid for bid, name in barangays.items() if name == barangay_selected] if barangay_selected and barangay_selected != "All" else None
+    has_notes = {"Has Notes": True, "No Notes": False}.get(notes_filter)
+    page = load_meal_plan_page("add_notes", search_val, barangay_ids, has_notes, sort_recent)
+    overview_rows = page["rows"]
+
+    def clean_note(note_val):
+        if isinstance(note_val, str):
+            try:
+                parsed = json.loads(note_val)
+                if isinstance(parsed, dict) and 'text' in parsed:
+                    note_val = parsed['text']
+            except Exception:
+                pass
+        if isinstance(note_val, str):
+            note_val = note_val.replace('\r\n', '  \n').replace('\n', '  \n').replace('/n', '  \n')
+        return note_val
+
+    nutritionist_options = st.session_state.nutritionist_options if 'nutritionist_options' in st.session_state else load_nutritionist_options()
+    def get_nutritionist_name(nutritionist_id):
+        return nutritionist_options.get(str(nutritionist_id), f"Nutritionist {nutritionist_id}")
+
     table_rows = []
-    for plan in all_plans.values():
-        child_data = data_manager.get_patient_by_id(plan['patient_id'])
+    for plan in overview_rows:
+        child_data = plan if plan.get('child_id') is not None else None
         child_name = data_manager.format_full_name(
-            child_data.get('first_name', ''),
-            child_data.get('middle_name', ''),
-            child_data.get('last_name', '')
+            plan.get('child_first_name', ''),
+            plan.get('child_middle_name', ''),
+            plan.get('child_last_name', '')
         ) if child_data else "Unknown"
-        age_months = child_data['age_months'] if child_data and 'age_months' in child_data else None
+        age_months = child_data.get('age_months') if child_data else None
         child_age = f"{age_months//12}y {age_months%12}m" if age_months is not None else "-"
         parent_id = child_data.get('parent_id') if child_data else None
-        notes = data_manager.get_notes_for_meal_plan(plan.get('plan_id', ''))
-        
-        def format_created_at(val):
-            if isinstance(val, str):
-                try:
-                    dt = datetime.strptime(val, '%Y-%m-%d %H:%M:%S')
-                    return dt.strftime('%b %d')
-                except Exception:
-                    return val
-            if isinstance(val, datetime):
-                return val.strftime('%b %d')
-            return str(val)
-            
-        def clean_note(note_val):
-            if isinstance(note_val, str):
-                try:
-                    parsed = json.loads(note_val)
-                    if isinstance(parsed, dict) and 'text' in parsed:
-                        note_val = parsed['text']
-                except Exception:
-                    pass
-            if isinstance(note_val, str):
-                note_val = note_val.replace('\r\n', '  \n').replace('\n', '  \n').replace('/n', '  \n')
-            return note_val
-            
+        notes = plan.get('notes') or []
+
         if notes:
-            nutritionist_options = st.session_state.nutritionist_options if 'nutritionist_options' in st.session_state else load_nutritionist_options()
-            def get_nutritionist_name(nutritionist_id):
-                return nutritionist_options.get(str(nutritionist_id), f"Nutritionist {nutritionist_id}")
             notes_str = "<br>".join([
                 f"Noted by {get_nutritionist_name(note.get('nutritionist_id'))}: {clean_note(note.get('notes', ''))}"
                 for note in notes
@@ -337,23 +365,20 @@ def show_add_notes():
         parent_full_name = "Unknown"
         barangay_val = "-"
         if parent_id is not None:
-            parent_info = parents_data.get(str(parent_id))
-            if parent_info:
+            if plan.get('parent_first_name') is not None:
                 parent_full_name = data_manager.format_full_name(
-                    parent_info.get('first_name', ''),
-                    parent_info.get('middle_name', ''),
-                    parent_info.get('last_name', '')
+                    plan.get('parent_first_name', ''),
+                    plan.get('parent_middle_name', ''),
+                    plan.get('parent_last_name', '')
                 )
-                # Get barangay name - FIXED: Use the same logic as show_all_parents()
-                barangay_id = child_data.get('barangay_id') if child_data else None
+                barangay_id = child_data.get('barangay_id')
                 if barangay_id:
-                    barangay_val = data_manager.get_barangay_name(barangay_id)
-                else:
-                    barangay_val = "-"
+                    barangay_val = plan.get('barangay_name') or f"Barangay {barangay_id}"
             else:
                 parent_full_name = f"Parent {parent_id}"
                 
-        plan_details_clean = clean_note(plan.get('plan_details', ''))
+        # plan_data is parsed once at save time; clean_note is only needed for rows without it
+        plan_details_clean = plan['plan_data']['text'] if plan.get('plan_data') else clean_note(plan.get('plan_details', ''))
         generated_at_val = plan.get('generated_at', '')
         
         # Diet Restrictions
@@ -377,39 +402,12 @@ def show_add_notes():
             "_raw_child_name": child_name,
             "_raw_parent_name": parent_full_name,
             "_raw_plan_id": str(plan.get('plan_id', '')),
+            "_patient_id": plan.get('patient_id'),
         })
 
-    # --- APPLY FILTERS ---
+    # Search, barangay, notes filters and sorting are applied in SQL by list_meal_plans
     filtered_rows = table_rows
-    # Search filter
-    if search_val:
-        search_val_lower = search_val.lower()
-        filtered_rows = [row for row in filtered_rows if search_val_lower in row['_raw_child_name'].lower() or search_val_lower in row['_raw_parent_name'].lower() or search_val_lower in row['_raw_plan_id'].lower()]
-    # Barangay filter
-    if barangay_selected and barangay_selected != "All":
-        filtered_rows = [row for row in filtered_rows if row["Barangay"] == barangay_selected]
-    # Notes filter
-    if notes_filter == "Has Notes":
-        filtered_rows = [row for row in filtered_rows if row["_has_notes"]]
-    elif notes_filter == "No Notes":
-        filtered_rows = [row for row in filtered_rows if not row["_has_notes"]]
-    # Sort by most recent
-    if sort_recent:
-        def get_dt(row):
-            val = row.get("Generated at", "")
-            # Try to parse datetime, fallback to plan ID (as int) if missing/invalid
-            try:
-                return datetime.strptime(val, "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                try:
-                    # Fallback: use plan ID as int (higher = newer)
-                    return datetime.min.replace(year=1900) + timedelta(days=int(row.get('Plan ID', 0)))
-                except Exception:
-                    return datetime.min
-        filtered_rows.sort(key=get_dt, reverse=True)
-    else:
-        # Sort by plan ID ascending (as int)
-        filtered_rows.sort(key=lambda x: int(x.get('Plan ID', 0)))
+    render_meal_plan_page_controls("add_notes", page)
 
     columns = ["Plan ID", "Child Name", "Child Age", "Parent", "Barangay", "Diet Restrictions", "Plan Details", "Generated at", "Notes", "Add note"]
     
@@ -473,9 +471,7 @@ def show_add_notes():
                 new_note = val_cols[-1].text_area("Enter note:", key=f"note_input_{plan_id}")
                 save_col, cancel_col = val_cols[-1].columns([1,1])
                 if save_col.button("Save Note", key=f"save_note_{plan_id}"):
-                    # Find patient_id for this plan
-                    plan = next((p for p in all_plans.values() if str(p.get('plan_id')) == str(plan_id)), None)
-                    patient_id = plan['patient_id'] if plan and 'patient_id' in plan else None
+                    patient_id = row.get("_patient_id")
                     if not patient_id:
                         st.error('Could not determine patient_id for this meal plan.')
                     else:
@@ -494,11 +490,6 @@ def show_add_notes():
 def show_food_database():
     st.header("🍽️ Food Database Management")
 
-    foods = data_manager.get_foods_data()
-    if not foods:
-        st.info("No food data available.")
-        return
-
     # Search bar
     if 'food_db_search' not in st.session_state:
         st.session_state['food_db_search'] = ''
@@ -510,29 +501,19 @@ def show_food_database():
     )
     if search_val != prev_search:
         st.session_state['food_db_search'] = search_val
+        st.session_state['food_db_page'] = 1
         st.rerun()
-        
-    def filter_foods(data, query):
-        if not query:
-            return data
-        query = query.lower()
-        filtered = []
-        for item in data:
-            for col in ["food_id", "food_name_and_description", "alternate_common_names", "energy_kcal", "nutrition_tags"]:
-                val = item.get(col, '')
-                if isinstance(val, list):
-                    val = ', '.join(val)
-                if query in str(val).lower():
-                    filtered.append(item)
-                    break
-        return filtered
-
-    filtered_foods = filter_foods(foods, search_val)
+
     # Pagination setup
     records_per_page = 10
-    total_records = len(filtered_foods)
-    total_pages = (total_records - 1) // records_per_page + 1
-    page = st.session_state.get('food_db_page', 1)
+    results = data_manager.search_foods_page(search_val, st.session_state.get('food_db_page', 1), records_per_page)
+    if not results['total'] and not search_val:
+        st.info("No food data available.")
+        return
+    filtered_foods = results['foods']
+    total_records = results['total']
+    total_pages = results['pages']
+    page = results['page']
     def set_page(new_page):
         st.session_state['food_db_page'] = new_page
 
@@ -544,7 +525,7 @@ def show_food_database():
         btn_cols[1].button('Next', key='next_page', on_click=lambda: set_page(page+1), disabled=(page==total_pages))
 
     start_idx = (page-1)*records_per_page
-    end_idx = min(start_idx+records_per_page, total_records)
+    end_idx = start_idx+len(filtered_foods)
     st.caption(f"Showing {start_idx+1} to {end_idx} of {total_records} rows | {records_per_page} records per page")
 
     columns = [
@@ -568,7 +549,7 @@ def show_food_database():
         header_cols[i].markdown(f"**{label}**")
 
     table_rows = []
-    for idx, item in enumerate(filtered_foods[start_idx:end_idx], start=start_idx+1):
+    for idx, item in enumerate(filtered_foods, start=start_idx+1):
         row = {
             "No.": idx,
             "food_id": item.get("food_id", ""),
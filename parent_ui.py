@@ -1,6 +1,6 @@
 
 import streamlit as st
-from nutrition_ai import ChildNutritionAI
+from llm_registry import llm_registry
 from data_manager import data_manager
 from datetime import datetime
 
@@ -46,7 +46,7 @@ def initialize_session_state():
     """Initialize session state variables"""
     if 'nutrition_ai' not in st.session_state:
         try:
-            st.session_state.nutrition_ai = ChildNutritionAI()
+            st.session_state.nutrition_ai = llm_registry.nutrition_ai()
             st.session_state.api_working = True
         except Exception as e:
             st.session_state.nutrition_ai = None
@@ -116,11 +116,8 @@ def show_generated_meal_plans():
         child.get('last_name', '')
     ) for child in children}
     selected_child_id = st.selectbox("Filter by Child", options=[None] + list(child_options.keys()), format_func=lambda x: child_options[x] if x else "All Children", index=0)
-    # Get all plan_ids for these children
-    child_ids = [child['patient_id'] for child in children]
-    all_plans = data_manager.get_meal_plans()
-    # Only show plans for this parent's children
-    plans = [plan for plan in all_plans.values() if plan['patient_id'] in child_ids]
+    # Only this parent's children's plans, already parsed (plan_data)
+    plans = data_manager.get_meal_plans_by_parent(st.session_state.parent_id)
     if selected_child_id:
         plans = [plan for plan in plans if plan['patient_id'] == selected_child_id]
     # Get all nutritionist notes for these plans
@@ -156,7 +153,7 @@ def show_generated_meal_plans():
                     pass
                 note_val = note_val.replace('\r\n', '  \n').replace('\n', '  \n').replace('/n', '  \n')
             return note_val
-        plan_details_clean = clean_note(plan_details)
+        plan_details_clean = plan['plan_data']['text'] if plan.get('plan_data') else clean_note(plan_details)
         generated_at_val = plan.get('generated_at', '')
         # Format generated_at robustly
         generated_at_val_fmt = generated_at_val
@@ -339,27 +336,23 @@ def show_meal_plan_generator():
         if not selected_patient_id:
             st.error("Please select a child first!")
             return
-        from nutrition_chain import get_meal_plan_with_langchain
+        from nutrition_chain import stream_and_save_meal_plan
         with st.spinner(f"🔥 Generating meal plan ..."):
             try:
-                meal_plan = get_meal_plan_with_langchain(
+                st.markdown("### 📋 Your Child's Personalized Meal Plan")
+                # Render tokens as they arrive; the plan is saved once the stream ends
+                # (a double click joins the running generation instead of saving a second plan)
+                outcome = {}
+                st.write_stream(stream_and_save_meal_plan(
                     patient_id=selected_patient_id,
                     available_ingredients=available_ingredients.strip() if selected_patient_id else "",
-                    religion=religion if religion else ""
-                )
-                import json
-                # Save meal plan to database as valid JSON
-                meal_plan_json = json.dumps({"text": meal_plan})
-                parent_id = patient_data.get('parent_id')
-                data_manager.save_meal_plan(
-                    patient_id=str(selected_patient_id),
-                    meal_plan=meal_plan_json,
-                    duration_days=7,
-                    parent_id=str(parent_id)
-                )
-                st.success(f"✅ Meal plan generated successfully!")
-                st.markdown("### 📋 Your Child's Personalized Meal Plan")
-                st.markdown(meal_plan)
+                    religion=religion if religion else "",
+                    result=outcome
+                ))
+                if outcome.get("result", {}).get("plan_id"):
+                    st.success(f"✅ Meal plan generated successfully!")
+                else:
+                    st.error("❌ The meal plan could not be saved.")
             except Exception as e:
                 st.error(f"❌ Error generating meal plan: {str(e)}")
 
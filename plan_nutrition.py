@@ -0,0 +1,335 @@
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from meal_optimizer import daily_kcal_target
+from meal_plan_schema import MEAL_TYPES, build_plan_data
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# A day is flagged when its energy total is off the age-based target by more than this fraction
+PLAN_KCAL_TOLERANCE = float(os.getenv('PLAN_KCAL_TOLERANCE', '0.15'))
+# A stated "Daily Total" is flagged when it differs from the computed total by more than this fraction
+STATED_TOTAL_TOLERANCE = 0.10
+REPORT_VERSION = 1
+MAX_DAYS = 7
+# Meal slots: the schema's meal types plus one for anything else the LLM wrote (e.g. "Drinks")
+SLOTS = MEAL_TYPES + ("other",)
+MAX_PHRASE_WORDS = 6
+
+_WORD_RE = re.compile(r"[a-z0-9ñ]+")
+_GRAMS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:g|grams?)\b", re.IGNORECASE)
+_NUMBER_RE = re.compile(r"(\d+(?:\.\d+)?)")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall((text or '').lower())
+
+
+def _food_terms(food: Dict) -> Tuple[List[str], List[str], List[str]]:
+    """(full names, alternate names, short names) a food may be written as, in matching priority order."""
+    name = food.get('food_name_and_description') or ''
+    alternates = [term for term in re.split(r"[,;/]", food.get('alternate_common_names') or '') if term.strip()]
+    return [name], alternates, [name.split(',')[0]]
+
+
+class PlanFoodIndex:
+    """The foods table as an energy array plus a phrase lookup that resolves dish text to food rows."""
+    def __init__(self, foods: List[Dict]):
+        self.foods = sorted(foods, key=lambda f: (f.get('food_id') is None, f.get('food_id') or 0))
+        energy = []
+        for food in self.foods:
+            try:
+                energy.append(float(food.get('energy_kcal')))
+            except (TypeError, ValueError):
+                energy.append(np.nan)
+        self.energy_kcal = np.array(energy, dtype=float)
+        self.has_energy = ~np.isnan(self.energy_kcal)
+        self.energy_kcal = np.nan_to_num(self.energy_kcal)
+        self.index_by_id = {int(f['food_id']): i for i, f in enumerate(self.foods) if f.get('food_id') is not None}
+        self.phrases: Dict[str, int] = {}
+        term_lists = [_food_terms(food) for food in self.foods]
+        # Full names win over alternate names, which win over short names; lower food_id wins ties
+        for priority in range(3):
+            for i, terms in enumerate(term_lists):
+                for term in terms[priority]:
+                    words = _words(term)
+                    key = " ".join(words)
+                    if len(key) >= 3 and len(words) <= MAX_PHRASE_WORDS:
+                        self.phrases.setdefault(key, i)
+
+    def match(self, text: str) -> List[int]:
+        """Food indexes mentioned in text, longest phrase first, left to right, without overlaps."""
+        words = _words(text)
+        found = []
+        i = 0
+        while i < len(words):
+            for n in range(min(MAX_PHRASE_WORDS, len(words) - i), 0, -1):
+                index = self.phrases.get(" ".join(words[i:i + n]))
+                if index is not None:
+                    found.append(index)
+                    i += n
+                    break
+            else:
+                i += 1
+        return found
+
+    def resolve_item(self, item: Dict) -> Optional[int]:
+        """Food index for a structured plan item: by food_id, else by its name."""
+        index = self.index_by_id.get(item.get('food_id')) if item.get('food_id') is not None else None
+        if index is None:
+            matches = self.match(item.get('food_name') or '')
+            index = matches[0] if matches else None
+        return index
+
+
+_index_cache: Dict[int, Tuple[List[Dict], PlanFoodIndex]] = {}
+
+
+def food_index(foods: List[Dict]) -> PlanFoodIndex:
+    """PlanFoodIndex for a foods list, reused while the same list object is passed in (batch contexts)."""
+    cached = _index_cache.get(id(foods))
+    if cached is not None and cached[0] is foods:
+        return cached[1]
+    index = PlanFoodIndex(foods)
+    _index_cache.clear()
+    _index_cache[id(foods)] = (foods, index)
+    return index
+
+
+def _slot(meal: str) -> int:
+    meal = (meal or '').lower()
+    for slot, meal_type in enumerate(MEAL_TYPES):
+        if meal_type in meal:
+            return slot
+    return len(MEAL_TYPES)
+
+
+def _day_number(label) -> Optional[int]:
+    match = _NUMBER_RE.search(str(label))
+    day = int(float(match.group(1))) if match else None
+    return day if day and 1 <= day <= MAX_DAYS else None
+
+
+def _servings(portion: str) -> float:
+    """Multiples of the foods row a portion stands for: grams / 100 when given in grams, else one serving."""
+    grams = _GRAMS_RE.search(portion or '')
+    return float(grams.group(1)) / 100 if grams else 1.0
+
+
+def plan_entries(plan_data: Dict, index: PlanFoodIndex) -> Dict:
+    """
+    The resolvable contents of one parsed plan (plan_data): parallel lists day/slot/food/servings,
+    the days the plan covers, its stated daily totals, and the meals no food could be resolved for.
+    """
+    entries = {"day": [], "slot": [], "food": [], "servings": [], "days": set(), "stated": {}, "unresolved": []}
+
+    def add(day, meal, foods_and_servings):
+        if not foods_and_servings:
+            entries["unresolved"].append(f"Day {day} {meal}")
+        for food, servings in foods_and_servings:
+            entries["day"].append(day)
+            entries["slot"].append(_slot(meal))
+            entries["food"].append(food)
+            entries["servings"].append(servings)
+
+    structured = (plan_data or {}).get("structured")
+    if structured:
+        for day in structured.get("days", []):
+            number = _day_number(day.get("day"))
+            if number is None:
+                continue
+            entries["days"].add(number)
+            if day.get("total_kcal") is not None:
+                entries["stated"][number] = float(day["total_kcal"])
+            for meal in day.get("meals", []):
+                resolved = []
+                for item in meal.get("items") or [{"food_name": meal.get("dish", "")}]:
+                    food = index.resolve_item(item)
+                    if food is not None:
+                        resolved.append((food, _servings(item.get("portion"))))
+                add(number, meal.get("meal_type", ""), resolved)
+        return entries
+
+    for label, meals in ((plan_data or {}).get("parsed_days") or {}).items():
+        number = _day_number(label)
+        if number is None:
+            continue
+        entries["days"].add(number)
+        for meal, description in meals.items():
+            if "total" in meal:
+                stated = _NUMBER_RE.search(description.replace(",", ""))
+                if stated:
+                    entries["stated"][number] = float(stated.group(1))
+                continue
+            if "note" in meal:
+                continue
+            add(number, meal, [(food, 1.0) for food in index.match(description)])
+    return entries
+
+
+def analyze_plans(plans: List[Optional[Dict]], index: PlanFoodIndex, targets: List[Optional[float]]) -> List[Dict]:
+    """
+    Energy report for each parsed plan (plan_data), vectorized across all plans at once:
+    per-meal, per-day and weekly kcal from the foods table, deviation of each day from its target,
+    and flags for off-target days, stated totals that do not add up, and dishes not found in the foods table.
+    """
+    plan_count = len(plans)
+    per_plan = [plan_entries(plan, index) for plan in plans]
+    lengths = np.array([len(entries["food"]) for entries in per_plan], dtype=int)
+    plan_ix = np.repeat(np.arange(plan_count), lengths)
+    day_ix = np.fromiter((d for e in per_plan for d in e["day"]), dtype=int, count=int(lengths.sum()))
+    slot_ix = np.fromiter((s for e in per_plan for s in e["slot"]), dtype=int, count=int(lengths.sum()))
+    food_ix = np.fromiter((f for e in per_plan for f in e["food"]), dtype=int, count=int(lengths.sum()))
+    servings = np.fromiter((s for e in per_plan for s in e["servings"]), dtype=float, count=int(lengths.sum()))
+
+    cells = (plan_ix * MAX_DAYS + day_ix - 1) * len(SLOTS) + slot_ix
+    kcal = index.energy_kcal[food_ix] * servings
+    size = plan_count * MAX_DAYS * len(SLOTS)
+    meal_kcal = np.bincount(cells, weights=kcal, minlength=size).reshape(plan_count, MAX_DAYS, len(SLOTS))
+    meal_items = np.bincount(cells, minlength=size).reshape(plan_count, MAX_DAYS, len(SLOTS))
+    missing_energy = np.bincount(plan_ix, weights=~index.has_energy[food_ix], minlength=plan_count)
+    day_kcal = meal_kcal.sum(axis=2)
+
+    present = np.zeros((plan_count, MAX_DAYS), dtype=bool)
+    stated = np.full((plan_count, MAX_DAYS), np.nan)
+    for p, entries in enumerate(per_plan):
+        for day in entries["days"]:
+            present[p, day - 1] = True
+        for day, total in entries["stated"].items():
+            stated[p, day - 1] = total
+    target = np.array([t if t else np.nan for t in targets], dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        deviation = (day_kcal - target[:, None]) / target[:, None]
+        stated_gap = np.abs(stated - day_kcal) / np.maximum(day_kcal, 1.0)
+    below = present & (deviation < -PLAN_KCAL_TOLERANCE)
+    above = present & (deviation > PLAN_KCAL_TOLERANCE)
+    mismatch = present & (stated_gap > STATED_TOTAL_TOLERANCE)
+    days_covered = present.sum(axis=1)
+    weekly = np.where(present, day_kcal, 0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = weekly / days_covered
+
+    reports = []
+    for p in range(plan_count):
+        days = [d for d in range(MAX_DAYS) if present[p, d]]
+        flags = []
+        if np.isnan(target[p]):
+            flags.append("no_target")
+        if below[p].any():
+            flags.append("below_target")
+        if above[p].any():
+            flags.append("above_target")
+        if mismatch[p].any():
+            flags.append("stated_total_mismatch")
+        if per_plan[p]["unresolved"]:
+            flags.append("unresolved_dishes")
+        if days and not lengths[p]:
+            flags.append("no_foods_resolved")
+        reports.append({
+            "version": REPORT_VERSION,
+            "target_kcal": None if np.isnan(target[p]) else round(float(target[p]), 1),
+            "weekly_kcal": round(float(weekly[p]), 1),
+            "average_daily_kcal": round(float(average[p]), 1) if days else None,
+            "daily_kcal": {f"Day {d + 1}": round(float(day_kcal[p, d]), 1) for d in days},
+            "meal_kcal": {
+                f"Day {d + 1}": {SLOTS[s]: round(float(meal_kcal[p, d, s]), 1) for s in range(len(SLOTS)) if meal_items[p, d, s]}
+                for d in days
+            },
+            "deviation_pct": {
+                f"Day {d + 1}": round(float(deviation[p, d]) * 100, 1) for d in days if not np.isnan(deviation[p, d])
+            },
+            "days_off_target": [f"Day {d + 1}" for d in days if below[p, d] or above[p, d]],
+            "stated_total_mismatch": [f"Day {d + 1}" for d in days if mismatch[p, d]],
+            "resolved_items": int(lengths[p]),
+            "items_without_kcal": int(missing_energy[p]),
+            "unresolved_dishes": per_plan[p]["unresolved"],
+            "flags": flags,
+        })
+    return reports
+
+
+def plan_target(patient_data: Optional[Dict]) -> Optional[float]:
+    """Age-based daily kcal target for a plan's patient, or None when there is none (unknown, under 6 months)."""
+    if not patient_data:
+        return None
+    try:
+        return float(daily_kcal_target(patient_data))
+    except ValueError:
+        return None
+
+
+def analyze_plan(meal_plan: str, foods: List[Dict], patient_data: Optional[Dict], structured=None) -> Dict:
+    """Energy report for one generated plan (text plus optional StructuredMealPlan), as stored under plan_data["nutrition"]."""
+    plan_data = build_plan_data(meal_plan, structured)
+    return analyze_plans([plan_data], food_index(foods), [plan_target(patient_data)])[0]
+
+
+def audit_meal_plans(batch_size: int = 2000, store: bool = False, foods: Optional[List[Dict]] = None, max_listed: int = 100) -> Dict:
+    """
+    Analyze every saved meal plan in one pass (keyset-paged batches). With store=True each report is
+    written back into the plan's plan_data. Returns counts per flag and the most off-target plans.
+    """
+    from data_manager import data_manager
+    started = time.time()
+    index = food_index(foods if foods is not None else data_manager.get_foods_data())
+    summary = {"plans": 0, "flagged": 0, "flags": {}, "stored": 0}
+    worst = []
+    after_plan_id = 0
+    while True:
+        rows = data_manager.get_meal_plans_for_audit(after_plan_id, batch_size)
+        if not rows:
+            break
+        after_plan_id = rows[-1]['plan_id']
+        reports = analyze_plans([row['plan_data'] for row in rows], index, [plan_target(row) for row in rows])
+        for row, report in zip(rows, reports):
+            summary["plans"] += 1
+            if report["flags"]:
+                summary["flagged"] += 1
+            for flag in report["flags"]:
+                summary["flags"][flag] = summary["flags"].get(flag, 0) + 1
+            if report["deviation_pct"]:
+                worst_day = max(report["deviation_pct"].values(), key=abs)
+                worst.append((abs(worst_day), row['plan_id'], row['patient_id'], worst_day, report["flags"]))
+        worst = sorted(worst, reverse=True)[:max_listed]
+        if store:
+            summary["stored"] += data_manager.save_meal_plan_nutrition(
+                [(row['plan_id'], {**(row['plan_data'] or {}), "nutrition": report}) for row, report in zip(rows, reports)]
+            )
+    elapsed = time.time() - started
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    summary["plans_per_second"] = round(summary["plans"] / elapsed, 1) if elapsed > 0 else None
+    summary["most_off_target"] = [
+        {"plan_id": plan_id, "patient_id": patient_id, "worst_day_deviation_pct": deviation, "flags": flags}
+        for _, plan_id, patient_id, deviation, flags in worst
+    ]
+    return summary
+
+
+def main():
+    """
+    python plan_nutrition.py              # report only
+    python plan_nutrition.py --store      # also save each plan's report into plan_data
+    """
+    parser = argparse.ArgumentParser(description="Audit the energy totals of every saved meal plan against age-based targets.")
+    parser.add_argument("--store", action="store_true", help="write each report into meal_plans.plan_data")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--top", type=int, default=20, help="number of most off-target plans to list")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    summary = audit_meal_plans(batch_size=args.batch_size, store=args.store, max_listed=args.top)
+    print(json.dumps(summary, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
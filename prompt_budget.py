@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budgets per chain; override with PROMPT_BUDGET_<CHAIN> (e.g. PROMPT_BUDGET_MEAL_PLAN=5000)
+DEFAULT_BUDGETS = {
+    "meal_plan": 4000,
+    "patient_assessment": 2500,
+    "nutrition_analysis": 1500,
+    "patient_meal_plan": 2000,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt budgeting (~4 characters per token)."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def chain_budget(chain: str) -> int:
+    return int(os.getenv(f"PROMPT_BUDGET_{chain.upper()}", DEFAULT_BUDGETS.get(chain, 4000)))
+
+
+def trim_to_tokens(text: str, max_tokens: int, by_lines: bool = True) -> str:
+    """Cut text to about max_tokens, at line boundaries when by_lines is set."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    if by_lines:
+        kept = []
+        used = 0
+        for line in text.split('\n'):
+            line_tokens = estimate_tokens(line) + 1
+            if used + line_tokens > max_tokens:
+                break
+            kept.append(line)
+            used += line_tokens
+        if kept:
+            return '\n'.join(kept)
+    return text[:max(max_tokens * 4 - 3, 0)].rstrip() + "..."
+
+
+class PromptBuilder:
+    """
+    Token accounting for one rendered prompt. Fixed parts (template, short fields) are counted as-is;
+    sections are trimmed by priority when the total exceeds the chain budget. A higher priority
+    number means the section is trimmed first; priority 0 sections are never trimmed.
+    """
+    def __init__(self, chain: str, template: str = "", budget: Optional[int] = None):
+        self.chain = chain
+        self.budget = chain_budget(chain) if budget is None else budget
+        self.template_tokens = estimate_tokens(template)
+        self._fixed: Dict[str, int] = {}
+        self._sections: List[Dict] = []
+
+    def fixed(self, name: str, text) -> "PromptBuilder":
+        self._fixed[name] = estimate_tokens(str(text) if text is not None else "")
+        return self
+
+    def section(self, name: str, text: str, priority: int, by_lines: bool = True, min_tokens: int = 0) -> "PromptBuilder":
+        text = text or ""
+        self._sections.append({
+            "name": name, "text": text, "priority": priority,
+            "by_lines": by_lines, "min_tokens": min_tokens, "tokens": estimate_tokens(text),
+        })
+        return self
+
+    def fit(self) -> Dict[str, str]:
+        """Trim sections to the budget and return their final text by name; records build metrics."""
+        fixed_tokens = self.template_tokens + sum(self._fixed.values())
+        total_before = fixed_tokens + sum(s["tokens"] for s in self._sections)
+        over = total_before - self.budget
+        fitted = {s["name"]: s["text"] for s in self._sections}
+        trimmed = {}
+        for s in sorted(self._sections, key=lambda s: s["priority"], reverse=True):
+            if over <= 0 or s["priority"] == 0:
+                break
+            allowed = max(s["min_tokens"], s["tokens"] - over)
+            if allowed >= s["tokens"]:
+                continue
+            new_text = trim_to_tokens(s["text"], allowed, s["by_lines"])
+            new_tokens = estimate_tokens(new_text)
+            over -= s["tokens"] - new_tokens
+            fitted[s["name"]] = new_text
+            trimmed[s["name"]] = {"before": s["tokens"], "after": new_tokens}
+        sections = {name: estimate_tokens(text) for name, text in fitted.items()}
+        prompt_metrics.begin({
+            "chain": self.chain,
+            "budget": self.budget,
+            "fixed_tokens": fixed_tokens,
+            "sections": sections,
+            "trimmed": trimmed,
+            "tokens_before_trim": total_before,
+            "tokens_after_trim": fixed_tokens + sum(sections.values()),
+        })
+        return fitted
+
+
+class PromptMetrics:
+    """
+    Per-request prompt metrics. PromptBuilder.fit leaves a pending entry for the current thread;
+    the LLM call that follows completes it with latency and cache status and records it.
+    """
+    def __init__(self, maxlen: int = 500):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=maxlen)
+        self._local = threading.local()
+
+    def begin(self, entry: Dict):
+        self._local.pending = entry
+
+    def take_pending(self, chain: Optional[str] = None) -> Dict:
+        entry = getattr(self._local, "pending", None)
+        self._local.pending = None
+        if entry is None or (chain and entry.get("chain") != chain):
+            return {"chain": chain}
+        return entry
+
+    def record(self, entry: Dict):
+        with self._lock:
+            self._recent.append(entry)
+        collector = getattr(self._local, "collector", None)
+        if collector is not None:
+            collector.append(entry)
+        logger.info("prompt_metrics %s", json.dumps(entry, default=str))
+
+    @contextmanager
+    def capture(self):
+        """Collect the entries recorded on this thread inside the block (e.g. one background job)."""
+        previous = getattr(self._local, "collector", None)
+        entries: List[Dict] = []
+        self._local.collector = entries
+        try:
+            yield entries
+        finally:
+            self._local.collector = previous
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            return list(self._recent)[-limit:]
+
+    def summary(self) -> Dict:
+        """Average prompt tokens and latency per chain over the recent window."""
+        per_chain: Dict[str, Dict] = {}
+        for entry in self.recent(limit=len(self._recent) or 1):
+            stats = per_chain.setdefault(entry.get("chain") or "unknown", {
+                "requests": 0, "cached": 0, "trimmed": 0, "prompt_tokens": 0, "latency_ms": 0.0,
+            })
+            stats["requests"] += 1
+            stats["cached"] += 1 if entry.get("cached") else 0
+            stats["trimmed"] += 1 if entry.get("trimmed") else 0
+            stats["prompt_tokens"] += entry.get("prompt_tokens", 0)
+            stats["latency_ms"] += entry.get("latency_ms", 0.0)
+        for stats in per_chain.values():
+            stats["avg_prompt_tokens"] = round(stats.pop("prompt_tokens") / stats["requests"])
+            stats["avg_latency_ms"] = round(stats.pop("latency_ms") / stats["requests"], 1)
+        return per_chain
+
+
+prompt_metrics = PromptMetrics()
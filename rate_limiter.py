@@ -0,0 +1,276 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+import httpx
+from dotenv import load_dotenv
+from groq import APIConnectionError
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling Groq while the circuit breaker is open."""
+    def __init__(self, retry_after: float):
+        super().__init__(f"Groq is temporarily unavailable (circuit open), retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at rate_per_minute. reserve() always succeeds
+    and returns how long the caller must wait, so concurrent callers queue in arrival order.
+    """
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.refill_per_second = rate_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        self._refill(now)
+        self._tokens -= amount
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.refill_per_second
+
+    def refund(self, amount: float):
+        if self.capacity > 0:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def drain(self, now: float):
+        """Empty the bucket, e.g. after the server said we are over the limit."""
+        self._refill(now)
+        self._tokens = min(self._tokens, 0.0)
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self._tokens
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Server-requested delay from a Groq error's Retry-After (or retry-after-ms) header."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (APIConnectionError, httpx.TransportError)):
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS
+
+
+def is_outage(error: Exception) -> bool:
+    """Errors that suggest Groq is down (5xx, connection/transport failures); only these count toward the circuit breaker."""
+    if isinstance(error, (APIConnectionError, httpx.TransportError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    return status is not None and status >= 500
+
+
+class GroqRateLimiter:
+    """
+    Client-side limiter shared by every Groq call in the process:
+    - token buckets for requests/min and tokens/min, so bursts wait instead of failing;
+    - retries of 429/5xx/connection errors with jittered exponential backoff, honoring Retry-After;
+    - a circuit breaker that fails fast after consecutive outage errors (5xx, connection) and lets one probe
+      through after a cooldown. Throttling (429) means Groq is up: it drains the buckets instead.
+    """
+    def __init__(
+        self,
+        requests_per_minute: float = 30,
+        tokens_per_minute: float = 30000,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 30.0
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._counters = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0, "rejected": 0, "waited_seconds": 0.0}
+
+    # --- circuit breaker
+
+    def _check_circuit(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.cooldown_seconds - time.monotonic()
+            if remaining > 0 or self._probe_in_flight:
+                self._counters["rejected"] += 1
+                raise CircuitOpenError(max(remaining, 1.0))
+            # Half-open: let this call through as the probe
+            self._probe_in_flight = True
+
+    def _record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def _record_failure(self):
+        with self._lock:
+            self._counters["failures"] += 1
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if self._opened_at is not None or self._consecutive_failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Groq circuit opened after %d consecutive failures", self._consecutive_failures)
+                self._opened_at = time.monotonic()
+
+    # --- rate limiting
+
+    def _acquire(self, tokens: int):
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+            self._counters["calls"] += 1
+            self._counters["waited_seconds"] += wait
+        if wait > 0:
+            logger.debug("Groq limiter: waiting %.1fs for capacity", wait)
+            time.sleep(wait)
+
+    def _refund(self, tokens: int):
+        if tokens > 0:
+            with self._lock:
+                self.tokens.refund(tokens)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = retry_after_seconds(error)
+        if delay is None:
+            # Full jitter: uniform in [0, base * 2^attempt], capped
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if getattr(error, 'status_code', None) == 429:
+            with self._lock:
+                self._counters["rate_limited"] += 1
+                now = time.monotonic()
+                # The server's window disagrees with ours: stop every caller until it resets
+                self.requests.drain(now)
+                self.tokens.drain(now)
+        return min(delay, self.max_delay)
+
+    def call(self, fn: Callable, prompt_tokens: int = 0, max_output_tokens: int = 0, count_output: Callable = None):
+        """
+        Run fn() under the limits. prompt_tokens + max_output_tokens are reserved up front;
+        count_output(result) may return the real completion size so the unused part is refunded.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._check_circuit()
+            self._acquire(prompt_tokens + max_output_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self._refund(max_output_tokens)
+                if not is_outage(e):
+                    # Groq answered (a 400, or a 429 the buckets and Retry-After absorb): the service is up
+                    self._record_success()
+                else:
+                    self._record_failure()
+                if not is_retryable(e):
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                with self._lock:
+                    self._counters["retries"] += 1
+                logger.warning("Groq call failed (%s), retry %d/%d in %.1fs", e, attempt + 1, self.max_retries, delay)
+                time.sleep(delay)
+                continue
+            self._record_success()
+            if count_output is not None:
+                self._refund(max(max_output_tokens - count_output(result), 0))
+            return result
+
+    def stream(self, open_stream: Callable[[], Iterator], prompt_tokens: int = 0, max_output_tokens: int = 0, count_output: Callable = None) -> Iterator:
+        """
+        Iterate open_stream() under the limits. Failures before the first chunk are retried like call();
+        once chunks have been yielded an error is raised to the caller.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._check_circuit()
+            self._acquire(prompt_tokens + max_output_tokens)
+            chunks = []
+            try:
+                for chunk in open_stream():
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                self._refund(max_output_tokens)
+                if not is_outage(e):
+                    self._record_success()
+                else:
+                    self._record_failure()
+                if not is_retryable(e):
+                    raise
+                if chunks or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                with self._lock:
+                    self._counters["retries"] += 1
+                logger.warning("Groq stream failed (%s), retry %d/%d in %.1fs", e, attempt + 1, self.max_retries, delay)
+                time.sleep(delay)
+                continue
+            self._record_success()
+            if count_output is not None:
+                self._refund(max(max_output_tokens - count_output(chunks), 0))
+            return
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            if self._opened_at is None:
+                circuit = "closed"
+            elif now - self._opened_at >= self.cooldown_seconds:
+                circuit = "half_open"
+            else:
+                circuit = "open"
+            return {
+                "circuit": circuit,
+                "consecutive_failures": self._consecutive_failures,
+                "requests_available": round(self.requests.available(now), 1),
+                "tokens_available": round(self.tokens.available(now)),
+                "requests_per_minute": self.requests.capacity,
+                "tokens_per_minute": self.tokens.capacity,
+                **{key: round(value, 1) if isinstance(value, float) else value for key, value in self._counters.items()},
+            }
+
+
+groq_limiter = GroqRateLimiter(
+    requests_per_minute=float(os.getenv('GROQ_REQUESTS_PER_MINUTE', '30')),
+    tokens_per_minute=float(os.getenv('GROQ_TOKENS_PER_MINUTE', '30000')),
+    max_retries=int(os.getenv('GROQ_MAX_RETRIES', '4')),
+    failure_threshold=int(os.getenv('GROQ_CIRCUIT_FAILURES', '5')),
+    cooldown_seconds=float(os.getenv('GROQ_CIRCUIT_COOLDOWN_SECONDS', '30')),
+)
@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FlightCancelled(RuntimeError):
+    """The request that was producing a shared result stopped before finishing it."""
+
+
+class _Flight:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks: List[Any] = []
+        self.done = False
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.finished_at = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    In-process request coalescing: while a call for a key is in flight, identical calls wait for it
+    and receive its result (or its exception) instead of running again. Streams are shared too:
+    followers replay the chunks produced so far and then follow the live stream.
+    A finished result is kept for linger_seconds so near-simultaneous repeats (double clicks) also share it.
+    """
+    def __init__(self, linger_seconds: float = 0.0):
+        self.linger_seconds = linger_seconds
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key: str) -> Tuple[_Flight, bool]:
+        """(flight, is_leader) for key; expired finished flights are replaced."""
+        now = time.monotonic()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.done and (flight.error is not None or now - flight.finished_at > self.linger_seconds):
+                flight = None
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.leaders += 1
+                return flight, True
+            flight.followers += 1
+            self.coalesced += 1
+            return flight, False
+
+    def _finish(self, key: str, flight: _Flight, result=None, error: Optional[BaseException] = None):
+        with flight.cond:
+            flight.result = result
+            flight.error = error
+            flight.done = True
+            flight.finished_at = time.monotonic()
+            flight.cond.notify_all()
+        with self._lock:
+            if error is not None or self.linger_seconds <= 0:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            # Drop other expired entries while we hold the lock
+            now = time.monotonic()
+            for other_key in [k for k, f in self._flights.items() if f.done and now - f.finished_at > self.linger_seconds]:
+                del self._flights[other_key]
+        if flight.followers:
+            logger.info("Single-flight %s shared with %d concurrent request(s)", key[:48], flight.followers)
+
+    @staticmethod
+    def _wait(flight: _Flight):
+        with flight.cond:
+            while not flight.done:
+                flight.cond.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn() once per in-flight key. Returns (result, shared) where shared is True for followers."""
+        flight, leader = self._join(key)
+        if not leader:
+            return self._wait(flight), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, flight, error=e)
+            raise
+        self._finish(key, flight, result=result)
+        return result, False
+
+    def stream(
+        self,
+        key: str,
+        open_stream: Callable[[], Iterator],
+        finish: Callable[[List], Any],
+        holder: Optional[Dict] = None,
+        result_chunks: Optional[Callable[[Any], List]] = None
+    ) -> Iterator:
+        """
+        Yield the chunks of open_stream() once per in-flight key; finish(chunks) runs once at the end
+        (e.g. to save the result). Every caller gets the same chunks, and finish's return value is
+        stored in holder["result"] (with holder["shared"]) once the stream completes.
+        result_chunks(result) gives the chunks to replay when the key was produced by do() instead.
+        """
+        flight, leader = self._join(key)
+        if holder is not None:
+            holder["shared"] = not leader
+        if leader:
+            try:
+                for chunk in open_stream():
+                    with flight.cond:
+                        flight.chunks.append(chunk)
+                        flight.cond.notify_all()
+                    yield chunk
+                result = finish(list(flight.chunks))
+            except GeneratorExit:
+                self._finish(key, flight, error=FlightCancelled("The shared generation was cancelled"))
+                raise
+            except BaseException as e:
+                self._finish(key, flight, error=e)
+                raise
+            self._finish(key, flight, result=result)
+            if holder is not None:
+                holder["result"] = result
+            return
+
+        index = 0
+        while True:
+            with flight.cond:
+                while index >= len(flight.chunks) and not flight.done:
+                    flight.cond.wait()
+                pending = flight.chunks[index:]
+                index += len(pending)
+                finished = flight.done and index >= len(flight.chunks)
+            for chunk in pending:
+                yield chunk
+            if finished:
+                break
+        result = self._wait(flight)
+        if index == 0 and result_chunks is not None:
+            yield from result_chunks(result)
+        if holder is not None:
+            holder["result"] = result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": sum(1 for f in self._flights.values() if not f.done),
+                "lingering": sum(1 for f in self._flights.values() if f.done),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+            }
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+# The application modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (name, alternate names, kcal per 100 g, nutrition_tags) rows of the shared test foods table
+CATALOG = [
+    ("Rice, white, cooked", "kanin", 130, "energy"),
+    ("Lugaw", "rice porridge", 70, "nutrient-dense, energy"),
+    ("Camote, boiled", "kamote", 86, "energy, fiber"),
+    ("Egg, boiled", "itlog", 155, "protein"),
+    ("Eggplant, steamed", "talong", 35, "fiber"),
+    ("Catfish, grilled", "hito", 105, "protein"),
+    ("Milkfish, fried", "bangus", 190, "protein"),
+    ("Tilapia, fried", "", 128, "protein"),
+    ("Chicken tinola", "tinolang manok", 90, "protein"),
+    ("Mung bean stew", "ginisang monggo", 105, "protein, iron"),
+    ("Malunggay leaves", "moringa", 64, "green leafy veggies, iron"),
+    ("Squash, boiled", "kalabasa", 40, "veggies, vitamin a"),
+    ("Banana, ripe", "saging", 89, "nutritious, potassium"),
+    ("Papaya, ripe", "", 43, "vitamin a"),
+    ("Peanuts, roasted", "mani", 567, "fat, protein"),
+    ("Fortified biscuit", "", 450, "contains egg, contains milk"),
+    ("Pork adobo", "adobong baboy", 250, "protein"),
+    ("Nutmeg, ground", "", 525, "spice"),
+    ("Rice cakes", "puto", 190, "gluten-free, wheat-free"),
+    ("Shrimp, steamed", "hipon", 99, "protein"),
+]
+
+
+def make_food(food_id, name, alternate="", kcal=100, tags=""):
+    """One foods row as DataManager.get_foods_data() returns it."""
+    return {"food_id": food_id, "food_name_and_description": name, "alternate_common_names": alternate,
+            "energy_kcal": kcal, "nutrition_tags": tags}
+
+
+@pytest.fixture
+def food():
+    return make_food
+
+
+@pytest.fixture(scope="session")
+def foods():
+    return [make_food(food_id, *row) for food_id, row in enumerate(CATALOG, start=1)]
+
+
+@pytest.fixture(scope="session")
+def names(foods):
+    """food_ids (or rows) -> set of food names, for readable assertions."""
+    by_id = {f["food_id"]: f["food_name_and_description"] for f in foods}
+
+    def names(items):
+        return {by_id[item] if isinstance(item, int) else item["food_name_and_description"] for item in items}
+    return names
@@ -0,0 +1,102 @@
+import pytest
+
+from exclusion_index import ExclusionIndex, exclusion_categories
+from food_selector import _terms_pattern, child_exclusions, is_excluded, select_foods
+
+CHILDREN = [
+    {"allergies": "egg", "age_months": 36},
+    {"allergies": "fish", "age_months": 36},
+    {"allergies": "none", "age_months": 18},
+    {"allergies": "peanut, milk", "age_months": 48, "religion": "Islam"},
+    {"allergies": "kiwi", "age_months": 10},
+    {"allergies": "shellfish", "age_months": 36},
+    {"allergies": "eggplant", "age_months": 36},
+]
+
+
+@pytest.fixture(scope="module")
+def index(foods):
+    index = ExclusionIndex()
+    index.build(foods)
+    return index
+
+
+@pytest.fixture
+def excluded(index, foods, names):
+    def excluded(child):
+        return names(index.for_patient(child, foods=foods).food_ids)
+    return excluded
+
+
+def test_categories_cover_allergens_religions_and_age():
+    categories = exclusion_categories()
+    assert "allergen:fish" in categories
+    assert "religion:islam" in categories
+    assert "age:choking" in categories
+
+
+def test_egg_allergy_keeps_veggies_and_eggplant(excluded):
+    assert excluded(CHILDREN[0]) == {"Egg, boiled", "Fortified biscuit"}
+
+
+def test_fish_allergy_excludes_compound_names(excluded):
+    assert excluded(CHILDREN[1]) == {"Catfish, grilled", "Milkfish, fried", "Tilapia, fried"}
+
+
+def test_shellfish_allergy_keeps_finfish(index, excluded):
+    assert index.categories_for(CHILDREN[5]) == (("allergen:shellfish",), ())
+    assert excluded(CHILDREN[5]) == {"Shrimp, steamed"}
+
+
+def test_eggplant_allergy_keeps_eggs(index, excluded):
+    assert index.categories_for(CHILDREN[6]) == ((), ("eggplant",))
+    assert excluded(CHILDREN[6]) == {"Eggplant, steamed"}
+
+
+def test_choking_hazards_use_names_not_tags(excluded):
+    # "nutrient-dense"/"nutritious" tags and "nutmeg" are not nuts
+    assert excluded(CHILDREN[2]) == {"Peanuts, roasted"}
+
+
+def test_tags_mark_allergens_and_free_tags_are_ignored(excluded):
+    assert "Fortified biscuit" in excluded({"allergies": "milk", "age_months": 36})
+    assert "Rice cakes" not in excluded({"allergies": "wheat", "age_months": 36})
+
+
+def test_religion_and_unknown_allergy(index, foods, excluded):
+    assert "Pork adobo" in excluded(CHILDREN[3])
+    assert index.for_patient(CHILDREN[4], foods=foods).categories == ("age:choking", "age:honey", "kiwi")
+
+
+@pytest.mark.parametrize("child", CHILDREN)
+def test_index_agrees_with_term_matching_on_names(index, foods, child):
+    # Foods whose tags do not name an allergen must get the same decision on both paths
+    untagged = [f for f in foods if "contains" not in f["nutrition_tags"]]
+    by_terms, _ = select_foods(untagged, child, token_budget=10**6)
+    by_index, _ = select_foods(untagged, child, token_budget=10**6, excluded=index.for_patient(child, foods=foods))
+    assert sorted(f["food_id"] for f in by_terms) == sorted(f["food_id"] for f in by_index)
+
+
+def test_is_excluded_uses_the_index_when_given(index, foods):
+    catfish = next(f for f in foods if f["food_name_and_description"] == "Catfish, grilled")
+    fish_re = _terms_pattern(child_exclusions(CHILDREN[1]))
+    assert is_excluded(catfish, exclusion_re=fish_re)
+    assert not is_excluded(catfish, index.for_patient(CHILDREN[0], foods=foods), fish_re)
+    assert not is_excluded(catfish)
+
+
+def test_unindexed_foods_fall_back_to_terms(index, foods, food):
+    exclusions = index.for_patient(CHILDREN[1], foods=foods)
+    assert exclusions.excludes(food(99, "Sinigang na bangus"))
+    assert not exclusions.excludes(food(98, "Shellfish soup"))
+
+
+def test_update_food_recomputes_bits(foods, food, names):
+    index = ExclusionIndex()
+    index.build(foods)
+    child = {"allergies": "fish", "age_months": 36}
+    assert "Squash, boiled" not in names(index.for_patient(child).food_ids)
+    index.update_food(12, food(12, "Squash with dilis"))
+    assert 12 in index.for_patient(child).food_ids
+    index.update_food(99, food(99, "Dried dilis"))
+    assert 99 in index.for_patient(child).food_ids
@@ -0,0 +1,53 @@
+import pytest
+
+from food_matcher import FoodMatcher
+from food_selector import child_exclusions
+
+
+@pytest.fixture(scope="module")
+def matcher(foods):
+    matcher = FoodMatcher()
+    matcher.load(foods)
+    return matcher
+
+
+def plan(*meals):
+    return "Day 1:\n" + "\n".join(f"{meal}: {dish}" for meal, dish in zip(["Breakfast", "Lunch", "Snack", "Dinner"], meals))
+
+
+def hit_terms(report):
+    return sorted({hit["term"] for hit in report["allergen_hits"]})
+
+
+def fish_allergy():
+    return child_exclusions({"allergies": "fish", "age_months": 36})
+
+
+@pytest.mark.parametrize("dish", ["Fried milkfish with rice", "Grilled catfish with kanin", "Daing na bangus with rice"])
+def test_fish_compounds_in_dish_are_flagged(matcher, dish):
+    report = matcher.validate(plan(dish), exclusions=fish_allergy())
+    assert report["allergen_hits"], dish
+    assert not report["ok"]
+
+
+def test_excluded_food_rows_are_flagged_through_alternate_names(matcher):
+    # "hito" is only the alternate name; the food row (Catfish) names the allergen
+    report = matcher.validate(plan("Hito with kanin"), exclusions=fish_allergy())
+    assert "catfish" in hit_terms(report)
+
+
+def test_lookalike_foods_are_not_flagged(matcher):
+    report = matcher.validate(plan("Steamed eggplant with rice", "Malunggay leaves"), exclusions=child_exclusions({"allergies": "egg", "age_months": 36}))
+    assert report["allergen_hits"] == []
+    assert report["ok"]
+
+
+def test_plural_allergen_is_flagged(matcher):
+    report = matcher.validate(plan("Boiled eggs with rice"), exclusions=child_exclusions({"allergies": "egg", "age_months": 36}))
+    assert "eggs" in hit_terms(report)
+
+
+def test_unknown_dishes_are_reported(matcher, names):
+    report = matcher.validate(plan("Kangkong adobo with rice"))
+    assert [item["text"] for item in report["unknown_foods"]] == ["Kangkong adobo"]
+    assert "Rice, white, cooked" in names(report["known_food_ids"])
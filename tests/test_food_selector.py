@@ -0,0 +1,98 @@
+import pytest
+
+from food_selector import _terms_pattern, allergen_keys, child_exclusions, excluded_terms, select_foods
+
+
+def exclusion_re(allergies="", age_months=36, religion=None):
+    return _terms_pattern(child_exclusions({"allergies": allergies, "age_months": age_months}, religion))
+
+
+@pytest.mark.parametrize("text", [
+    "catfish, grilled (hito)",
+    "fried milkfish",
+    "sinigang na bangus",
+    "sardines in tomato sauce",
+    "fish ball",
+    "lapu lapu, steamed",
+])
+def test_fish_allergy_catches_compound_and_local_names(text):
+    assert exclusion_re("fish").search(text)
+
+
+@pytest.mark.parametrize("allergies, text", [
+    ("egg", "eggs, boiled"),
+    ("egg", "tortang talong"),
+    ("peanut", "kare-kare"),
+    ("peanut", "kare kare"),
+    ("shellfish", "ginataang alimasag"),
+    ("milk", "buttermilk pancake"),
+])
+def test_allergens_match_plurals_and_dish_names(allergies, text):
+    assert exclusion_re(allergies).search(text)
+
+
+@pytest.mark.parametrize("allergies, text", [
+    ("egg", "eggplant (talong)"),
+    ("egg", "green leafy veggies"),
+    ("fish", "shellfish soup"),
+    ("milk", "milkfish, grilled"),
+])
+def test_allergens_do_not_match_inside_other_words(allergies, text):
+    assert not exclusion_re(allergies).search(text)
+
+
+def test_choking_hazards_match_whole_words_only():
+    pattern = exclusion_re(age_months=12)
+    assert pattern.search("mixed nuts")
+    assert pattern.search("boiled peanuts")
+    assert not pattern.search("pinch of nutmeg")
+    assert not pattern.search("nutrient-dense lugaw")
+
+
+def test_unknown_allergy_excludes_foods_naming_it():
+    assert "kiwi" in excluded_terms("kiwi", None)
+    assert exclusion_re("kiwi").search("kiwi slices")
+
+
+def test_religion_exclusions():
+    pattern = exclusion_re(religion="Islam")
+    assert pattern.search("pork adobo")
+    assert pattern.search("longganisa")
+    assert not pattern.search("chicken adobo")
+
+
+@pytest.mark.parametrize("allergy, keys", [
+    ("shellfish", ["shellfish"]),
+    ("eggs", ["egg"]),
+    ("tree nuts", ["nut"]),
+    ("cow's milk", ["milk"]),
+    ("eggplant", []),
+    ("coconut", []),
+    ("milkfish", []),
+])
+def test_allergy_keywords_match_whole_words(allergy, keys):
+    assert allergen_keys(allergy) == keys
+
+
+def test_shellfish_allergy_keeps_finfish():
+    pattern = exclusion_re("shellfish")
+    assert pattern.search("shrimp, steamed")
+    assert not pattern.search("tilapia, fried")
+    assert not pattern.search("catfish, grilled")
+
+
+def test_eggplant_allergy_keeps_eggs():
+    pattern = exclusion_re("eggplant")
+    assert pattern.search("eggplant, steamed")
+    assert not pattern.search("egg, boiled")
+
+
+def test_coconut_allergy_keeps_peanuts():
+    assert not exclusion_re("coconut").search("peanuts, roasted")
+
+
+def test_select_foods_drops_allergens_and_keeps_lookalikes(foods, names):
+    selected, stats = select_foods(foods, {"allergies": "egg, fish", "age_months": 36}, token_budget=10**6)
+    assert not names(selected) & {"Egg, boiled", "Catfish, grilled", "Milkfish, fried", "Tilapia, fried"}
+    assert {"Eggplant, steamed", "Malunggay leaves", "Fortified biscuit"} <= names(selected)
+    assert stats["excluded"] == 4
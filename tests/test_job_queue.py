@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+import job_queue as jq
+from job_queue import JobQueue, PermanentJobError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    queue.register("echo", lambda payload: {"echo": payload})
+    return queue
+
+
+def expire_leases(queue):
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET started_at = started_at - ? WHERE status = 'running'", (jq.JOB_LEASE_SECONDS + 1,))
+
+
+def test_database_is_created_on_first_use(tmp_path):
+    path = tmp_path / "lazy.sqlite3"
+    queue = JobQueue(str(path))
+    assert not os.path.exists(path)
+    assert queue.stats() == {}
+    assert os.path.exists(path)
+
+
+def test_job_runs_to_success(queue):
+    job_id = queue.submit("echo", {"patient_id": 7})
+    queue.run_job(queue.claim("worker"))
+    job = queue.get(job_id)
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"echo": {"patient_id": 7}}
+
+
+def test_stale_job_is_requeued_until_max_attempts(queue):
+    job_id = queue.submit("echo", {}, max_attempts=2)
+    for attempt in (1, 2):
+        job = queue.claim("worker")
+        assert job["attempts"] == attempt
+        expire_leases(queue)
+        requeued = queue.requeue_stale()
+        assert requeued == (1 if attempt < 2 else 0)
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert "Worker lost" in job["error"]
+    assert queue.claim("worker") is None
+
+
+def test_permanent_errors_are_not_retried(queue):
+    def missing_patient(payload):
+        raise PermanentJobError("Patient data not found")
+
+    queue.register("missing", missing_patient)
+    job_id = queue.submit("missing", {})
+    queue.run_job(queue.claim("worker"))
+    assert queue.get(job_id)["status"] == "failed"
+    assert queue.claim("worker") is None
@@ -0,0 +1,46 @@
+import pytest
+
+from exclusion_index import ExclusionIndex
+from food_selector import _terms_pattern, child_exclusions
+from meal_optimizer import daily_kcal_target, optimize_meal_plan
+
+
+def planned_ids(plan):
+    return {item.food_id for day in plan.days for meal in day.meals for item in meal.items}
+
+
+@pytest.mark.parametrize("child", [
+    {"allergies": "fish, egg", "age_months": 30},
+    {"allergies": "none", "age_months": 14},
+])
+def test_plan_never_uses_excluded_foods(foods, child):
+    unsafe = _terms_pattern(child_exclusions(child))
+    plan = optimize_meal_plan(foods, child, days=7)
+    used = [f for f in foods if f["food_id"] in planned_ids(plan)]
+    assert used
+    assert not [f["food_name_and_description"] for f in used if unsafe.search(f"{f['food_name_and_description']} {f['alternate_common_names']}".lower())]
+
+
+def test_plan_with_index_exclusions_matches_term_path(foods, names):
+    child = {"allergies": "fish", "age_months": 36}
+    index = ExclusionIndex()
+    index.build(foods)
+    excluded = index.for_patient(child, foods=foods)
+    fish = {"Catfish, grilled", "Milkfish, fried", "Tilapia, fried"}
+    assert fish <= names(excluded.food_ids)
+    with_index = optimize_meal_plan(foods, child, excluded=excluded)
+    assert not names(planned_ids(with_index)) & fish
+    assert planned_ids(with_index) == planned_ids(optimize_meal_plan(foods, child))
+
+
+def test_weekly_energy_near_target(foods):
+    child = {"allergies": "", "age_months": 36}
+    plan = optimize_meal_plan(foods, child)
+    target = daily_kcal_target(child)
+    average = sum(day.total_kcal for day in plan.days) / len(plan.days)
+    assert abs(average - target) / target < 0.15
+
+
+def test_infants_are_rejected(foods):
+    with pytest.raises(ValueError):
+        optimize_meal_plan(foods, {"age_months": 4})
@@ -0,0 +1,39 @@
+import json
+
+from meal_plan_schema import build_plan_data, normalize_plan_details, plan_details_json, plan_text
+
+PLAN = "Day 1:\nBreakfast: Lugaw with malunggay\nLunch: Tinolang manok with rice\n"
+
+
+def test_plain_text_plan_is_parsed_into_days():
+    plan_data = normalize_plan_details(PLAN)
+    assert plan_data["text"] == PLAN
+    assert plan_data["parsed_days"]["Day 1"]["breakfast"] == "Lugaw with malunggay"
+
+
+def test_build_plan_data_keeps_reports_next_to_the_text():
+    plan_data = build_plan_data(PLAN, nutrition={"days": []}, validation={"ok": True})
+    assert plan_data["text"] == PLAN
+    assert plan_data["nutrition"] == {"days": []}
+    assert plan_data["validation"] == {"ok": True}
+    assert json.loads(json.dumps(plan_data)) == plan_data
+
+
+def test_plan_details_keep_the_text_json_format():
+    details = plan_details_json(PLAN)
+    assert json.loads(details) == {"text": PLAN}
+    assert normalize_plan_details(details)["parsed_days"] == normalize_plan_details(PLAN)["parsed_days"]
+
+
+def test_plan_details_with_reports_are_read():
+    details = json.dumps({"text": PLAN, "validation": {"ok": False}})
+    plan_data = normalize_plan_details(details)
+    assert plan_data["text"] == PLAN
+    assert plan_data["validation"] == {"ok": False}
+
+
+def test_plan_text_prefers_decoded_plan_data():
+    assert plan_text({"plan_details": plan_details_json(PLAN), "plan_data": {"text": PLAN}}) == PLAN
+    assert plan_text({"plan_details": plan_details_json(PLAN)}) == PLAN
+    assert plan_text({"plan_details": PLAN}) == PLAN
+    assert plan_text({}) == ""
@@ -0,0 +1,76 @@
+import httpx
+import pytest
+
+from rate_limiter import CircuitOpenError, GroqRateLimiter
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+def limiter(**kwargs):
+    options = dict(requests_per_minute=0, tokens_per_minute=0, max_retries=4, base_delay=0, max_delay=0,
+                   failure_threshold=5, cooldown_seconds=60)
+    options.update(kwargs)
+    return GroqRateLimiter(**options)
+
+
+def failing(error):
+    def fn():
+        raise error
+    return fn
+
+
+def test_throttled_call_does_not_open_circuit():
+    groq = limiter()
+    with pytest.raises(StatusError):
+        groq.call(failing(StatusError(429, {"retry-after": "0"})))
+    stats = groq.stats()
+    assert stats["circuit"] == "closed"
+    assert stats["rate_limited"] == 4
+    assert groq.call(lambda: "ok") == "ok"
+
+
+def test_server_errors_open_circuit():
+    groq = limiter()
+    with pytest.raises(StatusError):
+        groq.call(failing(StatusError(503)))
+    assert groq.stats()["circuit"] == "open"
+    with pytest.raises(CircuitOpenError):
+        groq.call(lambda: "ok")
+
+
+def test_transport_errors_count_as_outage():
+    groq = limiter(max_retries=0, failure_threshold=2)
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            groq.call(failing(httpx.ConnectError("refused")))
+    assert groq.stats()["circuit"] == "open"
+
+
+def test_throttling_resets_outage_streak():
+    groq = limiter(max_retries=0, failure_threshold=2)
+    with pytest.raises(StatusError):
+        groq.call(failing(StatusError(502)))
+    with pytest.raises(StatusError):
+        groq.call(failing(StatusError(429)))
+    with pytest.raises(StatusError):
+        groq.call(failing(StatusError(502)))
+    assert groq.stats()["circuit"] == "closed"
+
+
+def test_client_errors_are_not_retried():
+    groq = limiter()
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        groq.call(bad_request)
+    assert len(calls) == 1
+    assert groq.stats()["circuit"] == "closed"